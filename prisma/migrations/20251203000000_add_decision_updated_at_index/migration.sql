@@ -0,0 +1,2 @@
+-- Support keyset pagination on ("updatedAt", id) for incremental training exports
+CREATE INDEX IF NOT EXISTS "Decision_agentType_updatedAt_id_idx" ON "Decision"("agentType", "updatedAt", "id");
@@ -0,0 +1,18 @@
+-- Notify the reward daemon (training/reward_daemon.py) when a decision needs its reward (re)computed
+-- Payload is "<agentType>:<id>". Only fires on the columns rewards depend on, so the daemon's own
+-- reward/rewardComputedAt writes do not re-trigger it.
+
+CREATE OR REPLACE FUNCTION "notify_decision_reward_pending"() RETURNS trigger AS $$
+BEGIN
+  PERFORM pg_notify('decision_reward_pending', NEW."agentType"::text || ':' || NEW."id");
+  RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS "Decision_reward_pending_notify" ON "Decision";
+
+CREATE TRIGGER "Decision_reward_pending_notify"
+  AFTER INSERT OR UPDATE OF "userFeedback", "feedbackAt", "outcomeMetrics", "outcomeObservedAt", "rewardComponents"
+  ON "Decision"
+  FOR EACH ROW
+  EXECUTE FUNCTION "notify_decision_reward_pending"();
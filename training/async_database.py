@@ -0,0 +1,193 @@
+"""
+Async counterpart of training.database for concurrent multi-agent pulls
+
+Uses SQLAlchemy's asyncio engine on asyncpg with its own connection pool,
+so several agent types can be fetched concurrently instead of blocking on
+network I/O one after another.
+
+    decisions_by_agent = load_training_decisions_for_agents(
+        ["FILER", "LIBRARIAN", "PRIORITIZER", "STORER", "RETRIEVER"],
+        concurrency=3,
+        max_samples=1000
+    )
+"""
+import shlex
+import asyncio
+from typing import AsyncIterator, Dict, List, Optional, Sequence, Tuple
+
+from training.database import (
+    DecisionRecord,
+    build_decision_query,
+    get_libpq_url,
+    project_columns,
+    row_to_decision,
+)
+
+def _async_engine_args() -> Tuple[str, Dict]:
+    """
+    DATABASE_URL rewritten for the asyncpg driver, plus its connect_args
+
+    SQLAlchemy hands URL query parameters to asyncpg.connect() as keyword
+    arguments, which are not libpq's. The libpq parameters are translated
+    instead: sslmode becomes ssl, connect_timeout becomes timeout, and
+    application_name and the ``-c`` settings in options (which carry
+    Prisma's schema) become server_settings. The rest have no asyncpg
+    counterpart and are dropped.
+    """
+    url = get_libpq_url()
+    query = url.query
+    connect_args: Dict = {}
+    server_settings: Dict[str, str] = {}
+
+    if "sslmode" in query:
+        sslmode = query["sslmode"]
+        connect_args["ssl"] = False if sslmode == "disable" else sslmode
+    if "connect_timeout" in query:
+        connect_args["timeout"] = float(query["connect_timeout"])
+    if "application_name" in query:
+        server_settings["application_name"] = query["application_name"]
+
+    tokens = iter(shlex.split(query.get("options", "")))
+    for token in tokens:
+        if token == "-c":
+            token = next(tokens, "")
+        elif token.startswith("-c"):
+            token = token[2:]
+        else:
+            continue
+        name, _, value = token.partition("=")
+        if name and value:
+            server_settings[name] = value
+
+    if server_settings:
+        connect_args["server_settings"] = server_settings
+
+    url = url.set(drivername="postgresql+asyncpg", query={})
+    return url.render_as_string(hide_password=False), connect_args
+
+class AsyncDecisionLoader:
+    """
+    Async loader owning one pooled asyncpg engine
+
+    Use as an async context manager so the pool is disposed on the loop
+    that created it:
+
+        async with AsyncDecisionLoader() as loader:
+            decisions = await loader.load_training_decisions("FILER")
+    """
+
+    def __init__(self, pool_size: int = 5, max_overflow: int = 5):
+        # Imported lazily so the sync pipeline works without asyncpg installed
+        from sqlalchemy.ext.asyncio import create_async_engine
+
+        database_url, connect_args = _async_engine_args()
+        self.engine = create_async_engine(
+            database_url,
+            connect_args=connect_args,
+            pool_pre_ping=True,
+            pool_size=pool_size,
+            max_overflow=max_overflow
+        )
+
+    async def __aenter__(self) -> "AsyncDecisionLoader":
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def close(self):
+        await self.engine.dispose()
+
+    async def iter_training_decisions(
+        self,
+        agent_type: str,
+        max_samples: Optional[int] = None,
+        require_reward: bool = True,
+        require_feedback: bool = False,
+        min_reward: float = -2.0,
+        is_training_data: bool = True,
+        fetch_size: int = 1000,
+        columns: Optional[Sequence[str]] = None
+    ) -> AsyncIterator[DecisionRecord]:
+        """Stream training decisions (see training.database.iter_training_decisions)"""
+        projection = project_columns(columns)
+        fields = [name for name, _ in projection]
+        query, params = build_decision_query(
+            agent_type, max_samples, require_reward, require_feedback, min_reward, is_training_data,
+            projection
+        )
+
+        async with self.engine.connect() as conn:
+            result = await conn.stream(query, params)
+            async for rows in result.partitions(fetch_size):
+                for row in rows:
+                    yield row_to_decision(row, fields)
+
+    async def load_training_decisions(
+        self,
+        agent_type: str,
+        max_samples: int = 1000,
+        require_reward: bool = True,
+        require_feedback: bool = False,
+        min_reward: float = -2.0,
+        is_training_data: bool = True,
+        columns: Optional[Sequence[str]] = None
+    ) -> List[DecisionRecord]:
+        """Load training decisions (see training.database.load_training_decisions)"""
+        projection = project_columns(columns)
+        fields = [name for name, _ in projection]
+        query, params = build_decision_query(
+            agent_type, max_samples, require_reward, require_feedback, min_reward, is_training_data,
+            projection
+        )
+
+        async with self.engine.connect() as conn:
+            result = await conn.execute(query, params)
+            rows = result.fetchall()
+
+        return [row_to_decision(row, fields) for row in rows]
+
+    async def load_many(
+        self,
+        agent_types: Sequence[str],
+        concurrency: int = 3,
+        **filters
+    ) -> Dict[str, List[DecisionRecord]]:
+        """
+        Load several agent types concurrently
+
+        Args:
+            agent_types: Agent types to load
+            concurrency: Maximum number of queries in flight at once
+            **filters: Passed to load_training_decisions for every agent
+
+        Returns:
+            Dict of agent type -> decisions, in the order requested
+        """
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def load_one(agent_type: str) -> List[DecisionRecord]:
+            async with semaphore:
+                return await self.load_training_decisions(agent_type, **filters)
+
+        results = await asyncio.gather(*(load_one(agent_type) for agent_type in agent_types))
+        return dict(zip(agent_types, results))
+
+def load_training_decisions_for_agents(
+    agent_types: Sequence[str],
+    concurrency: int = 3,
+    pool_size: Optional[int] = None,
+    **filters
+) -> Dict[str, List[DecisionRecord]]:
+    """
+    Synchronous entry point: fetch several agent types concurrently
+
+    A full refresh takes about as long as the slowest agent rather than
+    the sum of all of them. The pool is sized to ``concurrency`` unless
+    ``pool_size`` is given.
+    """
+    async def run():
+        async with AsyncDecisionLoader(pool_size=pool_size or concurrency, max_overflow=0) as loader:
+            return await loader.load_many(agent_types, concurrency=concurrency, **filters)
+
+    return asyncio.run(run())
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Benchmark Decision export backends against a Postgres database
+
+Compares load_training_decisions (fetchall), the server-side cursor stream
+and the COPY stream on the same filtered projection. Every backend decodes
+state and action, as an export does, since DecisionRecord only decodes
+JSON columns when they are read.
+
+Usage:
+    DATABASE_URL=postgresql://localhost/os python benchmark_export.py --agent-type FILER --limit 100000
+"""
+import argparse
+import time
+import tracemalloc
+from dotenv import load_dotenv
+
+from training.database import (
+    copy_training_decisions,
+    iter_training_decisions,
+    load_training_decisions,
+)
+
+load_dotenv()
+
+def _decode_all(decisions) -> int:
+    """Count decisions, decoding state and action like build_training_example"""
+    count = 0
+    for decision in decisions:
+        decision.state, decision.action
+        count += 1
+    return count
+
+def run_backend(name: str, agent_type: str, limit: int, min_reward: float, fetch_size: int, track_memory: bool):
+    """Consume one backend fully and return (rows, seconds, peak_bytes)"""
+    if name == "fetchall":
+        def consume():
+            return _decode_all(load_training_decisions(agent_type, max_samples=limit, min_reward=min_reward))
+    elif name == "cursor":
+        def consume():
+            return _decode_all(iter_training_decisions(agent_type, max_samples=limit, min_reward=min_reward, fetch_size=fetch_size))
+    else:
+        def consume():
+            return _decode_all(copy_training_decisions(agent_type, max_samples=limit, min_reward=min_reward))
+    
+    if track_memory:
+        tracemalloc.start()
+    started = time.perf_counter()
+    rows = consume()
+    elapsed = time.perf_counter() - started
+    peak = None
+    if track_memory:
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    
+    return rows, elapsed, peak
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Decision export backends")
+    parser.add_argument("--agent-type", default="FILER", help="Agent type")
+    parser.add_argument("--limit", type=int, default=100000, help="Maximum number of decisions")
+    parser.add_argument("--min-reward", type=float, default=-5.0, help="Minimum reward threshold")
+    parser.add_argument("--fetch-size", type=int, default=1000, help="Server-side cursor fetch size")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per backend (best time is reported)")
+    parser.add_argument("--backends", nargs="+", default=["fetchall", "cursor", "copy"], choices=["fetchall", "cursor", "copy"])
+    parser.add_argument("--memory", action="store_true", help="Track peak Python memory (slows every backend)")
+    
+    args = parser.parse_args()
+    
+    print(f"⏱️  Benchmarking {args.agent_type} export (limit {args.limit}, best of {args.repeat})")
+    for name in args.backends:
+        best = None
+        for _ in range(args.repeat):
+            rows, elapsed, peak = run_backend(
+                name, args.agent_type, args.limit, args.min_reward, args.fetch_size, args.memory
+            )
+            if best is None or elapsed < best[1]:
+                best = (rows, elapsed, peak)
+        
+        rows, elapsed, peak = best
+        rate = rows / elapsed if elapsed > 0 else 0.0
+        line = f"   {name:<9} {rows:>9} rows  {elapsed:8.3f}s  {rate:>10.0f} rows/s"
+        if peak is not None:
+            line += f"  peak {peak / 1024 / 1024:.1f} MiB"
+        print(line)
+
+if __name__ == "__main__":
+    main()
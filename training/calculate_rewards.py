@@ -6,64 +6,272 @@ This script calls the reward calculation API or calculates rewards directly
 """
 import os
 import sys
+import time
+import random
 import requests
-from typing import List
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from itertools import islice
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from requests.adapters import HTTPAdapter
 from dotenv import load_dotenv
+from sqlalchemy import text
 
-from training.database import load_training_decisions, DecisionRecord
-from training.reward_calculator import calculate_reward_from_record
+from training.database import (
+    STALE_REWARD_CONDITION,
+    DecisionRecord,
+    get_database_connection,
+    iter_stale_reward_decisions,
+    iter_training_decisions,
+    print_pool_stats,
+    project_columns,
+    row_to_decision,
+    select_list,
+    write_rewards,
+)
+from training.reward_calculator import calculate_rewards_for_records, reward_sql_expression
 
 load_dotenv()
 
-def calculate_rewards_via_api(decision_ids: List[str], api_url: str = "http://localhost:3000"):
-    """Calculate rewards via API endpoint"""
+# Only the columns calculate_reward_from_record reads
+REWARD_COLUMNS = ["reward", "reward_components", "user_feedback"]
+
+# Responses worth retrying; anything else (400, 401, ...) fails the chunk at once
+RETRY_STATUSES = {408, 429, 500, 502, 503, 504}
+
+def _api_session(pool_size: int) -> requests.Session:
+    """Keep-alive session with a connection pool sized for the worker threads"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.headers["Content-Type"] = "application/json"
+    return session
+
+def _post_chunk(
+    session: requests.Session,
+    url: str,
+    decision_ids: List[str],
+    timeout: float,
+    max_retries: int,
+    backoff: float
+) -> Tuple[Optional[Dict], Optional[str]]:
+    """POST one chunk, retrying transient failures with exponential backoff
+    
+    Returns:
+        (response JSON, None) on success or (None, error message)
+    """
+    error = None
+    for attempt in range(max_retries + 1):
+        if attempt:
+            time.sleep(backoff * 2 ** (attempt - 1) * (1 + random.random()))
+        
+        try:
+            response = session.post(url, json={"decisionIds": decision_ids}, timeout=timeout)
+        except (requests.ConnectionError, requests.Timeout) as exc:
+            error = str(exc)
+            continue
+        
+        if response.status_code == 200:
+            return response.json(), None
+        
+        error = f"{response.status_code} - {response.text[:200]}"
+        if response.status_code not in RETRY_STATUSES:
+            break
+    
+    return None, error
+
+def load_checkpoint(path: Optional[str]) -> Set[str]:
+    """Decision ids already processed according to a checkpoint file"""
+    if not path or not os.path.exists(path):
+        return set()
+    with open(path) as f:
+        return {line.strip() for line in f if line.strip()}
+
+def calculate_rewards_via_api(
+    decision_ids: List[str],
+    api_url: str = "http://localhost:3000",
+    chunk_size: int = 500,
+    concurrency: int = 4,
+    max_retries: int = 3,
+    backoff: float = 1.0,
+    timeout: float = 60.0,
+    checkpoint_path: Optional[str] = None
+) -> Dict:
+    """Calculate rewards via API endpoint
+    
+    Ids are sent in chunks of ``chunk_size`` over a pooled keep-alive
+    session, with at most ``concurrency`` requests in flight. Transient
+    failures (timeouts, connection errors, 408/429/5xx) are retried with
+    exponential backoff. With ``checkpoint_path``, the ids of every
+    successful chunk are appended to that file and skipped on the next
+    run, so an interrupted backfill resumes where it stopped; the file is
+    removed once every chunk has succeeded.
+    
+    Returns:
+        Dict with updated decisions, chunks sent, failed chunks and ids
+        skipped thanks to the checkpoint
+    """
     url = f"{api_url}/api/training/decisions"
     
-    response = requests.post(
-        url,
-        json={"decisionIds": decision_ids},
-        headers={"Content-Type": "application/json"}
-    )
+    done = load_checkpoint(checkpoint_path)
+    remaining = [decision_id for decision_id in decision_ids if decision_id not in done]
+    chunks = [remaining[i:i + chunk_size] for i in range(0, len(remaining), chunk_size)]
+    summary = {"updated": 0, "chunks": len(chunks), "failed_chunks": 0, "skipped": len(decision_ids) - len(remaining)}
+    if not chunks:
+        if checkpoint_path and os.path.exists(checkpoint_path):
+            os.remove(checkpoint_path)
+        return summary
+    
+    session = _api_session(concurrency)
+    checkpoint = open(checkpoint_path, 'a') if checkpoint_path else None
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            futures = {
+                executor.submit(_post_chunk, session, url, chunk, timeout, max_retries, backoff): chunk
+                for chunk in chunks
+            }
+            for future in as_completed(futures):
+                chunk = futures[future]
+                result, error = future.result()
+                if result is None:
+                    summary["failed_chunks"] += 1
+                    print(f"❌ API error for {len(chunk)} decisions: {error}")
+                    continue
+                
+                summary["updated"] += result.get("updated", 0)
+                if checkpoint:
+                    checkpoint.write("".join(f"{decision_id}\n" for decision_id in chunk))
+                    checkpoint.flush()
+    finally:
+        session.close()
+        if checkpoint:
+            checkpoint.close()
+    
+    if checkpoint_path and summary["failed_chunks"] == 0:
+        os.remove(checkpoint_path)
+    
+    print(f"✅ Calculated rewards for {summary['updated']} decisions "
+          f"({summary['chunks'] - summary['failed_chunks']}/{summary['chunks']} chunks)")
+    return summary
+
+def calculate_rewards_directly(decisions: Iterable[DecisionRecord], batch_size: int = 1000, recompute: bool = False):
+    """Calculate rewards directly (for testing)
+    
+    Accepts any iterable, so a streamed decision generator is consumed lazily.
+    Rewards are written back in batches of ``batch_size``, one commit each,
+    and each batch is scored in one vectorized pass of the reward engine.
+    Decisions that already have a reward are skipped unless ``recompute``.
+    """
+    def pending_rewards():
+        pending = (decision for decision in decisions if decision.reward is None or recompute)
+        while True:
+            chunk = list(islice(pending, batch_size))
+            if not chunk:
+                return
+            rewards = calculate_rewards_for_records(chunk, recompute=recompute)
+            yield from zip((decision.id for decision in chunk), rewards)
+    
+    result = write_rewards(pending_rewards(), batch_size=batch_size)
+    if result["updated"]:
+        print(f"   Wrote {result['updated']} rewards in {result['batches']} batches "
+              f"({result['seconds']:.2f}s, {result['rows_per_sec']:.0f} rows/s)")
     
-    if response.status_code == 200:
-        result = response.json()
-        print(f"✅ Calculated rewards for {result.get('updated', 0)} decisions")
-        return result
+    return result["updated"]
+
+def calculate_rewards_in_database(
+    agent_type: str,
+    recompute: bool = False,
+    stale_only: bool = False,
+    is_training_data: bool = True
+) -> int:
+    """
+    Compute rewards inside Postgres with one set-based UPDATE
+    
+    The weighted sum is generated from REWARD_WEIGHTS by
+    reward_sql_expression, so no rows are pulled into Python. Like
+    write_rewards, the UPDATE bumps "updatedAt" so incremental exports and
+    cache syncs see the new rewards.
+    
+    Args:
+        agent_type: Agent type to update
+        recompute: Also overwrite rewards that are already set (backfill
+            after changing the weights)
+        stale_only: Only update decisions matching STALE_REWARD_CONDITION
+            (takes precedence over ``recompute``)
+        is_training_data: Only update decisions with this isTrainingData
+            flag, as the Python path does
+    
+    Returns:
+        Number of decisions updated
+    """
+    if stale_only:
+        condition = f"AND {STALE_REWARD_CONDITION}"
+    elif recompute:
+        condition = ""
     else:
-        print(f"❌ API error: {response.status_code} - {response.text}")
-        return None
+        condition = "AND d.reward IS NULL"
+    query = text(f"""
+        UPDATE "Decision" AS d
+        SET reward = {reward_sql_expression(agent_type)},
+            "rewardComputedAt" = NOW(),
+            "updatedAt" = NOW()
+        WHERE d."agentType" = :agent_type
+            AND d."isTrainingData" = :is_training_data {condition}
+    """)
+    
+    engine = get_database_connection()
+    with engine.begin() as conn:
+        return conn.execute(query, {"agent_type": agent_type, "is_training_data": is_training_data}).rowcount
 
-def calculate_rewards_directly(decisions: List[DecisionRecord]):
-    """Calculate rewards directly (for testing)"""
-    from training.database import get_database_connection
-    from sqlalchemy import text
+def check_reward_parity(agent_type: str, sample_size: int = 1000, tolerance: float = 1e-9) -> Dict:
+    """
+    Compare the SQL reward expression with the Python implementation
+    
+    Evaluates both on a random sample of decisions (stored rewards are
+    ignored) without writing anything.
+    
+    Returns:
+        Dict with checked count, mismatch count, max absolute difference
+        and up to 10 example mismatches
+    """
+    projection = project_columns(REWARD_COLUMNS)
+    fields = [name for name, _ in projection]
+    query = text(f"""
+        SELECT
+            {select_list(projection)},
+            {reward_sql_expression(agent_type)} as sql_reward
+        FROM "Decision" d
+        WHERE d."agentType" = :agent_type
+        ORDER BY random()
+        LIMIT :sample_size
+    """)
     
     engine = get_database_connection()
-    updated = 0
+    with engine.connect() as conn:
+        rows = conn.execute(query, {"agent_type": agent_type, "sample_size": sample_size}).fetchall()
     
-    for decision in decisions:
-        if decision.reward is not None:
-            continue  # Already has reward
-        
-        # Calculate reward
-        reward = calculate_reward_from_record(decision)
-        
-        # Update database
-        with engine.connect() as conn:
-            conn.execute(
-                text("""
-                    UPDATE "Decision"
-                    SET reward = :reward,
-                        "rewardComputedAt" = NOW()
-                    WHERE id = :id
-                """),
-                {"id": decision.id, "reward": reward}
-            )
-            conn.commit()
-        
-        updated += 1
+    records = []
+    sql_rewards = []
+    for row in rows:
+        record = row_to_decision(row[:-1], fields)
+        record.reward = None  # Score from components/feedback like the UPDATE does
+        records.append(record)
+        sql_rewards.append(float(row[-1]))
+    
+    mismatches = []
+    max_diff = 0.0
+    for record, sql_reward, python_reward in zip(records, sql_rewards, calculate_rewards_for_records(records)):
+        diff = abs(sql_reward - python_reward)
+        max_diff = max(max_diff, diff)
+        if diff > tolerance:
+            mismatches.append({"id": record.id, "sql": sql_reward, "python": python_reward})
     
-    return updated
+    return {
+        "checked": len(records),
+        "mismatches": len(mismatches),
+        "max_diff": max_diff,
+        "examples": mismatches[:10]
+    }
 
 def main():
     import argparse
@@ -73,36 +281,102 @@ def main():
     parser.add_argument("--max-samples", type=int, default=1000, help="Max samples to process")
     parser.add_argument("--use-api", action="store_true", help="Use API endpoint")
     parser.add_argument("--api-url", default="http://localhost:3000", help="API URL")
+    parser.add_argument("--api-chunk-size", type=int, default=500, help="Decision ids per API request")
+    parser.add_argument("--api-concurrency", type=int, default=4, help="API requests in flight at once")
+    parser.add_argument("--api-retries", type=int, default=3, help="Retries per chunk on timeouts, connection errors, 429 and 5xx")
+    parser.add_argument("--api-timeout", type=float, default=60.0, help="Seconds before an API request times out")
+    parser.add_argument("--checkpoint", help="File recording completed ids so an interrupted --use-api run can resume")
+    parser.add_argument("--fetch-size", type=int, default=1000, help="Rows fetched per server-side cursor round trip")
+    parser.add_argument("--batch-size", type=int, default=1000, help="Rewards written per UPDATE and commit")
+    parser.add_argument("--sql-pushdown", action="store_true", help="Compute rewards inside Postgres in a single UPDATE")
+    parser.add_argument("--recompute", action="store_true", help="With --sql-pushdown, also overwrite existing rewards")
+    parser.add_argument("--check-parity", action="store_true", help="Compare SQL and Python rewards on a sample and exit")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Page through every decision with a missing reward or feedback/outcomes newer than rewardComputedAt (ignores --max-samples)")
     
     args = parser.parse_args()
     
-    print(f"📊 Loading decisions for {args.agent_type}...")
-    decisions = load_training_decisions(
-        agent_type=args.agent_type,
-        max_samples=args.max_samples,
-        require_reward=False  # Get all decisions
-    )
+    if args.check_parity:
+        print(f"🔍 Checking SQL/Python reward parity for {args.agent_type}...")
+        result = check_reward_parity(args.agent_type, sample_size=args.max_samples)
+        print(f"   Checked: {result['checked']}")
+        print(f"   Max difference: {result['max_diff']:.3g}")
+        if result["mismatches"]:
+            print(f"❌ {result['mismatches']} mismatches, e.g.:")
+            for example in result["examples"]:
+                print(f"   {example['id']}: sql={example['sql']} python={example['python']}")
+            sys.exit(1)
+        print("✅ SQL and Python rewards match")
+        return
     
-    # Filter to only those without rewards
-    decisions_without_rewards = [d for d in decisions if d.reward is None]
+    if args.sql_pushdown:
+        print(f"🗄️  Calculating rewards in the database for {args.agent_type}...")
+        updated = calculate_rewards_in_database(args.agent_type, recompute=args.recompute, stale_only=args.incremental)
+        print(f"✅ Updated {updated} decisions")
+        return
+    
+    if args.incremental:
+        print(f"📊 Paging through missing and stale rewards for {args.agent_type}...")
+        decisions = iter_stale_reward_decisions(
+            agent_type=args.agent_type,
+            columns=REWARD_COLUMNS,
+            page_size=args.fetch_size,
+            is_training_data=True  # Same rows as the default path and --sql-pushdown
+        )
+    else:
+        print(f"📊 Streaming decisions for {args.agent_type}...")
+        decisions = iter_training_decisions(
+            agent_type=args.agent_type,
+            max_samples=args.max_samples,
+            require_reward=False,  # Get all decisions
+            fetch_size=args.fetch_size,
+            columns=REWARD_COLUMNS
+        )
     
-    print(f"   Total decisions: {len(decisions)}")
-    print(f"   Without rewards: {len(decisions_without_rewards)}")
+    # Count while streaming, keeping only those without rewards (every
+    # decision in incremental mode needs its reward recomputed)
+    counts = {"total": 0, "without_rewards": 0}
     
-    if len(decisions_without_rewards) == 0:
-        print("✅ All decisions already have rewards!")
-        return
+    def without_rewards():
+        for decision in decisions:
+            counts["total"] += 1
+            if decision.reward is None or args.incremental:
+                counts["without_rewards"] += 1
+                yield decision
     
     if args.use_api:
         print(f"🌐 Calculating rewards via API...")
-        decision_ids = [d.id for d in decisions_without_rewards]
-        result = calculate_rewards_via_api(decision_ids, args.api_url)
-        if result:
-            print(f"✅ Updated {result.get('updated', 0)} decisions")
+        decision_ids = [d.id for d in without_rewards()]
+        print(f"   Total decisions: {counts['total']}")
+        print(f"   Without rewards: {counts['without_rewards']}")
+        if len(decision_ids) == 0:
+            print("✅ All decisions already have rewards!")
+            return
+        result = calculate_rewards_via_api(
+            decision_ids,
+            args.api_url,
+            chunk_size=args.api_chunk_size,
+            concurrency=args.api_concurrency,
+            max_retries=args.api_retries,
+            timeout=args.api_timeout,
+            checkpoint_path=args.checkpoint
+        )
+        if result["skipped"]:
+            print(f"   Skipped {result['skipped']} decisions already done per {args.checkpoint}")
+        print(f"✅ Updated {result['updated']} decisions")
+        if result["failed_chunks"]:
+            print(f"❌ {result['failed_chunks']} chunks failed; re-run with the same --checkpoint to retry them")
+            sys.exit(1)
     else:
         print(f"🔢 Calculating rewards directly...")
-        updated = calculate_rewards_directly(decisions_without_rewards)
+        updated = calculate_rewards_directly(without_rewards(), batch_size=args.batch_size, recompute=args.incremental)
+        print(f"   Total decisions: {counts['total']}")
+        print(f"   Without rewards: {counts['without_rewards']}")
+        if updated == 0:
+            print("✅ All decisions already have rewards!")
+            return
         print(f"✅ Updated {updated} decisions")
+        print_pool_stats()
 
 if __name__ == "__main__":
     main()
@@ -2,35 +2,363 @@
 Database utilities for loading training data from Decision table
 """
 import os
+import copy
 import json
-from typing import List, Dict, Optional
+import time
+import queue
+import atexit
+import heapq
+import itertools
+import threading
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
 from dataclasses import dataclass
 import psycopg2
 from psycopg2.extras import RealDictCursor
 from sqlalchemy import create_engine, text
-from sqlalchemy.engine import Engine
+from sqlalchemy.engine import URL, Engine, make_url
+from sqlalchemy.dialects.postgresql import psycopg2 as psycopg2_dialect
+from sqlalchemy.pool import QueuePool
+
+# orjson is optional; it decodes large JSONB payloads several times faster
+try:
+    import orjson
+    
+    def json_loads(value):
+        return orjson.loads(value)
+except ImportError:
+    def json_loads(value):
+        return json.loads(value)
+
+class _RawJSON:
+    """Undecoded JSON text of a column, as read from the database"""
+    __slots__ = ("payload",)
+    
+    def __init__(self, payload: str):
+        self.payload = payload
+
+def _raw_json(value):
+    """Mark a JSON column selected as text as still undecoded"""
+    return _RawJSON(value) if isinstance(value, str) else value
+
+class _LazyJSON:
+    """
+    Dataclass field that keeps a JSON column as raw text until first access
+    
+    Assigning bytes or a _RawJSON stores the raw payload; reading the
+    attribute decodes it once and caches the result. Any other value
+    (dict, list, str, None) is an already decoded value and stored as is,
+    so a JSON string survives dataclasses.replace() and reassignment.
+    """
+    
+    def __init__(self, empty_factory=None):
+        # Value used for NULL/empty payloads (e.g. dict for state/action)
+        self.empty_factory = empty_factory
+    
+    def __set_name__(self, owner, name):
+        self.name = name
+        self.raw_name = f"_{name}_raw"
+    
+    def __get__(self, obj, objtype=None):
+        if obj is None:
+            # No class-level default, so dataclass treats the field as required
+            raise AttributeError(self.name)
+        
+        values = obj.__dict__
+        if self.raw_name in values:
+            raw = values.pop(self.raw_name)
+            values[self.name] = self._empty_or(json_loads(raw) if raw else None)
+        return values.get(self.name)
+    
+    def __set__(self, obj, value):
+        values = obj.__dict__
+        if isinstance(value, _RawJSON):
+            value = value.payload
+        elif not isinstance(value, (bytes, bytearray, memoryview)):
+            values.pop(self.raw_name, None)
+            values[self.name] = self._empty_or(value)
+            return
+        values[self.raw_name] = value
+        values.pop(self.name, None)
+    
+    def _empty_or(self, value):
+        if self.empty_factory is not None and not value:
+            return self.empty_factory()
+        return value
 
 @dataclass
 class DecisionRecord:
-    """Decision record from database"""
+    """Decision record from database
+    
+    JSON columns (state, action, reward_components, user_correction,
+    outcome_metrics) are decoded lazily on first access.
+    """
     id: str
     agent_type: str
-    state: dict
-    action: dict
+    state: dict = _LazyJSON(dict)
+    action: dict = _LazyJSON(dict)
     reward: Optional[float]
-    reward_components: Optional[dict]
+    reward_components: Optional[dict] = _LazyJSON()
     confidence: Optional[float]
     reasoning: Optional[str]
     user_feedback: Optional[str]
-    user_correction: Optional[dict]
-    outcome_metrics: Optional[dict]
+    user_correction: Optional[dict] = _LazyJSON()
+    outcome_metrics: Optional[dict] = _LazyJSON()
     item_id: Optional[str]
     opus_id: Optional[str]
     model_version: str
     created_at: str
+    updated_at: Optional[str] = None
+
+def raw_json_payload(record: DecisionRecord, name: str):
+    """Undecoded JSON text of a lazily decoded field (None once it has been decoded)"""
+    return record.__dict__.get(f"_{name}_raw")
+
+# Enum values from prisma/schema.prisma, used as categorical codes
+AGENT_TYPES = ["FILER", "LIBRARIAN", "PRIORITIZER", "STORER", "RETRIEVER", "GUARDRAIL"]
+FEEDBACK_VALUES = [None, "CONFIRMED", "CORRECTED", "IGNORED", "OVERRIDDEN"]
+
+_EPOCH = datetime(1970, 1, 1)
+_NULL_TIMESTAMP = -(2 ** 63)
+
+def _to_micros(value) -> int:
+    """Timestamp (datetime or ISO string, naive UTC) to microseconds since epoch"""
+    if value is None:
+        return _NULL_TIMESTAMP
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return (value - _EPOCH) // timedelta(microseconds=1)
+
+def _from_micros(value: int) -> Optional[str]:
+    """Inverse of _to_micros, rendered as ISO 8601"""
+    if value == _NULL_TIMESTAMP:
+        return None
+    return (_EPOCH + timedelta(microseconds=value)).isoformat()
+
+class _VarColumn:
+    """Variable-length column: one byte buffer plus Arrow-style offsets"""
+    __slots__ = ("data", "offsets", "valid")
+    
+    def __init__(self):
+        self.data = bytearray()
+        self.offsets = array("q", [0])
+        self.valid = bytearray()
+    
+    def append(self, value: Optional[bytes]):
+        if value is None:
+            self.valid.append(0)
+        else:
+            self.valid.append(1)
+            self.data += value
+        self.offsets.append(len(self.data))
+    
+    def get(self, index: int) -> Optional[bytes]:
+        if not self.valid[index]:
+            return None
+        return bytes(self.data[self.offsets[index]:self.offsets[index + 1]])
+    
+    def extend(self, other: "_VarColumn"):
+        base = len(self.data)
+        self.data += other.data
+        self.offsets.extend(base + offset for offset in other.offsets[1:])
+        self.valid += other.valid
+    
+    @property
+    def nbytes(self) -> int:
+        return len(self.data) + len(self.valid) + self.offsets.itemsize * len(self.offsets)
+
+class DecisionBatch:
+    """
+    Columnar container for many decisions
+    
+    Scalars live in typed arrays (reward/confidence as float64 with NaN
+    for NULL, timestamps as int64 microseconds, agent_type/user_feedback as
+    uint8 codes into AGENT_TYPES/FEEDBACK_VALUES) and strings and JSON
+    payloads as raw UTF-8 bytes in one buffer per column, addressed by
+    offsets. Nothing is decoded until a row is read, and indexing returns
+    an ordinary DecisionRecord, so existing code keeps working.
+    
+    Scalar columns are exposed as arrays (``batch.reward``) and, with
+    NumPy installed, as zero-copy ndarrays via ``batch.to_numpy(name)``.
+    """
+    
+    SCALAR_COLUMNS = {
+        "reward": "d",
+        "confidence": "d",
+        "created_at": "q",
+        "updated_at": "q",
+        "agent_type": "B",
+        "user_feedback": "B",
+    }
+    STRING_COLUMNS = ("id", "reasoning", "item_id", "opus_id", "model_version")
+    JSON_COLUMNS = ("state", "action", "reward_components", "user_correction", "outcome_metrics")
+    
+    __slots__ = (
+        "reward", "confidence", "created_at", "updated_at", "agent_type", "user_feedback",
+        "agent_types", "feedback_values", "_strings", "_json",
+    )
+    
+    def __init__(self):
+        for name, typecode in self.SCALAR_COLUMNS.items():
+            setattr(self, name, array(typecode))
+        self.agent_types = list(AGENT_TYPES)
+        self.feedback_values = list(FEEDBACK_VALUES)
+        self._strings = {name: _VarColumn() for name in self.STRING_COLUMNS}
+        self._json = {name: _VarColumn() for name in self.JSON_COLUMNS}
+    
+    @classmethod
+    def from_records(cls, records: Iterable[DecisionRecord]) -> "DecisionBatch":
+        """Build a batch from DecisionRecords without decoding their JSON"""
+        batch = cls()
+        for record in records:
+            batch.append(record)
+        return batch
+    
+    def append(self, record: DecisionRecord):
+        """Append a DecisionRecord, reusing its raw JSON payload if still undecoded"""
+        values = {name: getattr(record, name) for name in DECISION_FIELDS if name not in self.JSON_COLUMNS}
+        for name in self.JSON_COLUMNS:
+            raw = record.__dict__.get(f"_{name}_raw")
+            if raw is None:
+                # Decoded values are re-encoded here: a JSON string would
+                # otherwise be taken for raw text by append_values
+                value = record.__dict__.get(name)
+                raw = None if value is None else json.dumps(value).encode("utf-8")
+            values[name] = raw
+        self.append_values(values)
+    
+    def append_values(self, values: Dict):
+        """Append one row given as {field: value} (raw JSON text, dicts or None)"""
+        for name in ("reward", "confidence"):
+            value = values.get(name)
+            getattr(self, name).append(float("nan") if value is None else float(value))
+        for name in ("created_at", "updated_at"):
+            getattr(self, name).append(_to_micros(values.get(name)))
+        
+        self.agent_type.append(self._code(self.agent_types, values.get("agent_type")))
+        self.user_feedback.append(self._code(self.feedback_values, values.get("user_feedback")))
+        
+        for name in self.STRING_COLUMNS:
+            value = values.get(name)
+            self._strings[name].append(None if value is None else value.encode("utf-8"))
+        for name in self.JSON_COLUMNS:
+            value = values.get(name)
+            if value is None or isinstance(value, (bytes, bytearray)):
+                payload = value or None
+            elif isinstance(value, str):
+                payload = value.encode("utf-8") or None
+            else:
+                payload = json.dumps(value).encode("utf-8")
+            self._json[name].append(payload)
+    
+    @staticmethod
+    def _code(categories: List, value) -> int:
+        try:
+            return categories.index(value)
+        except ValueError:
+            categories.append(value)
+            return len(categories) - 1
+    
+    def extend(self, other: "DecisionBatch"):
+        """Append every row of another batch"""
+        for name in ("reward", "confidence", "created_at", "updated_at"):
+            getattr(self, name).extend(getattr(other, name))
+        for name, categories, other_categories in (
+            ("agent_type", self.agent_types, other.agent_types),
+            ("user_feedback", self.feedback_values, other.feedback_values),
+        ):
+            remap = [self._code(categories, value) for value in other_categories]
+            getattr(self, name).extend(remap[code] for code in getattr(other, name))
+        for name in self.STRING_COLUMNS:
+            self._strings[name].extend(other._strings[name])
+        for name in self.JSON_COLUMNS:
+            self._json[name].extend(other._json[name])
+    
+    def __len__(self) -> int:
+        return len(self.reward)
+    
+    def __getitem__(self, index: int) -> DecisionRecord:
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("DecisionBatch index out of range")
+        
+        strings = {name: column.get(index) for name, column in self._strings.items()}
+        reward = self.reward[index]
+        confidence = self.confidence[index]
+        return DecisionRecord(
+            id=strings["id"].decode("utf-8"),
+            agent_type=self.agent_types[self.agent_type[index]],
+            state=self._json["state"].get(index),
+            action=self._json["action"].get(index),
+            reward=None if reward != reward else reward,
+            reward_components=self._json["reward_components"].get(index),
+            confidence=None if confidence != confidence else confidence,
+            reasoning=strings["reasoning"].decode("utf-8") if strings["reasoning"] is not None else None,
+            user_feedback=self.feedback_values[self.user_feedback[index]],
+            user_correction=self._json["user_correction"].get(index),
+            outcome_metrics=self._json["outcome_metrics"].get(index),
+            item_id=strings["item_id"].decode("utf-8") if strings["item_id"] is not None else None,
+            opus_id=strings["opus_id"].decode("utf-8") if strings["opus_id"] is not None else None,
+            model_version=strings["model_version"].decode("utf-8") if strings["model_version"] is not None else None,
+            created_at=_from_micros(self.created_at[index]),
+            updated_at=_from_micros(self.updated_at[index])
+        )
+    
+    def __iter__(self) -> Iterator[DecisionRecord]:
+        for index in range(len(self)):
+            yield self[index]
+    
+    def ids(self) -> List[str]:
+        """All decision ids, without building row views"""
+        column = self._strings["id"]
+        return [column.get(index).decode("utf-8") for index in range(len(self))]
+    
+    def to_numpy(self, name: str):
+        """Zero-copy NumPy view of a scalar column (the batch must not grow while it is alive)"""
+        import numpy as np
+        
+        if name not in self.SCALAR_COLUMNS:
+            raise ValueError(f"Not a scalar column: {name}")
+        dtypes = {"d": np.float64, "q": np.int64, "B": np.uint8}
+        return np.frombuffer(getattr(self, name), dtype=dtypes[self.SCALAR_COLUMNS[name]])
+    
+    @property
+    def nbytes(self) -> int:
+        """Approximate memory held by the batch's buffers"""
+        scalars = sum(column.itemsize * len(column) for column in (getattr(self, name) for name in self.SCALAR_COLUMNS))
+        return scalars + sum(column.nbytes for column in (*self._strings.values(), *self._json.values()))
+
+class _TimedQueuePool(QueuePool):
+    """QueuePool that records how long checkouts wait for a connection"""
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.checkouts = 0
+        self.wait_time_total = 0.0
+        self.wait_time_max = 0.0
+    
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            waited = time.perf_counter() - started
+            self.checkouts += 1
+            self.wait_time_total += waited
+            self.wait_time_max = max(self.wait_time_max, waited)
+
+# Process-wide engines keyed by (url, pool_size, max_overflow, pool_pre_ping)
+_ENGINES: Dict[Tuple, Engine] = {}
+_ENGINES_LOCK = threading.Lock()
+_ENGINES_PID = os.getpid()
 
-def get_database_connection() -> Engine:
-    """Create database connection"""
+def get_database_url() -> str:
+    """Read DATABASE_URL and normalize it for SQLAlchemy"""
     database_url = os.getenv("DATABASE_URL")
     if not database_url:
         raise ValueError("DATABASE_URL environment variable not set")
@@ -39,13 +367,783 @@ def get_database_connection() -> Engine:
     if database_url.startswith("postgres://"):
         database_url = database_url.replace("postgres://", "postgresql://", 1)
     
-    # Add connection pool settings for better performance
-    return create_engine(
-        database_url,
-        pool_pre_ping=True,
-        pool_size=5,
-        max_overflow=10
+    return database_url
+
+# Connection keywords libpq accepts. DATABASE_URL is shared with Prisma,
+# whose own parameters (schema, pgbouncer, connection_limit, ...) make
+# psycopg2.connect fail with "invalid connection option".
+LIBPQ_PARAMS = {
+    "host", "hostaddr", "port", "dbname", "user", "password", "passfile",
+    "require_auth", "channel_binding", "connect_timeout", "client_encoding",
+    "options", "application_name", "fallback_application_name",
+    "keepalives", "keepalives_idle", "keepalives_interval", "keepalives_count",
+    "tcp_user_timeout", "replication", "gssencmode", "sslmode", "requiressl",
+    "sslcompression", "sslcert", "sslkey", "sslpassword", "sslcertmode",
+    "sslrootcert", "sslcrl", "sslcrldir", "sslsni", "requirepeer",
+    "ssl_min_protocol_version", "ssl_max_protocol_version", "krbsrvname",
+    "gsslib", "gssdelegation", "service", "target_session_attrs", "load_balance_hosts",
+}
+
+def get_libpq_url() -> URL:
+    """DATABASE_URL with only libpq parameters; Prisma's schema becomes the search_path"""
+    url = make_url(get_database_url())
+    query = {key: value for key, value in url.query.items() if key in LIBPQ_PARAMS}
+    schema = url.query.get("schema")
+    if schema and "options" not in query:
+        query["options"] = f"-csearch_path={schema}"
+    return url.set(query=query)
+
+def get_database_connection(
+    pool_size: int = 5,
+    max_overflow: int = 10,
+    pool_pre_ping: bool = True
+) -> Engine:
+    """
+    Get the pooled engine for DATABASE_URL
+    
+    Engines are cached per process and keyed by URL and pool settings, so
+    repeated calls reuse the same pool (and its open connections) instead
+    of paying for connection setup on every call.
+    """
+    global _ENGINES_PID
+    database_url = get_libpq_url().render_as_string(hide_password=False)
+    key = (database_url, pool_size, max_overflow, pool_pre_ping)
+    
+    with _ENGINES_LOCK:
+        # Connections inherited across fork() must not be shared with the parent
+        if _ENGINES_PID != os.getpid():
+            for engine in _ENGINES.values():
+                engine.dispose(close=False)
+            _ENGINES.clear()
+            _ENGINES_PID = os.getpid()
+        
+        engine = _ENGINES.get(key)
+        if engine is None:
+            engine = create_engine(
+                database_url,
+                poolclass=_TimedQueuePool,
+                pool_pre_ping=pool_pre_ping,
+                pool_size=pool_size,
+                max_overflow=max_overflow
+            )
+            _ENGINES[key] = engine
+    
+    return engine
+
+def dispose_engines():
+    """Close every pooled engine (registered to run at interpreter exit)"""
+    with _ENGINES_LOCK:
+        for engine in _ENGINES.values():
+            engine.dispose()
+        _ENGINES.clear()
+
+atexit.register(dispose_engines)
+
+def get_pool_stats() -> List[Dict]:
+    """Report saturation of every pooled engine in this process"""
+    stats = []
+    with _ENGINES_LOCK:
+        engines = list(_ENGINES.values())
+    
+    for engine in engines:
+        pool = engine.pool
+        checkouts = getattr(pool, "checkouts", 0)
+        wait_time_total = getattr(pool, "wait_time_total", 0.0)
+        stats.append({
+            "url": engine.url.render_as_string(hide_password=True),
+            "pool_size": pool.size(),
+            "checked_out": pool.checkedout(),
+            "checked_in": pool.checkedin(),
+            "overflow": pool.overflow(),
+            "checkouts": checkouts,
+            "wait_time_total": wait_time_total,
+            "wait_time_avg": wait_time_total / checkouts if checkouts else 0.0,
+            "wait_time_max": getattr(pool, "wait_time_max", 0.0),
+        })
+    
+    return stats
+
+def print_pool_stats():
+    """Print a one-line saturation summary per pooled engine"""
+    for stats in get_pool_stats():
+        print(
+            f"   Pool: {stats['checked_out']}/{stats['pool_size']} checked out, "
+            f"overflow {stats['overflow']}, "
+            f"{stats['checkouts']} checkouts waited {stats['wait_time_total']:.3f}s "
+            f"(max {stats['wait_time_max']:.3f}s)"
+        )
+
+# Projection shared by every Decision loader, in DecisionRecord field order.
+# JSON columns are selected as text so DecisionRecord can decode them lazily.
+_DECISION_COLUMNS = [
+    ("id", 'd.id'),
+    ("agent_type", 'd."agentType"'),
+    ("state", 'CAST(d.state AS text)'),
+    ("action", 'CAST(d.action AS text)'),
+    ("reward", 'd.reward'),
+    ("reward_components", 'CAST(d."rewardComponents" AS text)'),
+    ("confidence", 'd.confidence'),
+    ("reasoning", 'd.reasoning'),
+    ("user_feedback", 'd."userFeedback"'),
+    ("user_correction", 'CAST(d."userCorrection" AS text)'),
+    ("outcome_metrics", 'CAST(d."outcomeMetrics" AS text)'),
+    ("item_id", 'd."itemId"'),
+    ("opus_id", 'd."opusId"'),
+    ("model_version", 'd."modelVersion"'),
+    ("created_at", 'd."createdAt"'),
+    ("updated_at", 'd."updatedAt"'),
+]
+DECISION_FIELDS = [name for name, _ in _DECISION_COLUMNS]
+
+# Always selected, whatever projection a caller asks for
+_REQUIRED_FIELDS = ("id", "agent_type")
+
+def project_columns(columns: Optional[Sequence[str]]) -> List[Tuple[str, str]]:
+    """Resolve a column projection (DecisionRecord field names) to SQL"""
+    if columns is None:
+        return list(_DECISION_COLUMNS)
+    
+    unknown = set(columns) - set(DECISION_FIELDS)
+    if unknown:
+        raise ValueError(f"Unknown Decision columns: {sorted(unknown)}")
+    
+    wanted = set(columns) | set(_REQUIRED_FIELDS)
+    return [(name, sql) for name, sql in _DECISION_COLUMNS if name in wanted]
+
+def select_list(projection: List[Tuple[str, str]]) -> str:
+    """Render a projection as a SELECT list"""
+    return ",\n            ".join(f"{sql} as {name}" for name, sql in projection)
+
+def _build_decision_filters(
+    agent_type: str,
+    require_reward: bool,
+    require_feedback: bool,
+    min_reward: float,
+    is_training_data: bool
+) -> Tuple[List[str], Dict]:
+    """Build WHERE conditions and bind params for the Decision filters
+    
+    The agent type is always bound as :agent_type but its condition is
+    left to the caller, so the remaining filters can also be evaluated as
+    a SELECT expression.
+    """
+    conditions = ['d."isTrainingData" = :is_training_data']
+    params = {
+        "agent_type": agent_type,
+        "is_training_data": is_training_data
+    }
+    
+    if require_reward:
+        conditions.append("d.reward IS NOT NULL")
+        conditions.append("d.reward >= :min_reward")
+        params["min_reward"] = min_reward
+    
+    if require_feedback:
+        conditions.append('d."userFeedback" IS NOT NULL')
+    
+    return conditions, params
+
+def build_decision_query(
+    agent_type: str,
+    max_samples: Optional[int],
+    require_reward: bool,
+    require_feedback: bool,
+    min_reward: float,
+    is_training_data: bool,
+    projection: Optional[List[Tuple[str, str]]] = None,
+    extra_conditions: Sequence[str] = (),
+    extra_params: Optional[Dict] = None
+):
+    """Build the SELECT used by the Decision loaders"""
+    conditions, params = _build_decision_filters(
+        agent_type, require_reward, require_feedback, min_reward, is_training_data
+    )
+    conditions.extend(extra_conditions)
+    params.update(extra_params or {})
+    
+    sql = f"""
+        SELECT 
+            {select_list(projection or _DECISION_COLUMNS)}
+        FROM "Decision" d
+        WHERE d."agentType" = :agent_type AND {" AND ".join(conditions)}
+        ORDER BY d."createdAt" DESC, d.id DESC"""
+    
+    if max_samples is not None:
+        sql += "\n        LIMIT :max_samples"
+        params["max_samples"] = max_samples
+    
+    return text(sql), params
+
+def _build_multi_agent_query(
+    agents: Dict[str, Dict],
+    require_reward: bool,
+    require_feedback: bool,
+    is_training_data: bool,
+    projection: Optional[List[Tuple[str, str]]] = None
+):
+    """Build one SELECT covering several agent types, each with its own filters
+    
+    ``agents`` maps agent type -> {"min_reward": float, "max_samples":
+    Optional[int]}. Per-agent limits are applied with row_number() over
+    each agent's partition, so a capped agent's excess rows never leave
+    the server. Rows come back in the usual (createdAt, id) DESC order
+    across all agents, which keeps each agent's rows in the same order as
+    build_decision_query.
+    """
+    projection = projection or _DECISION_COLUMNS
+    params = {"is_training_data": is_training_data}
+    conditions = ['d."isTrainingData" = :is_training_data']
+    if require_feedback:
+        conditions.append('d."userFeedback" IS NOT NULL')
+    
+    agent_conditions = []
+    limit_conditions = []
+    for index, (agent_type, filters) in enumerate(agents.items()):
+        params[f"agent_{index}"] = agent_type
+        condition = f'd."agentType" = :agent_{index}'
+        if require_reward:
+            condition += f" AND d.reward IS NOT NULL AND d.reward >= :min_reward_{index}"
+            params[f"min_reward_{index}"] = filters.get("min_reward", -2.0)
+        agent_conditions.append(f"({condition})")
+        
+        if filters.get("max_samples") is None:
+            limit_conditions.append(f"agent_type = :agent_{index}")
+        else:
+            limit_conditions.append(f"(agent_type = :agent_{index} AND agent_rank <= :max_samples_{index})")
+            params[f"max_samples_{index}"] = filters["max_samples"]
+    conditions.append(f"({' OR '.join(agent_conditions)})")
+    
+    where = " AND ".join(conditions)
+    names = ", ".join(name for name, _ in projection)
+    if all(filters.get("max_samples") is None for filters in agents.values()):
+        sql = f"""
+        SELECT 
+            {select_list(projection)}
+        FROM "Decision" d
+        WHERE {where}
+        ORDER BY d."createdAt" DESC, d.id DESC"""
+    else:
+        sql = f"""
+        SELECT {names}
+        FROM (
+            SELECT 
+                {select_list(projection)},
+                d."createdAt" as sort_created_at,
+                row_number() OVER (
+                    PARTITION BY d."agentType" ORDER BY d."createdAt" DESC, d.id DESC
+                ) as agent_rank
+            FROM "Decision" d
+            WHERE {where}
+        ) ranked
+        WHERE {' OR '.join(limit_conditions)}
+        ORDER BY sort_created_at DESC, id DESC"""
+    
+    return text(sql), params
+
+def _format_timestamp(value) -> Optional[str]:
+    """Render a timestamp column as ISO 8601"""
+    if value is None:
+        return None
+    return value.isoformat() if hasattr(value, 'isoformat') else str(value)
+
+def row_to_decision(row, fields: Optional[Sequence[str]] = None) -> DecisionRecord:
+    """Convert a Decision row to a DecisionRecord
+    
+    ``fields`` names the row's columns (all of _DECISION_COLUMNS in order
+    by default); columns left out of a projection come back as None.
+    """
+    values = dict(zip(fields or DECISION_FIELDS, row))
+    reward = values.get("reward")
+    confidence = values.get("confidence")
+    return DecisionRecord(
+        id=values["id"],
+        agent_type=values["agent_type"],
+        state=_raw_json(values.get("state")),
+        action=_raw_json(values.get("action")),
+        reward=float(reward) if reward is not None else None,
+        reward_components=_raw_json(values.get("reward_components")),
+        confidence=float(confidence) if confidence is not None else None,
+        reasoning=values.get("reasoning"),
+        user_feedback=values.get("user_feedback"),
+        user_correction=_raw_json(values.get("user_correction")),
+        outcome_metrics=_raw_json(values.get("outcome_metrics")),
+        item_id=values.get("item_id"),
+        opus_id=values.get("opus_id"),
+        model_version=values.get("model_version"),
+        created_at=_format_timestamp(values.get("created_at")),
+        updated_at=_format_timestamp(values.get("updated_at"))
+    )
+
+def iter_training_decision_batches(
+    agent_type: str,
+    max_samples: Optional[int] = None,
+    require_reward: bool = True,
+    require_feedback: bool = False,
+    min_reward: float = -2.0,
+    is_training_data: bool = True,
+    fetch_size: int = 1000,
+    columns: Optional[Sequence[str]] = None
+) -> Iterator[List[DecisionRecord]]:
+    """
+    Stream training decisions in chunks using a server-side cursor
+    
+    Rows are pulled from a named (server-side) cursor ``fetch_size`` at a
+    time, so peak memory is bounded by one chunk regardless of table size.
+    The connection stays open until the generator is exhausted or closed.
+    
+    Args:
+        agent_type: Agent type (FILER, LIBRARIAN, etc.)
+        max_samples: Maximum number of samples to load (None for all)
+        require_reward: Only load decisions with calculated rewards
+        require_feedback: Only load decisions with user feedback
+        min_reward: Minimum reward threshold
+        is_training_data: Only load decisions marked as training data
+        fetch_size: Rows fetched from the server per round trip
+        columns: DecisionRecord fields to select (None for all); id and
+            agent_type are always included, the rest come back as None
+    
+    Yields:
+        Lists of at most ``fetch_size`` DecisionRecord objects
+    """
+    engine = get_database_connection()
+    projection = project_columns(columns)
+    fields = [name for name, _ in projection]
+    query, params = build_decision_query(
+        agent_type, max_samples, require_reward, require_feedback, min_reward, is_training_data,
+        projection
+    )
+    
+    # yield_per turns on stream_results, which psycopg2 serves from a named cursor
+    with engine.connect() as conn:
+        result = conn.execution_options(yield_per=fetch_size).execute(query, params)
+        for rows in result.partitions(fetch_size):
+            yield [row_to_decision(row, fields) for row in rows]
+
+def iter_training_decisions(
+    agent_type: str,
+    max_samples: Optional[int] = None,
+    require_reward: bool = True,
+    require_feedback: bool = False,
+    min_reward: float = -2.0,
+    is_training_data: bool = True,
+    fetch_size: int = 1000,
+    columns: Optional[Sequence[str]] = None
+) -> Iterator[DecisionRecord]:
+    """
+    Stream training decisions one at a time (see iter_training_decision_batches)
+    """
+    for batch in iter_training_decision_batches(
+        agent_type,
+        max_samples=max_samples,
+        require_reward=require_reward,
+        require_feedback=require_feedback,
+        min_reward=min_reward,
+        is_training_data=is_training_data,
+        fetch_size=fetch_size,
+        columns=columns
+    ):
+        yield from batch
+
+def iter_training_decisions_for_agents(
+    agents: Dict[str, Dict],
+    require_reward: bool = True,
+    require_feedback: bool = False,
+    is_training_data: bool = True,
+    fetch_size: int = 1000,
+    columns: Optional[Sequence[str]] = None
+) -> Iterator[DecisionRecord]:
+    """
+    Stream training decisions for several agent types in one scan
+    
+    Args:
+        agents: Agent type -> {"min_reward": float, "max_samples":
+            Optional[int]} (see _build_multi_agent_query)
+        Other arguments as for iter_training_decisions
+    
+    Yields:
+        DecisionRecord objects of all requested agents, newest first;
+        route them on ``agent_type``
+    """
+    engine = get_database_connection()
+    projection = project_columns(columns)
+    fields = [name for name, _ in projection]
+    query, params = _build_multi_agent_query(
+        agents, require_reward, require_feedback, is_training_data, projection
+    )
+    
+    with engine.connect() as conn:
+        result = conn.execution_options(yield_per=fetch_size).execute(query, params)
+        for rows in result.partitions(fetch_size):
+            for row in rows:
+                yield row_to_decision(row, fields)
+
+def iter_changed_decisions(
+    agent_type: str,
+    after_updated_at: Optional[str] = None,
+    after_id: str = "",
+    require_reward: bool = True,
+    require_feedback: bool = False,
+    min_reward: float = -2.0,
+    is_training_data: bool = True,
+    page_size: int = 1000,
+    max_samples: Optional[int] = None,
+    descending: bool = False
+) -> Iterator[Tuple[DecisionRecord, bool]]:
+    """
+    Page through decisions changed after a (updatedAt, id) watermark
+    
+    Uses keyset pagination on ("updatedAt", id) ascending, so each page is
+    an index range scan that starts where the previous one stopped rather
+    than an OFFSET rescan. Filters are not applied in WHERE; instead each
+    row is returned with whether it currently matches them, so callers can
+    drop decisions that no longer qualify from an existing dataset. With
+    ``descending``, the newest decisions come first (and the watermark is
+    an exclusive upper bound).
+    
+    Args:
+        agent_type: Agent type (FILER, LIBRARIAN, etc.)
+        after_updated_at: Exclusive lower bound on updatedAt (None for all)
+        after_id: Tie-breaker id for decisions sharing after_updated_at
+        require_reward, require_feedback, min_reward, is_training_data:
+            Same filters as load_training_decisions
+        page_size: Rows fetched per page
+        max_samples: Stop after this many changed decisions (None for all)
+        descending: Newest first instead of oldest first
+    
+    Yields:
+        (DecisionRecord, matches_filters) tuples in watermark order
+    """
+    conditions, params = _build_decision_filters(
+        agent_type, require_reward, require_feedback, min_reward, is_training_data
+    )
+    columns_sql = (
+        select_list(_DECISION_COLUMNS)
+        + f',\n            COALESCE({" AND ".join(conditions)}, false) as matches_filters'
+    )
+    
+    for row in _iter_keyset_rows(columns_sql, params, after_updated_at, after_id, page_size, max_samples, descending):
+        yield row_to_decision(row), bool(row.matches_filters)
+
+# Extra columns a full local copy of the table needs beyond DecisionRecord
+_SYNC_COLUMNS = [
+    ("is_training_data", 'd."isTrainingData"'),
+    ("is_validation_data", 'd."isValidationData"'),
+]
+
+def iter_decision_rows_since(
+    agent_type: str,
+    after_updated_at: Optional[str] = None,
+    after_id: str = "",
+    page_size: int = 1000
+) -> Iterator[Dict]:
+    """
+    Page through every decision of an agent type changed after a watermark
+    
+    Unfiltered counterpart of iter_changed_decisions for mirroring the
+    table: yields {field: value} dicts with raw JSON text, ISO timestamps
+    and the isTrainingData/isValidationData flags, in (updatedAt, id) order.
+    """
+    projection = _DECISION_COLUMNS + _SYNC_COLUMNS
+    params = {"agent_type": agent_type}
+    
+    for row in _iter_keyset_rows(select_list(projection), params, after_updated_at, after_id, page_size, None):
+        values = dict(row._mapping)
+        values["created_at"] = _format_timestamp(values["created_at"])
+        values["updated_at"] = _format_timestamp(values["updated_at"])
+        yield values
+
+def _iter_keyset_rows(
+    columns_sql: str,
+    params: Dict,
+    after_updated_at: Optional[str],
+    after_id: str,
+    page_size: int,
+    max_samples: Optional[int],
+    descending: bool = False
+):
+    """Run a Decision SELECT page by page, keyed on ("updatedAt", id)
+    
+    ``columns_sql`` must label the id and updatedAt columns ``id`` and
+    ``updated_at``; ``params`` must bind :agent_type. Rows start past
+    (after_updated_at, after_id) in scan order, which is descending with
+    ``descending``.
+    """
+    engine = get_database_connection()
+    comparison, order = ("<", "DESC") if descending else (">", "ASC")
+    yielded = 0
+    while max_samples is None or yielded < max_samples:
+        where = 'd."agentType" = :agent_type'
+        page_params = dict(params)
+        if after_updated_at is not None:
+            where += f' AND (d."updatedAt", d.id) {comparison} (:after_updated_at, :after_id)'
+            page_params["after_updated_at"] = after_updated_at
+            page_params["after_id"] = after_id
+        page_params["page_size"] = page_size if max_samples is None else min(page_size, max_samples - yielded)
+        
+        query = text(f"""
+            SELECT 
+                {columns_sql}
+            FROM "Decision" d
+            WHERE {where}
+            ORDER BY d."updatedAt" {order}, d.id {order}
+            LIMIT :page_size
+        """)
+        
+        with engine.connect() as conn:
+            rows = conn.execute(query, page_params).fetchall()
+        
+        yield from rows
+        
+        yielded += len(rows)
+        if len(rows) < page_params["page_size"]:
+            break
+        
+        # Advance the keyset to the last row of this page
+        after_updated_at, after_id = rows[-1].updated_at, rows[-1].id
+
+# Decisions whose reward is missing or predates feedback/outcomes that
+# arrived after it was computed
+STALE_REWARD_CONDITION = """(
+            d.reward IS NULL
+            OR d."feedbackAt" > d."rewardComputedAt"
+            OR d."outcomeObservedAt" > d."rewardComputedAt"
+        )"""
+
+def iter_stale_reward_decisions(
+    agent_type: str,
+    columns: Optional[Sequence[str]] = None,
+    page_size: int = 1000,
+    max_samples: Optional[int] = None,
+    is_training_data: bool = True
+) -> Iterator[DecisionRecord]:
+    """
+    Page through every decision whose reward needs (re)computing
+    
+    Selects decisions with no reward, or whose feedbackAt/outcomeObservedAt
+    is newer than rewardComputedAt. Pages are keyed on id, so rewards can be
+    written back between pages without rows being skipped or revisited.
+    
+    Args:
+        agent_type: Agent type (FILER, LIBRARIAN, etc.)
+        columns: DecisionRecord fields to select (default: all)
+        page_size: Rows fetched per page
+        max_samples: Stop after this many decisions (None for all)
+        is_training_data: Only decisions with this isTrainingData flag
+    """
+    projection = project_columns(columns)
+    fields = [name for name, _ in projection]
+    query = text(f"""
+        SELECT 
+            {select_list(projection)}
+        FROM "Decision" d
+        WHERE d."agentType" = :agent_type
+            AND d."isTrainingData" = :is_training_data
+            AND d.id > :after_id
+            AND {STALE_REWARD_CONDITION}
+        ORDER BY d.id
+        LIMIT :page_size
+    """)
+    
+    engine = get_database_connection()
+    after_id = ""
+    yielded = 0
+    while max_samples is None or yielded < max_samples:
+        limit = page_size if max_samples is None else min(page_size, max_samples - yielded)
+        with engine.connect() as conn:
+            rows = conn.execute(query, {
+                "agent_type": agent_type,
+                "is_training_data": is_training_data,
+                "after_id": after_id,
+                "page_size": limit
+            }).fetchall()
+        
+        for row in rows:
+            yield row_to_decision(row, fields)
+        
+        yielded += len(rows)
+        if len(rows) < limit:
+            break
+        after_id = rows[-1].id
+
+def load_decisions_by_ids(ids: Sequence[str], columns: Optional[Sequence[str]] = None) -> List[DecisionRecord]:
+    """Load specific decisions in one query (missing ids are skipped)"""
+    if not ids:
+        return []
+    
+    projection = project_columns(columns)
+    fields = [name for name, _ in projection]
+    query = text(f"""
+        SELECT 
+            {select_list(projection)}
+        FROM "Decision" d
+        WHERE d.id = ANY(CAST(:ids AS text[]))
+    """)
+    
+    engine = get_database_connection()
+    with engine.connect() as conn:
+        rows = conn.execute(query, {"ids": list(ids)}).fetchall()
+    
+    return [row_to_decision(row, fields) for row in rows]
+
+# Escapes emitted by COPY ... TO in text format
+_COPY_ESCAPES = {"\\": "\\", "b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t", "v": "\v"}
+_COPY_TIMESTAMP_FIELDS = {"created_at", "updated_at"}
+_COPY_END = object()
+
+def _unescape_copy_field(value: str) -> Optional[str]:
+    """Decode one field of COPY text format (a bare \\N is NULL)"""
+    if value == "\\N":
+        return None
+    if "\\" not in value:
+        return value
+    
+    out = []
+    i = 0
+    while i < len(value):
+        char = value[i]
+        if char == "\\" and i + 1 < len(value):
+            out.append(_COPY_ESCAPES.get(value[i + 1], value[i + 1]))
+            i += 2
+        else:
+            out.append(char)
+            i += 1
+    return "".join(out)
+
+def _parse_copy_line(line: str, fields: Sequence[str]) -> DecisionRecord:
+    """Convert one COPY text-format line with the given columns to a DecisionRecord"""
+    values = [_unescape_copy_field(value) for value in line.split("\t")]
+    for index, name in enumerate(fields):
+        # Match the ISO 8601 rendering of the row-based loaders
+        if name in _COPY_TIMESTAMP_FIELDS and values[index] is not None:
+            values[index] = datetime.fromisoformat(values[index]).isoformat()
+    return row_to_decision(values, fields)
+
+class _CopySink:
+    """File-like target for copy_expert that hands chunks to a bounded queue"""
+    
+    def __init__(self, chunks: "queue.Queue", stop: threading.Event):
+        self.chunks = chunks
+        self.stop = stop
+    
+    def write(self, data):
+        while True:
+            if self.stop.is_set():
+                raise RuntimeError("COPY aborted by consumer")
+            try:
+                self.chunks.put(data, timeout=0.1)
+                return len(data)
+            except queue.Full:
+                continue
+
+def connect_psycopg2():
+    """Open a plain, unpooled psycopg2 connection to DATABASE_URL (for COPY and LISTEN)"""
+    url = get_libpq_url()
+    return psycopg2.connect(**url.translate_connect_args(username="user"), **dict(url.query))
+
+def copy_training_decisions(
+    agent_type: str,
+    max_samples: Optional[int] = None,
+    require_reward: bool = True,
+    require_feedback: bool = False,
+    min_reward: float = -2.0,
+    is_training_data: bool = True,
+    queue_size: int = 256,
+    columns: Optional[Sequence[str]] = None
+) -> Iterator[DecisionRecord]:
+    """
+    Stream training decisions with COPY (SELECT ...) TO STDOUT
+    
+    Runs the same filtered projection as load_training_decisions, but
+    Postgres streams it in COPY text format, which skips per-row protocol
+    and SQLAlchemy result overhead. Text format keeps each row on one line
+    and distinguishes NULL from empty strings, so rows are parsed with a
+    plain split. The COPY runs on a background thread feeding a bounded
+    queue, so memory stays flat and the consumer applies backpressure.
+    
+    Args:
+        Same filters and column projection as iter_training_decisions
+        queue_size: Maximum number of COPY chunks buffered ahead of the consumer
+    
+    Yields:
+        DecisionRecord objects in the same order as load_training_decisions
+    """
+    projection = project_columns(columns)
+    fields = [name for name, _ in projection]
+    query, params = build_decision_query(
+        agent_type, max_samples, require_reward, require_feedback, min_reward, is_training_data,
+        projection
+    )
+    return _copy_decisions(query, params, fields, queue_size)
+
+def copy_training_decisions_for_agents(
+    agents: Dict[str, Dict],
+    require_reward: bool = True,
+    require_feedback: bool = False,
+    is_training_data: bool = True,
+    queue_size: int = 256,
+    columns: Optional[Sequence[str]] = None
+) -> Iterator[DecisionRecord]:
+    """
+    COPY counterpart of iter_training_decisions_for_agents
+    """
+    projection = project_columns(columns)
+    fields = [name for name, _ in projection]
+    query, params = _build_multi_agent_query(
+        agents, require_reward, require_feedback, is_training_data, projection
     )
+    return _copy_decisions(query, params, fields, queue_size)
+
+def _copy_decisions(query, params: Dict, fields: Sequence[str], queue_size: int) -> Iterator[DecisionRecord]:
+    """Run a Decision SELECT through COPY ... TO STDOUT (see copy_training_decisions)"""
+    compiled = query.bindparams(**params).compile(dialect=psycopg2_dialect.dialect())
+    
+    conn = connect_psycopg2()
+    chunks: "queue.Queue" = queue.Queue(maxsize=queue_size)
+    stop = threading.Event()
+    errors: List[BaseException] = []
+    
+    def run_copy():
+        try:
+            with conn.cursor() as cursor:
+                select = cursor.mogrify(str(compiled), compiled.params).decode("utf-8")
+                cursor.copy_expert(f"COPY ({select}) TO STDOUT", _CopySink(chunks, stop))
+        except BaseException as exc:  # re-raised on the consumer side
+            errors.append(exc)
+        finally:
+            while not stop.is_set():
+                try:
+                    chunks.put(_COPY_END, timeout=0.1)
+                    break
+                except queue.Full:
+                    continue
+    
+    worker = threading.Thread(target=run_copy, name="copy-training-decisions", daemon=True)
+    worker.start()
+    
+    try:
+        pending = ""
+        while True:
+            chunk = chunks.get()
+            if chunk is _COPY_END:
+                break
+            if isinstance(chunk, bytes):
+                chunk = chunk.decode("utf-8")
+            
+            lines = (pending + chunk).split("\n")
+            pending = lines.pop()
+            for line in lines:
+                yield _parse_copy_line(line, fields)
+        
+        if errors:
+            raise errors[0]
+        if pending:
+            yield _parse_copy_line(pending, fields)
+    finally:
+        if worker.is_alive():
+            stop.set()
+            conn.cancel()
+        worker.join()
+        conn.close()
 
 def load_training_decisions(
     agent_type: str,
@@ -53,7 +1151,10 @@ def load_training_decisions(
     require_reward: bool = True,
     require_feedback: bool = False,
     min_reward: float = -2.0,
-    is_training_data: bool = True
+    is_training_data: bool = True,
+    columns: Optional[Sequence[str]] = None,
+    workers: int = 1,
+    partition_by: str = "hash"
 ) -> List[DecisionRecord]:
     """
     Load training decisions from Decision table
@@ -65,114 +1166,359 @@ def load_training_decisions(
         require_feedback: Only load decisions with user feedback
         min_reward: Minimum reward threshold
         is_training_data: Only load decisions marked as training data
+        columns: DecisionRecord fields to select (None for all)
+        workers: Split the scan across this many worker processes
+        partition_by: "hash" (of id) or "created_at" (ranges) when workers > 1
     
     Returns:
         List of DecisionRecord objects
     """
+    if workers > 1:
+        return _load_partitioned(
+            agent_type, max_samples, require_reward, require_feedback, min_reward,
+            is_training_data, columns, workers, partition_by
+        )
+    
     engine = get_database_connection()
+    projection = project_columns(columns)
+    fields = [name for name, _ in projection]
+    query, params = build_decision_query(
+        agent_type, max_samples, require_reward, require_feedback, min_reward, is_training_data,
+        projection
+    )
     
-    query = text("""
-        SELECT 
-            d.id,
-            d."agentType" as agent_type,
-            d.state,
-            d.action,
-            d.reward,
-            d."rewardComponents" as reward_components,
-            d.confidence,
-            d.reasoning,
-            d."userFeedback" as user_feedback,
-            d."userCorrection" as user_correction,
-            d."outcomeMetrics" as outcome_metrics,
-            d."itemId" as item_id,
-            d."opusId" as opus_id,
-            d."modelVersion" as model_version,
-            d."createdAt" as created_at
+    with engine.connect() as conn:
+        result = conn.execute(query, params)
+        rows = result.fetchall()
+    
+    return [row_to_decision(row, fields) for row in rows]
+
+def load_decision_batch(
+    agent_type: str,
+    max_samples: Optional[int] = None,
+    require_reward: bool = True,
+    require_feedback: bool = False,
+    min_reward: float = -2.0,
+    is_training_data: bool = True,
+    fetch_size: int = 1000,
+    columns: Optional[Sequence[str]] = None
+) -> DecisionBatch:
+    """
+    Load training decisions into a columnar DecisionBatch
+    
+    Rows are streamed from a server-side cursor straight into the batch's
+    buffers, without building a DecisionRecord or decoding JSON per row.
+    Takes the same arguments as iter_training_decision_batches.
+    """
+    projection = project_columns(columns)
+    fields = [name for name, _ in projection]
+    query, params = build_decision_query(
+        agent_type, max_samples, require_reward, require_feedback, min_reward, is_training_data,
+        projection
+    )
+    
+    return _fill_batch(query, params, fields, fetch_size)
+
+def _fill_batch(query, params: Dict, fields: Sequence[str], fetch_size: int) -> DecisionBatch:
+    """Stream a Decision query from a server-side cursor into a DecisionBatch"""
+    engine = get_database_connection()
+    batch = DecisionBatch()
+    with engine.connect() as conn:
+        result = conn.execution_options(yield_per=fetch_size).execute(query, params)
+        for rows in result.partitions(fetch_size):
+            for row in rows:
+                batch.append_values(dict(zip(fields, row)))
+    
+    return batch
+
+def _partition_conditions(
+    agent_type: str,
+    require_reward: bool,
+    require_feedback: bool,
+    min_reward: float,
+    is_training_data: bool,
+    partitions: int,
+    partition_by: str
+) -> List[Tuple[str, Dict]]:
+    """SQL condition and params selecting each partition of the scan"""
+    if partition_by == "hash":
+        return [
+            ("(hashtext(d.id) & 2147483647) % :partitions = :partition", {"partitions": partitions, "partition": index})
+            for index in range(partitions)
+        ]
+    
+    if partition_by != "created_at":
+        raise ValueError(f"Unknown partition_by: {partition_by}")
+    
+    # Equal-sized createdAt ranges from the quantiles of the filtered rows
+    conditions, params = _build_decision_filters(
+        agent_type, require_reward, require_feedback, min_reward, is_training_data
+    )
+    params["fractions"] = [index / partitions for index in range(1, partitions)]
+    query = text(f"""
+        SELECT percentile_disc(CAST(:fractions AS double precision[])) WITHIN GROUP (ORDER BY d."createdAt")
         FROM "Decision" d
-        WHERE d."agentType" = :agent_type
-          AND d."isTrainingData" = :is_training_data
+        WHERE d."agentType" = :agent_type AND {" AND ".join(conditions)}
     """)
+    with get_database_connection().connect() as conn:
+        bounds = conn.execute(query, params).scalar() or []
     
-    params = {
-        "agent_type": agent_type,
-        "is_training_data": is_training_data
-    }
+    ranges = []
+    lower = None
+    for index, upper in enumerate(list(bounds) + [None]):
+        condition = []
+        range_params = {}
+        if lower is not None:
+            condition.append(f'd."createdAt" >= :created_from_{index}')
+            range_params[f"created_from_{index}"] = lower
+        if upper is not None:
+            condition.append(f'd."createdAt" < :created_to_{index}')
+            range_params[f"created_to_{index}"] = upper
+        ranges.append((" AND ".join(condition) or "true", range_params))
+        lower = upper
+    return ranges
+
+def _load_partition_batch(args: Tuple) -> DecisionBatch:
+    """Worker: fetch one partition of the scan into a DecisionBatch"""
+    (agent_type, max_samples, require_reward, require_feedback, min_reward,
+     is_training_data, columns, condition, condition_params) = args
     
-    if require_reward:
-        query = text(str(query).replace(
-            "WHERE d.\"agentType\" = :agent_type",
-            "WHERE d.\"agentType\" = :agent_type AND d.reward IS NOT NULL"
-        ))
-        query = text(str(query).replace(
-            "AND d.\"isTrainingData\" = :is_training_data",
-            "AND d.\"isTrainingData\" = :is_training_data AND d.reward >= :min_reward"
-        ))
-        params["min_reward"] = min_reward
+    projection = project_columns(columns)
+    fields = [name for name, _ in projection]
+    query, params = build_decision_query(
+        agent_type, max_samples, require_reward, require_feedback, min_reward, is_training_data,
+        projection, [condition], condition_params
+    )
+    return _fill_batch(query, params, fields, fetch_size=1000)
+
+def _load_partitioned(
+    agent_type: str,
+    max_samples: Optional[int],
+    require_reward: bool,
+    require_feedback: bool,
+    min_reward: float,
+    is_training_data: bool,
+    columns: Optional[Sequence[str]],
+    workers: int,
+    partition_by: str
+) -> List[DecisionRecord]:
+    """
+    Load decisions with one worker process per partition of the scan
     
-    if require_feedback:
-        query = text(str(query).replace(
-            "AND d.reward >= :min_reward",
-            "AND d.reward >= :min_reward AND d.\"userFeedback\" IS NOT NULL"
-        ))
+    Each worker runs its partition's query (with the same ORDER BY and
+    LIMIT) and returns a compact DecisionBatch, which pickles as a few
+    buffers rather than one object graph per row. Partitions are then
+    merged back into createdAt DESC, id DESC order and cut to max_samples,
+    so the result matches the single-process loader.
+    """
+    # The merge needs the sort keys even if the caller did not ask for them
+    if columns is not None:
+        columns = list(set(columns) | {"created_at"})
     
-    query = text(str(query) + "\nORDER BY d.\"createdAt\" DESC\nLIMIT :max_samples")
-    params["max_samples"] = max_samples
+    partitions = _partition_conditions(
+        agent_type, require_reward, require_feedback, min_reward, is_training_data,
+        workers, partition_by
+    )
+    tasks = [
+        (agent_type, max_samples, require_reward, require_feedback, min_reward,
+         is_training_data, columns, condition, condition_params)
+        for condition, condition_params in partitions
+    ]
     
-    with engine.connect() as conn:
-        result = conn.execute(query, params)
-        rows = result.fetchall()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        batches = list(executor.map(_load_partition_batch, tasks))
     
-    decisions = []
-    for row in rows:
-        decisions.append(DecisionRecord(
-            id=row[0],
-            agent_type=row[1],
-            state=row[2] if isinstance(row[2], dict) else json.loads(row[2]) if row[2] else {},
-            action=row[3] if isinstance(row[3], dict) else json.loads(row[3]) if row[3] else {},
-            reward=float(row[4]) if row[4] is not None else None,
-            reward_components=row[5] if isinstance(row[5], dict) else json.loads(row[5]) if row[5] else None,
-            confidence=float(row[6]) if row[6] is not None else None,
-            reasoning=row[7],
-            user_feedback=row[8],
-            user_correction=row[9] if isinstance(row[9], dict) else json.loads(row[9]) if row[9] else None,
-            outcome_metrics=row[10] if isinstance(row[10], dict) else json.loads(row[10]) if row[10] else None,
-            item_id=row[11],
-            opus_id=row[12],
-            model_version=row[13],
-            created_at=row[14].isoformat() if hasattr(row[14], 'isoformat') else str(row[14])
-        ))
-    
-    return decisions
-
-def get_training_stats(agent_type: str) -> Dict:
-    """Get statistics about available training data"""
-    engine = get_database_connection()
+    def ordered(batch: DecisionBatch):
+        ids = batch.ids()
+        for index in range(len(batch)):
+            yield (batch.created_at[index], ids[index]), batch, index
+    
+    merged = heapq.merge(*(ordered(batch) for batch in batches), key=lambda entry: entry[0], reverse=True)
+    if max_samples is not None:
+        merged = itertools.islice(merged, max_samples)
+    
+    return [batch[index] for _, batch, index in merged]
+
+def write_rewards(
+    rewards: Iterable[Tuple[str, float]],
+    batch_size: int = 1000
+) -> Dict:
+    """
+    Write (decision_id, reward) pairs back to the Decision table in batches
+    
+    Each batch is a single ``UPDATE ... FROM unnest(ids, rewards)`` sent in
+    its own transaction, so a backfill costs one round trip and one commit
+    per batch instead of per decision, and an interrupted run keeps every
+    batch committed so far.
+    
+    "updatedAt" is bumped as well: Prisma's @updatedAt is set by the
+    Prisma client, not the database, and incremental exports and cache
+    syncs only see rows whose updatedAt moved past their watermark.
+    
+    Args:
+        rewards: Iterable of (decision_id, reward) pairs, consumed lazily
+        batch_size: Decisions per UPDATE statement and commit
     
+    Returns:
+        Dict with updated rows, batches, elapsed seconds and rows per second
+    """
+    engine = get_database_connection()
     query = text("""
+        UPDATE "Decision" AS d
+        SET reward = v.reward,
+            "rewardComputedAt" = NOW(),
+            "updatedAt" = NOW()
+        FROM unnest(CAST(:ids AS text[]), CAST(:rewards AS double precision[])) AS v(id, reward)
+        WHERE d.id = v.id
+    """)
+    
+    updated = 0
+    batches = 0
+    started = time.perf_counter()
+    
+    def flush(ids: List[str], values: List[float]) -> int:
+        with engine.begin() as conn:
+            return conn.execute(query, {"ids": ids, "rewards": values}).rowcount
+    
+    ids: List[str] = []
+    values: List[float] = []
+    for decision_id, reward in rewards:
+        ids.append(decision_id)
+        values.append(reward)
+        if len(ids) >= batch_size:
+            updated += flush(ids, values)
+            batches += 1
+            ids, values = [], []
+    
+    if ids:
+        updated += flush(ids, values)
+        batches += 1
+    
+    elapsed = time.perf_counter() - started
+    return {
+        "updated": updated,
+        "batches": batches,
+        "seconds": elapsed,
+        "rows_per_sec": updated / elapsed if elapsed > 0 else 0.0
+    }
+
+# Percentiles and histogram layout reported by the training stats
+STATS_PERCENTILES = [0.05, 0.25, 0.5, 0.75, 0.95]
+STATS_HISTOGRAM_RANGE = (-5.0, 5.0)  # Rewards are clamped to this range
+STATS_HISTOGRAM_BINS = 20
+
+# Cached grouped stats: {"key": ..., "expires": monotonic deadline, "value": ...}
+_STATS_CACHE: Dict = {}
+_STATS_CACHE_LOCK = threading.Lock()
+
+def _empty_training_stats() -> Dict:
+    """Stats for an agent type with no decisions"""
+    return {
+        "total_decisions": 0,
+        "decisions_with_reward": 0,
+        "decisions_with_feedback": 0,
+        "avg_reward": None,
+        "min_reward": None,
+        "max_reward": None,
+        "training_data_count": 0,
+        "validation_data_count": 0,
+        "reward_percentiles": {str(p): None for p in STATS_PERCENTILES},
+        "reward_histogram": {
+            "range": list(STATS_HISTOGRAM_RANGE),
+            "counts": [0] * STATS_HISTOGRAM_BINS
+        }
+    }
+
+def get_training_stats_by_agent(ttl: float = 30.0) -> Dict[str, Dict]:
+    """
+    Get training data statistics for every agent type in one query
+    
+    A single ``GROUP BY "agentType"`` scan computes the counts, reward
+    aggregates, reward percentiles and a reward histogram for all agents.
+    The result is cached for ``ttl`` seconds (0 disables the cache), so
+    dashboards polling every agent stay cheap as the table grows. Every
+    call returns its own copy, so callers may modify the result.
+    
+    Returns:
+        Dict of agent type -> stats (every known agent type is present)
+    """
+    key = (get_database_url(), tuple(STATS_PERCENTILES), STATS_HISTOGRAM_RANGE, STATS_HISTOGRAM_BINS)
+    now = time.monotonic()
+    with _STATS_CACHE_LOCK:
+        if ttl > 0 and _STATS_CACHE.get("key") == key and _STATS_CACHE["expires"] > now:
+            return copy.deepcopy(_STATS_CACHE["value"])
+    
+    low, high = STATS_HISTOGRAM_RANGE
+    # Out-of-range rewards land in the first/last bin
+    bucket = 'LEAST(GREATEST(width_bucket(reward, :hist_low, :hist_high, :hist_bins), 1), :hist_bins)'
+    histogram = ",\n            ".join(
+        f"COUNT(*) FILTER (WHERE {bucket} = {index + 1}) as hist_{index}"
+        for index in range(STATS_HISTOGRAM_BINS)
+    )
+    
+    query = text(f"""
         SELECT 
+            "agentType" as agent_type,
             COUNT(*) as total_decisions,
-            COUNT(CASE WHEN reward IS NOT NULL THEN 1 END) as decisions_with_reward,
-            COUNT(CASE WHEN "userFeedback" IS NOT NULL THEN 1 END) as decisions_with_feedback,
+            COUNT(reward) as decisions_with_reward,
+            COUNT("userFeedback") as decisions_with_feedback,
             AVG(reward) as avg_reward,
             MIN(reward) as min_reward,
             MAX(reward) as max_reward,
-            COUNT(CASE WHEN "isTrainingData" = true THEN 1 END) as training_data_count,
-            COUNT(CASE WHEN "isValidationData" = true THEN 1 END) as validation_data_count
+            COUNT(*) FILTER (WHERE "isTrainingData") as training_data_count,
+            COUNT(*) FILTER (WHERE "isValidationData") as validation_data_count,
+            percentile_cont(CAST(:percentiles AS double precision[])) WITHIN GROUP (ORDER BY reward) as reward_percentiles,
+            {histogram}
         FROM "Decision"
-        WHERE "agentType" = :agent_type
+        GROUP BY "agentType"
     """)
     
+    engine = get_database_connection()
     with engine.connect() as conn:
-        result = conn.execute(query, {"agent_type": agent_type})
-        row = result.fetchone()
+        rows = conn.execute(query, {
+            "percentiles": STATS_PERCENTILES,
+            "hist_low": low,
+            "hist_high": high,
+            "hist_bins": STATS_HISTOGRAM_BINS
+        }).fetchall()
     
-    return {
-        "total_decisions": row[0],
-        "decisions_with_reward": row[1],
-        "decisions_with_feedback": row[2],
-        "avg_reward": float(row[3]) if row[3] else None,
-        "min_reward": float(row[4]) if row[4] else None,
-        "max_reward": float(row[5]) if row[5] else None,
-        "training_data_count": row[6],
-        "validation_data_count": row[7]
-    }
+    stats = {agent_type: _empty_training_stats() for agent_type in AGENT_TYPES}
+    for row in rows:
+        percentiles = row.reward_percentiles or [None] * len(STATS_PERCENTILES)
+        stats[row.agent_type] = {
+            "total_decisions": row.total_decisions,
+            "decisions_with_reward": row.decisions_with_reward,
+            "decisions_with_feedback": row.decisions_with_feedback,
+            "avg_reward": float(row.avg_reward) if row.avg_reward is not None else None,
+            "min_reward": float(row.min_reward) if row.min_reward is not None else None,
+            "max_reward": float(row.max_reward) if row.max_reward is not None else None,
+            "training_data_count": row.training_data_count,
+            "validation_data_count": row.validation_data_count,
+            "reward_percentiles": {
+                str(p): float(value) if value is not None else None
+                for p, value in zip(STATS_PERCENTILES, percentiles)
+            },
+            "reward_histogram": {
+                "range": [low, high],
+                "counts": [getattr(row, f"hist_{index}") for index in range(STATS_HISTOGRAM_BINS)]
+            }
+        }
+    
+    with _STATS_CACHE_LOCK:
+        _STATS_CACHE.update(key=key, expires=time.monotonic() + ttl, value=stats)
+    
+    return copy.deepcopy(stats)
+
+def clear_training_stats_cache():
+    """Drop cached grouped stats so the next call queries the database"""
+    with _STATS_CACHE_LOCK:
+        _STATS_CACHE.clear()
+
+def get_training_stats(agent_type: str, ttl: float = 30.0) -> Dict:
+    """Get statistics about available training data
+    
+    Served from the grouped all-agent query (see get_training_stats_by_agent),
+    so asking for each agent type in turn costs one scan per ``ttl`` window.
+    """
+    stats = get_training_stats_by_agent(ttl=ttl)
+    return stats.get(agent_type) or _empty_training_stats()
@@ -0,0 +1,477 @@
+#!/usr/bin/env python3
+"""
+Reading and writing exported training datasets
+
+An export is either a single JSONL file or a set of gzip/zstd-compressed
+JSONL shards described by a manifest beside the requested output path:
+
+    data/filer.jsonl.manifest.json   Shard list with counts, sizes, sha256
+    data/filer-00000.jsonl.gz
+    data/filer-00001.jsonl.gz
+
+read_examples() accepts the plain path either way (or a .gz/.zst file, or
+the manifest itself), so trainers and evaluate.py read shards transparently.
+
+Exports can also store the opus content repeated across prompts once, in a
+content-addressed side table, and reference it from each example:
+
+    data/filer.jsonl.context.jsonl   {"hash": ..., "text": ...} per block
+    {"promptParts": ["Instructions: ...", {"ref": "<hash>"}, "..."], ...}
+
+read_examples() resolves the references back into "prompt" as it goes.
+
+Usage:
+    python dataset_io.py verify training/data/filer.jsonl
+    python dataset_io.py report training/data/filer.jsonl
+"""
+import os
+import sys
+import gzip
+import json
+import hashlib
+import argparse
+from datetime import datetime
+from collections import OrderedDict
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+MANIFEST_SUFFIX = ".manifest.json"
+CONTEXT_SUFFIX = ".context.jsonl"
+COMPRESSION_EXTENSIONS = {"gzip": ".gz", "zstd": ".zst", "none": ""}
+
+# Hex digits of sha256 used as context keys (128 bits)
+CONTEXT_HASH_CHARS = 32
+
+def get_manifest_path(output_path: str) -> str:
+    """Manifest file kept beside a sharded dataset"""
+    return output_path + MANIFEST_SUFFIX
+
+def get_context_path(output_path: str) -> str:
+    """Context side table kept beside a dataset"""
+    return output_path + CONTEXT_SUFFIX
+
+def context_hash(text: str) -> str:
+    """Content address of a context block"""
+    return hashlib.sha256(text.encode()).hexdigest()[:CONTEXT_HASH_CHARS]
+
+def compact_prompt(prompt: str, blocks: Iterable[str], min_chars: int = 256) -> Tuple[Optional[list], Dict[str, str]]:
+    """
+    Replace context blocks inlined in a prompt with references
+
+    Blocks shorter than ``min_chars`` stay inline. Blocks are looked up
+    in order, each after the previous one.
+
+    Returns:
+        (promptParts, {hash: text}); promptParts is None when nothing was
+        replaced, otherwise a list of strings and {"ref": hash} dicts that
+        concatenate back to ``prompt``
+    """
+    parts: list = [prompt]
+    contexts: Dict[str, str] = {}
+    for block in blocks:
+        if len(block) < min_chars:
+            continue
+        before, found, after = parts[-1].partition(block)
+        if not found:
+            continue
+        key = context_hash(block)
+        parts[-1:] = [before, {"ref": key}, after]
+        contexts[key] = block
+    return (parts if contexts else None), contexts
+
+# Bytes a reference adds to a JSONL line over the inlined text
+_REFERENCE_OVERHEAD = (
+    len(json.dumps({"promptParts": ["", {"ref": "0" * CONTEXT_HASH_CHARS}, ""]}))
+    - len(json.dumps({"prompt": ""}))
+)
+
+class ContextTableWriter:
+    """
+    Append-only context side table
+
+    Each block is stored the first time its hash is seen. Byte counts are
+    UTF-8 bytes of uncompressed JSONL, for the compaction report. The table
+    is written to ``<path>.tmp`` and only replaces ``path`` on close().
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.tmp_path = path + ".tmp"
+        self.file = open(self.tmp_path, 'w')
+        self.seen = set()
+        self.references = 0
+        self.referenced_bytes = 0
+        self.stored_bytes = 0
+
+    def add(self, contexts: Dict[str, str]):
+        """Record the blocks referenced by one example"""
+        for key, text in contexts.items():
+            self.references += 1
+            self.referenced_bytes += len(json.dumps(text).encode("utf-8")) - 2
+            if key not in self.seen:
+                line = json.dumps({"hash": key, "text": text}) + '\n'
+                self.file.write(line)
+                self.stored_bytes += len(line.encode("utf-8"))
+                self.seen.add(key)
+
+    def report(self) -> Dict:
+        """Compaction report: references, unique blocks and bytes saved"""
+        return {
+            "references": self.references,
+            "uniqueBlocks": len(self.seen),
+            "referencedBytes": self.referenced_bytes,
+            "storedBytes": self.stored_bytes,
+            "bytesSaved": self.referenced_bytes - self.stored_bytes - self.references * _REFERENCE_OVERHEAD
+        }
+
+    def close(self) -> Dict:
+        self.file.close()
+        os.replace(self.tmp_path, self.path)
+        return self.report()
+
+    def abort(self):
+        self.file.close()
+        os.remove(self.tmp_path)
+
+class ContextTable:
+    """
+    Lazy, read-only view of a context side table
+
+    Only line offsets are indexed up front; a block's text is decoded on
+    first use and kept in an LRU of ``cache_size`` blocks.
+    """
+
+    def __init__(self, path: str, cache_size: int = 1024):
+        self.path = path
+        self.cache_size = cache_size
+        self._offsets: Optional[Dict[str, int]] = None
+        self._cache: "OrderedDict[str, str]" = OrderedDict()
+        self._file = None
+
+    def _index(self):
+        prefix = b'{"hash": "'
+        self._offsets = {}
+        self._file = open(self.path, 'rb')
+        offset = 0
+        for line in self._file:
+            if line.startswith(prefix):
+                self._offsets[line[len(prefix):len(prefix) + CONTEXT_HASH_CHARS].decode()] = offset
+            offset += len(line)
+
+    def get(self, key: str) -> str:
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            return self._cache[key]
+        if self._offsets is None:
+            self._index()
+        if key not in self._offsets:
+            raise KeyError(f"Context block {key} not in {self.path}")
+
+        self._file.seek(self._offsets[key])
+        text = json.loads(self._file.readline())["text"]
+        self._cache[key] = text
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return text
+
+    def resolve(self, example: dict) -> dict:
+        """Turn an example's promptParts back into its prompt (in place)"""
+        parts = example.pop("promptParts", None)
+        if parts is not None:
+            example["prompt"] = "".join(part if isinstance(part, str) else self.get(part["ref"]) for part in parts)
+        return example
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+
+def _zstandard():
+    try:
+        import zstandard
+    except ImportError:
+        raise ImportError("zstd compression needs the zstandard package (pip install zstandard)")
+    return zstandard
+
+class _HashingFile:
+    """Write-through file wrapper tracking sha256 and size of the bytes on disk"""
+
+    def __init__(self, path: str):
+        self.file = open(path, 'wb')
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data) -> int:
+        self.sha256.update(data)
+        self.size += len(data)
+        return self.file.write(data)
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+class ShardedJsonlWriter:
+    """
+    Write JSONL lines into compressed shards and a manifest
+
+    A new shard starts every ``shard_size`` lines (0 keeps one shard).
+    Checksums and sizes are computed while writing, so finishing a shard
+    costs no extra read. Shards are written to ``<shard>.tmp`` and only
+    renamed into place by close(), so a failed export leaves the previous
+    dataset whole. The manifest is written last, after any shards left
+    over from a previous, larger export have been removed.
+    """
+
+    def __init__(self, output_path: str, compression: str = "gzip", shard_size: int = 0, compression_level: int = 6):
+        if compression not in COMPRESSION_EXTENSIONS:
+            raise ValueError(f"Unknown compression: {compression}")
+        if compression == "zstd":
+            _zstandard()
+
+        self.output_path = output_path
+        self.compression = compression
+        self.shard_size = shard_size
+        self.compression_level = compression_level
+        self.directory = os.path.dirname(output_path) or "."
+        stem = os.path.basename(output_path)
+        self.stem = stem[:-len(".jsonl")] if stem.endswith(".jsonl") else stem
+
+        self.shards: List[Dict] = []
+        self.count = 0
+        self._raw: Optional[_HashingFile] = None
+        self._stream = None
+        self._shard_count = 0
+        self._shard_bytes = 0
+
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _open_shard(self):
+        name = f"{self.stem}-{len(self.shards):05d}.jsonl{COMPRESSION_EXTENSIONS[self.compression]}"
+        self._raw = _HashingFile(os.path.join(self.directory, name + ".tmp"))
+        if self.compression == "gzip":
+            # mtime=0 keeps identical exports byte-identical (and their checksums equal)
+            self._stream = gzip.GzipFile(filename="", mode='wb', fileobj=self._raw, compresslevel=self.compression_level, mtime=0)
+        elif self.compression == "zstd":
+            self._stream = _zstandard().ZstdCompressor(level=self.compression_level).stream_writer(self._raw, closefd=False)
+        else:
+            self._stream = self._raw
+        self.shards.append({"path": name})
+        self._shard_count = 0
+        self._shard_bytes = 0
+
+    def _close_shard(self):
+        if self._stream is not self._raw:
+            self._stream.close()
+        self._raw.close()
+        self.shards[-1].update({
+            "count": self._shard_count,
+            "bytes": self._raw.size,
+            "uncompressedBytes": self._shard_bytes,
+            "sha256": self._raw.sha256.hexdigest()
+        })
+        self._raw = self._stream = None
+
+    def write(self, line: str):
+        """Write one JSONL line (including its trailing newline)"""
+        if self._stream is None:
+            self._open_shard()
+        data = line.encode()
+        self._stream.write(data)
+        self._shard_count += 1
+        self._shard_bytes += len(data)
+        self.count += 1
+        if self.shard_size and self._shard_count >= self.shard_size:
+            self._close_shard()
+
+    def close(self, stats: Optional[Dict] = None) -> Dict:
+        """Finish the last shard and write the manifest (with optional stats)"""
+        if self._stream is not None:
+            self._close_shard()
+
+        for shard in self.shards:
+            path = os.path.join(self.directory, shard["path"])
+            os.replace(path + ".tmp", path)
+
+        manifest_path = get_manifest_path(self.output_path)
+        current = {shard["path"] for shard in self.shards}
+        for old in _manifest_shard_paths(manifest_path):
+            if os.path.basename(old) not in current and os.path.exists(old):
+                os.remove(old)
+        # A plain file from an earlier export would shadow nothing, but it is stale
+        if os.path.exists(self.output_path):
+            os.remove(self.output_path)
+
+        manifest = {
+            "version": 1,
+            "format": "jsonl",
+            "compression": self.compression,
+            "count": self.count,
+            "bytes": sum(shard["bytes"] for shard in self.shards),
+            "uncompressedBytes": sum(shard["uncompressedBytes"] for shard in self.shards),
+            "shards": self.shards,
+            "stats": stats or {},
+            "createdAt": datetime.now().isoformat()
+        }
+        tmp_path = manifest_path + ".tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(tmp_path, manifest_path)
+        return manifest
+
+    def abort(self):
+        """Close and delete the temporary shards (the previous dataset is untouched)"""
+        if self._stream is not None:
+            self._close_shard()
+        for shard in self.shards:
+            path = os.path.join(self.directory, shard["path"] + ".tmp")
+            if os.path.exists(path):
+                os.remove(path)
+        self.shards = []
+
+def _manifest_shard_paths(manifest_path: str) -> List[str]:
+    if not os.path.exists(manifest_path):
+        return []
+    with open(manifest_path, 'r') as f:
+        manifest = json.load(f)
+    directory = os.path.dirname(manifest_path) or "."
+    return [os.path.join(directory, shard["path"]) for shard in manifest["shards"]]
+
+def remove_sharded_output(output_path: str):
+    """Delete a sharded dataset (manifest and shards) written to output_path"""
+    manifest_path = get_manifest_path(output_path)
+    for path in _manifest_shard_paths(manifest_path):
+        if os.path.exists(path):
+            os.remove(path)
+    if os.path.exists(manifest_path):
+        os.remove(manifest_path)
+
+def _open_text(path: str):
+    if path.endswith(".gz"):
+        return gzip.open(path, 'rt')
+    if path.endswith(".zst"):
+        import io
+
+        return io.TextIOWrapper(_zstandard().ZstdDecompressor().stream_reader(open(path, 'rb'), closefd=True))
+    return open(path, 'r')
+
+def resolve_dataset(path: str) -> List[str]:
+    """Files making up the dataset at ``path`` (shards in order, or the file itself)"""
+    manifest_path = path if path.endswith(MANIFEST_SUFFIX) else get_manifest_path(path)
+    if os.path.exists(manifest_path):
+        return _manifest_shard_paths(manifest_path)
+    if os.path.exists(path):
+        return [path]
+    raise FileNotFoundError(f"Dataset not found: {path} (no file or {MANIFEST_SUFFIX})")
+
+def _dataset_path(path: str) -> str:
+    return path[:-len(MANIFEST_SUFFIX)] if path.endswith(MANIFEST_SUFFIX) else path
+
+def _iter_raw_examples(path: str) -> Iterator[dict]:
+    for file_path in resolve_dataset(path):
+        with _open_text(file_path) as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    yield json.loads(line)
+
+def read_examples(path: str) -> Iterator[dict]:
+    """Stream the examples of a plain, compressed or sharded JSONL dataset
+
+    Context references are resolved from ``<path>.context.jsonl``, which is
+    only opened once an example actually uses it.
+    """
+    context_path = get_context_path(_dataset_path(path))
+    table = None
+    try:
+        for example in _iter_raw_examples(path):
+            if "promptParts" in example:
+                if table is None:
+                    if not os.path.exists(context_path):
+                        raise FileNotFoundError(f"Context table not found: {context_path}")
+                    table = ContextTable(context_path)
+                table.resolve(example)
+            yield example
+    finally:
+        if table is not None:
+            table.close()
+
+def context_report(path: str) -> Dict:
+    """Compaction report of an existing dataset (see ContextTableWriter.report)"""
+    context_path = get_context_path(_dataset_path(path))
+    sizes = {}
+    if os.path.exists(context_path):
+        with open(context_path, 'rb') as f:
+            for line in f:
+                block = json.loads(line)
+                sizes[block["hash"]] = (len(json.dumps(block["text"]).encode("utf-8")) - 2, len(line))
+
+    references = referenced_bytes = 0
+    for example in _iter_raw_examples(path):
+        for part in example.get("promptParts", ()):
+            if isinstance(part, dict):
+                references += 1
+                referenced_bytes += sizes[part["ref"]][0]
+    stored_bytes = sum(stored for _, stored in sizes.values())
+    return {
+        "references": references,
+        "uniqueBlocks": len(sizes),
+        "referencedBytes": referenced_bytes,
+        "storedBytes": stored_bytes,
+        "bytesSaved": referenced_bytes - stored_bytes - references * _REFERENCE_OVERHEAD
+    }
+
+def print_context_report(report: Dict, total_bytes: Optional[int] = None):
+    """Print a compaction report; ``total_bytes`` is the compacted dataset size"""
+    saved = report["bytesSaved"]
+    line = (f"   Context table: {report['references']} references to {report['uniqueBlocks']} blocks, "
+            f"{saved / 1e6:.2f} MB saved")
+    if total_bytes:
+        line += f" ({100 * saved / (total_bytes + saved):.1f}% of uncompressed JSONL)"
+    print(line)
+
+def verify_manifest(path: str) -> List[str]:
+    """Check every shard's size and sha256 against the manifest; returns problems found"""
+    manifest_path = path if path.endswith(MANIFEST_SUFFIX) else get_manifest_path(path)
+    with open(manifest_path, 'r') as f:
+        manifest = json.load(f)
+
+    problems = []
+    directory = os.path.dirname(manifest_path) or "."
+    for shard in manifest["shards"]:
+        shard_path = os.path.join(directory, shard["path"])
+        if not os.path.exists(shard_path):
+            problems.append(f"{shard['path']}: missing")
+            continue
+        sha256 = hashlib.sha256()
+        with open(shard_path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                sha256.update(block)
+        if os.path.getsize(shard_path) != shard["bytes"]:
+            problems.append(f"{shard['path']}: size {os.path.getsize(shard_path)} != {shard['bytes']}")
+        elif sha256.hexdigest() != shard["sha256"]:
+            problems.append(f"{shard['path']}: sha256 mismatch")
+    return problems
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect sharded training datasets")
+    parser.add_argument("command", choices=["verify", "report"], help="Verify shard sizes and checksums, or report context compaction")
+    parser.add_argument("path", help="Dataset path (the export's --output) or its manifest")
+
+    args = parser.parse_args()
+
+    if args.command == "report":
+        report = context_report(args.path)
+        print(f"📊 {args.path}")
+        for key, value in report.items():
+            print(f"   {key}: {value}")
+        return
+
+    problems = verify_manifest(args.path)
+    if problems:
+        for problem in problems:
+            print(f"❌ {problem}")
+        sys.exit(1)
+    print(f"✅ All shards of {args.path} match the manifest")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,352 @@
+#!/usr/bin/env python3
+"""
+Local on-disk cache of the Decision table for training jobs
+
+Mirrors Decision rows into a SQLite file under training/data and keeps it
+current with delta syncs keyed on (updatedAt, id), re-reading a short
+lookback window before the watermark to catch late commits. Loaders and stats take
+the same filters as training.database, so repeated experiments run at
+disk speed and keep working when the production database is unreachable.
+
+Usage:
+    python decision_cache.py sync --agent-type ALL
+    python decision_cache.py stats --agent-type FILER
+"""
+import os
+import sqlite3
+import argparse
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, List, Optional, Sequence
+from dotenv import load_dotenv
+
+from training.database import (
+    AGENT_TYPES,
+    DECISION_FIELDS,
+    DecisionRecord,
+    iter_decision_rows_since,
+    row_to_decision,
+)
+
+load_dotenv()
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "decisions.sqlite")
+
+_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS decisions (
+        id TEXT PRIMARY KEY,
+        agent_type TEXT NOT NULL,
+        state TEXT,
+        action TEXT,
+        reward REAL,
+        reward_components TEXT,
+        confidence REAL,
+        reasoning TEXT,
+        user_feedback TEXT,
+        user_correction TEXT,
+        outcome_metrics TEXT,
+        item_id TEXT,
+        opus_id TEXT,
+        model_version TEXT,
+        created_at TEXT,
+        updated_at TEXT,
+        is_training_data INTEGER NOT NULL,
+        is_validation_data INTEGER NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS decisions_agent_created ON decisions (agent_type, created_at);
+    CREATE TABLE IF NOT EXISTS sync_state (
+        agent_type TEXT PRIMARY KEY,
+        updated_at TEXT NOT NULL,
+        id TEXT NOT NULL,
+        synced_at TEXT NOT NULL
+    );
+"""
+
+_STORED_FIELDS = DECISION_FIELDS + ["is_training_data", "is_validation_data"]
+
+def _sync_key(updated_at: str, decision_id: str) -> tuple:
+    """Sort key of a watermark; ISO strings with and without microseconds mix"""
+    return datetime.fromisoformat(updated_at), decision_id
+
+class DecisionCache:
+    """SQLite mirror of the Decision table"""
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript(_SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def sync(
+        self,
+        agent_types: Optional[Sequence[str]] = None,
+        page_size: int = 1000,
+        full: bool = False,
+        lookback_seconds: float = 60.0
+    ) -> Dict[str, int]:
+        """
+        Pull decisions changed since the last sync from Postgres
+
+        Args:
+            agent_types: Agent types to sync (default: all)
+            page_size: Rows fetched per keyset page
+            full: Re-read every row and then drop cached rows that were
+                not seen (picks up deletions, which delta syncs cannot
+                see); a failed full sync leaves the cache whole
+            lookback_seconds: Re-read this much before the watermark, so
+                rows whose transactions committed after a newer row was
+                synced are not skipped (upserts make re-reads harmless)
+
+        Returns:
+            Number of rows upserted per agent type
+        """
+        synced = {}
+        placeholders = ", ".join("?" for _ in _STORED_FIELDS)
+        insert = f"INSERT OR REPLACE INTO decisions ({', '.join(_STORED_FIELDS)}) VALUES ({placeholders})"
+
+        for agent_type in agent_types or AGENT_TYPES:
+            watermark = None
+            if full:
+                # Ids seen by this sync; rows missing from it are deleted once it succeeds
+                with self.conn:
+                    self.conn.execute("CREATE TEMP TABLE IF NOT EXISTS synced_ids (id TEXT PRIMARY KEY)")
+                    self.conn.execute("DELETE FROM synced_ids")
+            else:
+                watermark = self.conn.execute(
+                    "SELECT updated_at, id FROM sync_state WHERE agent_type = ?", (agent_type,)
+                ).fetchone()
+            after_updated_at = None
+            if watermark:
+                after_updated_at = (
+                    datetime.fromisoformat(watermark[0]) - timedelta(seconds=lookback_seconds)
+                ).isoformat()
+
+            count = 0
+            batch = []
+            for values in iter_decision_rows_since(agent_type, after_updated_at, page_size=page_size):
+                batch.append([values[name] for name in _STORED_FIELDS])
+                if len(batch) >= page_size:
+                    count += self._commit_page(insert, agent_type, batch, watermark, full)
+                    batch = []
+            if batch:
+                count += self._commit_page(insert, agent_type, batch, watermark, full)
+
+            if full:
+                with self.conn:
+                    self.conn.execute(
+                        "DELETE FROM decisions WHERE agent_type = ? AND id NOT IN (SELECT id FROM synced_ids)",
+                        (agent_type,)
+                    )
+                    if count == 0:
+                        self.conn.execute("DELETE FROM sync_state WHERE agent_type = ?", (agent_type,))
+                    self.conn.execute("DELETE FROM synced_ids")
+
+            synced[agent_type] = count
+
+        return synced
+
+    def _commit_page(
+        self,
+        insert: str,
+        agent_type: str,
+        rows: List[list],
+        watermark: Optional[tuple],
+        record_ids: bool = False
+    ) -> int:
+        """Upsert one page and advance the watermark in the same transaction
+
+        Pages re-read from the lookback window leave the watermark alone.
+        With ``record_ids``, the page's ids also go to synced_ids.
+        """
+        last = dict(zip(_STORED_FIELDS, rows[-1]))
+        with self.conn:
+            self.conn.executemany(insert, rows)
+            if record_ids:
+                id_index = _STORED_FIELDS.index("id")
+                self.conn.executemany("INSERT OR IGNORE INTO synced_ids (id) VALUES (?)", ((row[id_index],) for row in rows))
+            if watermark is None or _sync_key(last["updated_at"], last["id"]) > _sync_key(*watermark):
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO sync_state (agent_type, updated_at, id, synced_at) VALUES (?, ?, ?, ?)",
+                    (agent_type, last["updated_at"], last["id"], datetime.now().isoformat())
+                )
+        return len(rows)
+
+    @staticmethod
+    def _fields(columns: Optional[Sequence[str]]) -> List[str]:
+        if columns is None:
+            return list(DECISION_FIELDS)
+        unknown = set(columns) - set(DECISION_FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown Decision columns: {sorted(unknown)}")
+        wanted = set(columns) | {"id", "agent_type"}
+        return [name for name in DECISION_FIELDS if name in wanted]
+
+    def iter_training_decisions(
+        self,
+        agent_type: str,
+        max_samples: Optional[int] = None,
+        require_reward: bool = True,
+        require_feedback: bool = False,
+        min_reward: float = -2.0,
+        is_training_data: bool = True,
+        columns: Optional[Sequence[str]] = None
+    ) -> Iterator[DecisionRecord]:
+        """Stream cached decisions with the same filters and order as training.database"""
+        fields = self._fields(columns)
+
+        conditions = ["agent_type = ?", "is_training_data = ?"]
+        params: list = [agent_type, int(is_training_data)]
+        if require_reward:
+            conditions += ["reward IS NOT NULL", "reward >= ?"]
+            params.append(min_reward)
+        if require_feedback:
+            conditions.append("user_feedback IS NOT NULL")
+
+        sql = f"""
+            SELECT {', '.join(fields)}
+            FROM decisions
+            WHERE {' AND '.join(conditions)}
+            ORDER BY created_at DESC, id DESC
+        """
+        if max_samples is not None:
+            sql += " LIMIT ?"
+            params.append(max_samples)
+
+        for row in self.conn.execute(sql, params):
+            yield row_to_decision(row, fields)
+
+    def iter_training_decisions_for_agents(
+        self,
+        agents: Dict[str, Dict],
+        require_reward: bool = True,
+        require_feedback: bool = False,
+        is_training_data: bool = True,
+        columns: Optional[Sequence[str]] = None
+    ) -> Iterator[DecisionRecord]:
+        """Stream cached decisions of several agents in one scan (see training.database)"""
+        fields = self._fields(columns)
+
+        conditions = ["is_training_data = ?"]
+        params: list = [int(is_training_data)]
+        if require_feedback:
+            conditions.append("user_feedback IS NOT NULL")
+        agent_conditions = []
+        for agent_type, filters in agents.items():
+            if require_reward:
+                agent_conditions.append("(agent_type = ? AND reward IS NOT NULL AND reward >= ?)")
+                params += [agent_type, filters.get("min_reward", -2.0)]
+            else:
+                agent_conditions.append("agent_type = ?")
+                params.append(agent_type)
+        conditions.append(f"({' OR '.join(agent_conditions)})")
+
+        limit_conditions = []
+        for agent_type, filters in agents.items():
+            if filters.get("max_samples") is None:
+                limit_conditions.append("agent_type = ?")
+                params.append(agent_type)
+            else:
+                limit_conditions.append("(agent_type = ? AND agent_rank <= ?)")
+                params += [agent_type, filters["max_samples"]]
+
+        sql = f"""
+            SELECT {', '.join(fields)}
+            FROM (
+                SELECT *, row_number() OVER (
+                    PARTITION BY agent_type ORDER BY created_at DESC, id DESC
+                ) AS agent_rank
+                FROM decisions
+                WHERE {' AND '.join(conditions)}
+            )
+            WHERE {' OR '.join(limit_conditions)}
+            ORDER BY created_at DESC, id DESC
+        """
+        for row in self.conn.execute(sql, params):
+            yield row_to_decision(row, fields)
+
+    def load_training_decisions(
+        self,
+        agent_type: str,
+        max_samples: int = 1000,
+        require_reward: bool = True,
+        require_feedback: bool = False,
+        min_reward: float = -2.0,
+        is_training_data: bool = True,
+        columns: Optional[Sequence[str]] = None
+    ) -> List[DecisionRecord]:
+        """Load cached decisions (see training.database.load_training_decisions)"""
+        return list(self.iter_training_decisions(
+            agent_type,
+            max_samples=max_samples,
+            require_reward=require_reward,
+            require_feedback=require_feedback,
+            min_reward=min_reward,
+            is_training_data=is_training_data,
+            columns=columns
+        ))
+
+    def get_training_stats(self, agent_type: str) -> Dict:
+        """Statistics about cached training data (see training.database.get_training_stats)"""
+        row = self.conn.execute("""
+            SELECT
+                COUNT(*),
+                COUNT(reward),
+                COUNT(user_feedback),
+                AVG(reward),
+                MIN(reward),
+                MAX(reward),
+                SUM(is_training_data),
+                SUM(is_validation_data)
+            FROM decisions
+            WHERE agent_type = ?
+        """, (agent_type,)).fetchone()
+
+        return {
+            "total_decisions": row[0],
+            "decisions_with_reward": row[1],
+            "decisions_with_feedback": row[2],
+            "avg_reward": float(row[3]) if row[3] is not None else None,
+            "min_reward": float(row[4]) if row[4] is not None else None,
+            "max_reward": float(row[5]) if row[5] is not None else None,
+            "training_data_count": row[6] or 0,
+            "validation_data_count": row[7] or 0
+        }
+
+    def last_synced(self, agent_type: str) -> Optional[str]:
+        """When the agent type was last synced (None if never)"""
+        row = self.conn.execute(
+            "SELECT synced_at FROM sync_state WHERE agent_type = ?", (agent_type,)
+        ).fetchone()
+        return row[0] if row else None
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the local Decision cache")
+    parser.add_argument("command", choices=["sync", "stats"], help="Sync deltas from Postgres or show cached stats")
+    parser.add_argument("--agent-type", default="ALL", choices=["ALL"] + AGENT_TYPES, help="Agent type")
+    parser.add_argument("--cache", default=DEFAULT_CACHE_PATH, help="SQLite cache path")
+    parser.add_argument("--page-size", type=int, default=1000, help="Rows fetched per keyset page")
+    parser.add_argument("--full", action="store_true", help="Re-read every row and drop rows deleted upstream")
+    parser.add_argument("--lookback-seconds", type=float, default=60.0, help="Re-read this much before the watermark when syncing")
+
+    args = parser.parse_args()
+    agent_types = AGENT_TYPES if args.agent_type == "ALL" else [args.agent_type]
+    cache = DecisionCache(args.cache)
+
+    if args.command == "sync":
+        print(f"🔄 Syncing decisions into {args.cache}...")
+        synced = cache.sync(agent_types, page_size=args.page_size, full=args.full, lookback_seconds=args.lookback_seconds)
+        for agent_type, count in synced.items():
+            print(f"   {agent_type}: {count} rows")
+        print("✅ Cache up to date!")
+    else:
+        for agent_type in agent_types:
+            print(f"📊 {agent_type} (synced {cache.last_synced(agent_type) or 'never'})")
+            for key, value in cache.get_training_stats(agent_type).items():
+                print(f"   {key}: {value}")
+
+    cache.close()
+
+if __name__ == "__main__":
+    main()
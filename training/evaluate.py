@@ -13,22 +13,24 @@ import torch
 from transformers import AutoModelForCausalLM, AutoTokenizer, BitsAndBytesConfig
 from peft import PeftModel
 from dotenv import load_dotenv
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 import numpy as np
 
+from training.dataset_io import get_manifest_path, read_examples
+from training.token_shards import TokenShards
+
 load_dotenv()
 
+# Prompts are truncated to this many tokens (token shards must match)
+MAX_PROMPT_LENGTH = 1024
+
 def load_test_data(filepath: str) -> List[Dict[str, Any]]:
-    """Load test data from JSONL file"""
-    if not os.path.exists(filepath):
+    """Load test data from a JSONL file or sharded export"""
+    if not os.path.exists(filepath) and not os.path.exists(get_manifest_path(filepath)):
         raise FileNotFoundError(f"Test data file not found: {filepath}")
     
-    test_examples = []
-    with open(filepath, 'r') as f:
-        for line in f:
-            line = line.strip()
-            if line:
-                test_examples.append(json.loads(line))
+    # Plain JSONL, .gz/.zst, or the shards listed in <filepath>.manifest.json
+    test_examples = list(read_examples(filepath))
     
     print(f"✅ Loaded {len(test_examples)} test examples from {filepath}")
     return test_examples
@@ -92,15 +94,19 @@ def load_model(model_path: str, base_model: str = None, use_quantization: bool =
     model.eval()
     return model, tokenizer
 
-def generate_response(model, tokenizer, prompt: str, max_new_tokens: int = 256) -> str:
-    """Generate response from model"""
-    # Tokenize input
-    inputs = tokenizer(
-        prompt,
-        return_tensors="pt",
-        truncation=True,
-        max_length=1024
-    )
+def generate_response(model, tokenizer, prompt: Optional[str], max_new_tokens: int = 256, input_ids: Optional[np.ndarray] = None) -> str:
+    """Generate response from model (from pre-tokenized input_ids if given)"""
+    if input_ids is not None:
+        ids = torch.from_numpy(input_ids.astype(np.int64)).unsqueeze(0)
+        inputs = {"input_ids": ids, "attention_mask": torch.ones_like(ids)}
+    else:
+        # Tokenize input
+        inputs = tokenizer(
+            prompt,
+            return_tensors="pt",
+            truncation=True,
+            max_length=MAX_PROMPT_LENGTH
+        )
     
     # Move to device
     device = next(model.parameters()).device
@@ -158,12 +164,12 @@ def evaluate_filer(model, tokenizer, test_data: List[Dict[str, Any]]) -> Dict[st
     errors = []
     
     for i, example in enumerate(test_data):
-        prompt = example["prompt"]
+        prompt = example.get("prompt")
         expected = example.get("completion", {})
         expected_reward = example.get("reward", 0.0)
         
         # Generate response
-        response_text = generate_response(model, tokenizer, prompt, max_new_tokens=128)
+        response_text = generate_response(model, tokenizer, prompt, max_new_tokens=128, input_ids=example.get("input_ids"))
         parsed = parse_filer_response(response_text)
         
         # Compare with expected (if available)
@@ -177,7 +183,7 @@ def evaluate_filer(model, tokenizer, test_data: List[Dict[str, Any]]) -> Dict[st
         if "error" in parsed:
             errors.append({
                 "index": i,
-                "prompt": prompt[:100],
+                "prompt": (prompt or tokenizer.decode(example["input_ids"], skip_special_tokens=True))[:100],
                 "response": response_text[:200],
                 "error": parsed["error"]
             })
@@ -207,12 +213,12 @@ def evaluate_prioritizer(model, tokenizer, test_data: List[Dict[str, Any]]) -> D
     errors = []
     
     for i, example in enumerate(test_data):
-        prompt = example["prompt"]
+        prompt = example.get("prompt")
         expected = example.get("completion", {})
         expected_reward = example.get("reward", 0.0)
         
         # Generate response
-        response_text = generate_response(model, tokenizer, prompt, max_new_tokens=256)
+        response_text = generate_response(model, tokenizer, prompt, max_new_tokens=256, input_ids=example.get("input_ids"))
         parsed = parse_prioritizer_response(response_text)
         
         # Compare with expected (if available)
@@ -226,7 +232,7 @@ def evaluate_prioritizer(model, tokenizer, test_data: List[Dict[str, Any]]) -> D
         if "error" in parsed:
             errors.append({
                 "index": i,
-                "prompt": prompt[:100],
+                "prompt": (prompt or tokenizer.decode(example["input_ids"], skip_special_tokens=True))[:100],
                 "response": response_text[:200],
                 "error": parsed["error"]
             })
@@ -249,7 +255,9 @@ def evaluate_prioritizer(model, tokenizer, test_data: List[Dict[str, Any]]) -> D
 def main():
     parser = argparse.ArgumentParser(description="Evaluate trained model")
     parser.add_argument("--model", required=True, help="Path to trained model directory")
-    parser.add_argument("--test-data", required=True, help="Path to test data JSONL file")
+    data_source = parser.add_mutually_exclusive_group(required=True)
+    data_source.add_argument("--test-data", help="Path to test data JSONL file")
+    data_source.add_argument("--token-shards", help="Pre-tokenized test shard directory from export_training_data.py --tokenizer")
     parser.add_argument("--base-model", help="Base model name (auto-detected if not provided)")
     parser.add_argument("--agent-type", default="FILER", choices=["FILER", "PRIORITIZER", "LIBRARIAN"], help="Agent type")
     parser.add_argument("--output", help="Output file for evaluation results (JSON)")
@@ -265,7 +273,12 @@ def main():
     
     # Load test data
     print(f"\n📥 Loading test data...")
-    test_data = load_test_data(args.test_data)
+    if args.token_shards:
+        test_data = TokenShards(args.token_shards)
+        test_data.check_layout(args.agent_type, MAX_PROMPT_LENGTH)
+        print(f"✅ Opened {len(test_data)} pre-tokenized test examples from {args.token_shards}")
+    else:
+        test_data = load_test_data(args.test_data)
     
     if len(test_data) == 0:
         print("❌ No test data found!")
@@ -274,6 +287,8 @@ def main():
     # Load model
     print(f"\n🤖 Loading model...")
     model, tokenizer = load_model(args.model, args.base_model, use_quantization=not args.no_quantization)
+    if args.token_shards:
+        test_data.check_tokenizer(tokenizer)
     
     # Evaluate
     if args.agent_type == "FILER":
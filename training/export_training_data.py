@@ -4,109 +4,937 @@ Export training data from Decision table for M1 training
 
 Usage:
     python export_training_data.py --agent-type FILER --output training/data/filer.jsonl --limit 1000
+    python export_training_data.py --agent-type FILER --output training/data/filer.jsonl --incremental
+    python export_training_data.py --agent-type FILER --output training/data/filer.jsonl --compression gzip --shard-size 50000
+    python export_training_data.py --agent-type ALL --output training/data --limit 5000 --agent-limit FILER=20000
 """
 import os
 import sys
+import time
 import argparse
 import json
+import hashlib
+import pickle
+import tempfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple, Union
 from dotenv import load_dotenv
 
-from training.database import load_training_decisions
-from training.prompts import format_prompt_for_agent, get_system_prompt
+from training.database import (
+    DecisionRecord,
+    copy_training_decisions,
+    copy_training_decisions_for_agents,
+    iter_changed_decisions,
+    iter_training_decisions,
+    iter_training_decisions_for_agents,
+    print_pool_stats,
+)
+from training.dataset_io import (
+    ContextTableWriter,
+    ShardedJsonlWriter,
+    compact_prompt,
+    get_context_path,
+    get_manifest_path,
+    print_context_report,
+    read_examples,
+    remove_sharded_output,
+)
+from training.decision_cache import DEFAULT_CACHE_PATH, DecisionCache
+from training.prompts import PromptCache, format_prompt_for_agent, get_context_blocks, get_system_prompt
+from training.reward_calculator import RewardStats, get_reward_stats_path, load_reward_stats, save_reward_stats
+from training.token_shards import TokenShardWriter, load_tokenizer, write_token_shards
 
 load_dotenv()
 
-def export_training_data(agent_type: str, output_path: str, limit: int = 1000, min_reward: float = -2.0, require_feedback: bool = False):
-    """Export training data to JSONL file"""
+# Agent types exported by --agent-type ALL
+EXPORT_AGENT_TYPES = ["FILER", "LIBRARIAN", "PRIORITIZER", "STORER", "RETRIEVER"]
+
+# Decision columns read by build_training_example
+EXPORT_COLUMNS = [
+    "state", "action", "reward", "confidence", "user_feedback",
+    "reward_components", "item_id", "opus_id", "created_at",
+]
+
+def build_training_example(agent_type: str, decision: DecisionRecord, prompt: Optional[str] = None, tokenizer=None, max_tokens: Optional[int] = None) -> dict:
+    """Build a training example from a decision (``prompt`` if already formatted, else fitted to ``max_tokens`` if given)"""
+    # Format prompt
+    if prompt is None:
+        prompt = format_prompt_for_agent(agent_type, decision.state, tokenizer, max_tokens)
+    
+    # Format completion from action
+    completion = json.dumps(decision.action)
+    
+    return {
+        "prompt": prompt,
+        "completion": completion,
+        "reward": decision.reward or 0.0,
+        "confidence": decision.confidence,
+        "metadata": {
+            "decisionId": decision.id,
+            "itemId": decision.item_id,
+            "opusId": decision.opus_id,
+            "userFeedback": decision.user_feedback,
+            "rewardComponents": decision.reward_components,
+            "createdAt": decision.created_at
+        }
+    }
+
+class FormattedExample(NamedTuple):
+    """One serialized example and what the writers need to know about it"""
+    agent_type: str
+    line: str
+    reward: float
+    user_feedback: Optional[str]
+    decision_id: str
+    example: Optional[dict] = None  # Full example (with prompt), when kept
+    contexts: Optional[Dict[str, str]] = None  # hash -> text of referenced context blocks
+    key: Optional[str] = None  # Identity of the (agent, prompt, completion) triple
+    prompt_cached: Optional[bool] = None  # Prompt came from the PromptCache
+
+# Per-process prompt cache and (tokenizer, max_tokens) prompt budget used by
+# _format_chunk (each pool worker has its own, set up by _init_format_worker)
+_prompt_cache: Optional[PromptCache] = None
+_prompt_budget: Tuple = (None, None)
+
+def _init_format_worker(tokenizer=None, max_tokens: Optional[int] = None):
+    global _prompt_cache, _prompt_budget
+    _prompt_cache = None  # Start every export cold, so hit rates describe this run
+    _prompt_budget = (tokenizer, max_tokens) if max_tokens is not None else (None, None)
+
+def _get_prompt_cache(max_size: int) -> PromptCache:
+    global _prompt_cache
+    if _prompt_cache is None or _prompt_cache.max_size != max_size:
+        _prompt_cache = PromptCache(max_size, *_prompt_budget)
+    return _prompt_cache
+
+def _stats_for(whiten_stats, agent_type: str) -> Optional[RewardStats]:
+    return whiten_stats.get(agent_type) if isinstance(whiten_stats, dict) else whiten_stats
+
+def _format_chunk(args: Tuple) -> List[FormattedExample]:
+    """Build and serialize the examples for one chunk of decisions (runs in a worker)"""
+    agent_type, decisions, whiten_stats, keep_examples, context_min_chars, prompt_cache_size, exact_keys = args
+    cache = _get_prompt_cache(prompt_cache_size) if prompt_cache_size else None
+    formatted = []
+    for decision in decisions:
+        decision_agent = agent_type or decision.agent_type
+        prompt = digest = cached = None
+        if cache is not None:
+            prompt, digest, cached = cache.lookup_decision(decision_agent, decision)
+        example = build_training_example(decision_agent, decision, prompt, *_prompt_budget)
+        stats = _stats_for(whiten_stats, decision_agent)
+        if stats is not None:
+            example["whitenedReward"] = stats.whiten(example["reward"])
+        
+        key = None
+        if exact_keys:
+            digest = digest or hashlib.sha256(example["prompt"].encode()).hexdigest()
+            key = hashlib.sha256(f"{decision_agent}\0{digest}\0{example['completion']}".encode()).hexdigest()
+        
+        stored, contexts = example, None
+        if context_min_chars is not None:
+            parts, contexts = compact_prompt(
+                example["prompt"], get_context_blocks(decision_agent, decision.state), context_min_chars
+            )
+            if parts is not None:
+                stored = {"promptParts": parts, **{name: value for name, value in example.items() if name != "prompt"}}
+        
+        formatted.append(FormattedExample(
+            agent_type=decision_agent,
+            line=json.dumps(stored) + '\n',
+            reward=example["reward"],
+            user_feedback=decision.user_feedback,
+            decision_id=decision.id,
+            example=example if keep_examples else None,
+            contexts=contexts or None,
+            key=key,
+            prompt_cached=cached
+        ))
+    return formatted
+
+def iter_formatted_examples(
+    agent_type: Optional[str],
+    decisions: Iterable[DecisionRecord],
+    workers: int = 1,
+    chunk_size: int = 256,
+    whiten_stats: Optional[Union[RewardStats, Dict[str, RewardStats]]] = None,
+    keep_examples: bool = False,
+    context_min_chars: Optional[int] = None,
+    prompt_cache_size: int = 4096,
+    exact_keys: bool = False,
+    tokenizer=None,
+    prompt_tokens: Optional[int] = None
+) -> Iterator[FormattedExample]:
+    """
+    Turn decisions into serialized JSONL lines, in input order
+    
+    With ``workers`` > 1 the stream is cut into chunks of ``chunk_size``
+    that a process pool formats (prompt formatting, JSON decoding of the
+    lazily loaded state and json.dumps all happen in the workers). At most
+    two chunks per worker are in flight, so memory stays bounded however
+    fast the reader is, and results are yielded oldest chunk first.
+    
+    With ``agent_type`` None, each decision is formatted for its own agent
+    type, and ``whiten_stats`` may map agent type -> RewardStats. With
+    ``context_min_chars``, shared context blocks of at least that many
+    characters are replaced by references (see dataset_io.compact_prompt).
+    Prompts go through a PromptCache of ``prompt_cache_size`` entries per
+    process (0 disables it). With ``exact_keys``, every example gets the
+    key ExactDuplicateFilter groups on. With ``prompt_tokens``, prompts
+    are fitted to that many tokens of ``tokenizer`` (see prompts.TokenBudget).
+    """
+    args = (whiten_stats, keep_examples, context_min_chars, prompt_cache_size, exact_keys)
+    decisions = iter(decisions)
+    chunks = iter(lambda: list(islice(decisions, chunk_size)), [])
+    
+    if workers <= 1:
+        _init_format_worker(tokenizer, prompt_tokens)
+        for chunk in chunks:
+            yield from _format_chunk((agent_type, chunk, *args))
+        return
+    
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_format_worker, initargs=(tokenizer, prompt_tokens)) as executor:
+        in_flight = deque()
+        for chunk in chunks:
+            in_flight.append(executor.submit(_format_chunk, (agent_type, chunk, *args)))
+            if len(in_flight) >= 2 * workers:
+                yield from in_flight.popleft().result()
+        while in_flight:
+            yield from in_flight.popleft().result()
+
+class ExactDuplicateFilter:
+    """
+    Count identical (agent, prompt, completion) examples once
+    
+    Examples are grouped on FormattedExample.key (see
+    iter_formatted_examples with ``exact_keys``). The first example of a
+    group is kept, with the mean reward of the group (re-whitened when
+    ``whiten_stats`` is given) and the group size and other decision ids
+    in its metadata; examples come out in order of first appearance.
+    
+    Groups are only complete at the end of the stream, so filtering takes
+    two passes: the first spools each group's first example to a temporary
+    file in ``spool_dir`` and keeps only the key digest, running reward
+    sum and duplicate ids in memory; the second reads the spool back and
+    applies the merged rewards.
+    """
+    
+    def __init__(self, whiten_stats: Optional[Union[RewardStats, Dict[str, RewardStats]]] = None, spool_dir: Optional[str] = None):
+        self.whiten_stats = whiten_stats
+        self.spool_dir = spool_dir
+        self.groups: Dict[bytes, list] = {}  # key digest -> [count, reward sum, duplicate ids]
+        self.seen = 0
     
-    print(f"📊 Loading training decisions for {agent_type}...")
-    decisions = load_training_decisions(
+    @property
+    def duplicates(self) -> int:
+        """Examples dropped so far as duplicates of an earlier one"""
+        return self.seen - len(self.groups)
+    
+    def add(self, item: FormattedExample) -> bool:
+        """Record one example; True if it is the first of its group"""
+        self.seen += 1
+        digest = bytes.fromhex(item.key)
+        group = self.groups.get(digest)
+        if group is None:
+            self.groups[digest] = [1, item.reward, []]
+            return True
+        group[0] += 1
+        group[1] += item.reward
+        group[2].append(item.decision_id)
+        return False
+    
+    def _merged(self, item: FormattedExample) -> FormattedExample:
+        count, reward_sum, duplicate_ids = self.groups[bytes.fromhex(item.key)]
+        if not duplicate_ids:
+            return item
+        
+        reward = reward_sum / count
+        stored = json.loads(item.line)
+        for example in (stored, item.example):
+            if example is None:
+                continue
+            example["reward"] = reward
+            stats = _stats_for(self.whiten_stats, item.agent_type)
+            if stats is not None:
+                example["whitenedReward"] = stats.whiten(reward)
+            example["metadata"]["duplicateCount"] = count
+            example["metadata"]["duplicateDecisionIds"] = duplicate_ids
+        return item._replace(line=json.dumps(stored) + '\n', reward=reward)
+    
+    def filter(self, items: Iterable[FormattedExample]) -> Iterator[FormattedExample]:
+        """Consume ``items`` and yield one merged example per distinct key"""
+        with tempfile.TemporaryFile(dir=self.spool_dir) as spool:
+            kept = 0
+            for item in items:
+                if self.add(item):
+                    pickle.dump(tuple(item), spool, protocol=pickle.HIGHEST_PROTOCOL)
+                    kept += 1
+            
+            spool.seek(0)
+            for _ in range(kept):
+                yield self._merged(FormattedExample(*pickle.load(spool)))
+
+def _count_prompt_cache(items: Iterable[FormattedExample], counts: Dict[str, int]) -> Iterator[FormattedExample]:
+    for item in items:
+        if item.prompt_cached is not None:
+            counts["hits" if item.prompt_cached else "misses"] += 1
+        yield item
+
+def _print_dedup_summary(cache_counts: Dict[str, int], dedup: Optional[ExactDuplicateFilter]):
+    lookups = cache_counts["hits"] + cache_counts["misses"]
+    if lookups:
+        print(f"   Prompt cache: {cache_counts['hits']}/{lookups} hits ({100 * cache_counts['hits'] / lookups:.1f}%)")
+    if dedup is not None:
+        print(f"   Exact duplicates: {dedup.duplicates} of {dedup.seen} examples merged into earlier ones")
+
+class ExportWriter:
+    """
+    One agent's output: the JSONL file (or compressed shards), optional
+    token shards, and the statistics accumulated while writing
+    """
+    
+    def __init__(self, agent_type: str, output_path: str, compression: str = "none", shard_size: int = 0, tokenizer=None, shard_dir: Optional[str] = None, max_length: int = 512, dedup_context: bool = False):
+        self.agent_type = agent_type
+        self.output_path = output_path
+        self.compression = compression
+        self.sharded = compression != "none" or shard_size > 0
+        self.reward_stats = RewardStats()
+        self.confirmed_count = 0
+        self.corrected_count = 0
+        self.bytes_written = 0
+        self.manifest = None
+        self.index = None
+        self.context_report = None
+        
+        # Ensure output directory exists
+        os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+        
+        if self.sharded:
+            self.out = ShardedJsonlWriter(output_path, compression=compression, shard_size=shard_size)
+        else:
+            # Moved into place by close(), so a failed or empty export
+            # leaves the previous dataset untouched
+            self.tmp_path = output_path + ".tmp"
+            self.out = open(self.tmp_path, 'w')
+        
+        self.context_writer = ContextTableWriter(get_context_path(output_path)) if dedup_context else None
+        
+        self.shard_dir = None
+        self.shard_writer = None
+        if tokenizer is not None:
+            self.shard_dir = shard_dir or output_path + ".shards"
+            self.shard_writer = TokenShardWriter(self.shard_dir, tokenizer, agent_type, max_length=max_length)
+    
+    def write(self, line: str, reward: float, user_feedback: Optional[str], example: Optional[dict] = None, contexts: Optional[Dict[str, str]] = None):
+        self.out.write(line)
+        self.bytes_written += len(line.encode("utf-8"))
+        if contexts:
+            self.context_writer.add(contexts)
+        if self.shard_writer is not None:
+            self.shard_writer.add(example)
+        
+        self.reward_stats.update(reward)
+        if user_feedback == "CONFIRMED":
+            self.confirmed_count += 1
+        elif user_feedback == "CORRECTED":
+            self.corrected_count += 1
+    
+    @property
+    def count(self) -> int:
+        return self.reward_stats.count
+    
+    def abort(self):
+        """Discard what was written (used for failed or empty exports)"""
+        if self.sharded:
+            self.out.abort()
+        else:
+            self.out.close()
+            os.remove(self.tmp_path)
+        if self.context_writer is not None:
+            self.context_writer.abort()
+    
+    def close(self) -> Dict:
+        """Finish the files, save reward stats and return the export summary"""
+        summary = {
+            "count": self.count,
+            "avg_reward": self.reward_stats.mean,
+            "reward_std": self.reward_stats.std,
+            "min_reward": self.reward_stats.min,
+            "max_reward": self.reward_stats.max,
+            "confirmed_count": self.confirmed_count,
+            "corrected_count": self.corrected_count
+        }
+        if self.context_writer is not None:
+            self.context_report = summary["context"] = self.context_writer.close()
+        if self.sharded:
+            self.manifest = self.out.close(stats=summary)
+        else:
+            self.out.close()
+            os.replace(self.tmp_path, self.output_path)
+            # A plain export replaces any sharded export previously written here
+            remove_sharded_output(self.output_path)
+        if self.context_writer is None:
+            context_path = get_context_path(self.output_path)
+            if os.path.exists(context_path):
+                os.remove(context_path)
+        
+        save_reward_stats(get_reward_stats_path(self.output_path), {self.agent_type: self.reward_stats})
+        if self.shard_writer is not None:
+            self.index = self.shard_writer.close()
+        return summary
+    
+    def print_summary(self):
+        count = self.count
+        reward_stats = self.reward_stats
+        print(f"   Average reward: {reward_stats.mean:.3f} (std {reward_stats.std:.3f}, median {reward_stats.quantile(0.5):.3f})")
+        print(f"   Reward range: [{reward_stats.min:.3f}, {reward_stats.max:.3f}]")
+        print(f"   Confirmed: {self.confirmed_count}/{count} ({100 * self.confirmed_count / count:.1f}%)")
+        print(f"   Corrected: {self.corrected_count}/{count} ({100 * self.corrected_count / count:.1f}%)")
+        print(f"   Reward stats: {get_reward_stats_path(self.output_path)}")
+        if self.manifest is not None:
+            manifest = self.manifest
+            ratio = manifest["uncompressedBytes"] / manifest["bytes"] if manifest["bytes"] else 1.0
+            print(f"   Shards: {len(manifest['shards'])} ({self.compression}, {manifest['bytes'] / 1e6:.1f} MB, {ratio:.1f}x), manifest {get_manifest_path(self.output_path)}")
+        if self.context_report is not None:
+            print_context_report(self.context_report, self.bytes_written + self.context_report["storedBytes"])
+        if self.index is not None:
+            print(f"   Token shards: {self.shard_dir} ({self.index['tokens']} tokens in {len(self.index['shards'])} shards)")
+
+def _stream_decisions(agent_type: str, limit: Optional[int], min_reward: float, require_feedback: bool, fetch_size: int, backend: str, cache_path: Optional[str], sync_cache: bool) -> Iterator[DecisionRecord]:
+    """Open the decision stream for one agent type on the chosen backend"""
+    if backend == "cache":
+        cache = _open_cache(cache_path, [agent_type], sync_cache, fetch_size)
+        return cache.iter_training_decisions(
+            agent_type=agent_type,
+            max_samples=limit,
+            require_reward=True,
+            require_feedback=require_feedback,
+            min_reward=min_reward,
+            columns=EXPORT_COLUMNS
+        )
+    elif backend == "copy":
+        return copy_training_decisions(
+            agent_type=agent_type,
+            max_samples=limit,
+            require_reward=True,
+            require_feedback=require_feedback,
+            min_reward=min_reward,
+            columns=EXPORT_COLUMNS
+        )
+    return iter_training_decisions(
         agent_type=agent_type,
         max_samples=limit,
         require_reward=True,
         require_feedback=require_feedback,
-        min_reward=min_reward
+        min_reward=min_reward,
+        fetch_size=fetch_size,
+        columns=EXPORT_COLUMNS
     )
+
+def _open_cache(cache_path: Optional[str], agent_types: List[str], sync_cache: bool, fetch_size: int) -> DecisionCache:
+    cache = DecisionCache(cache_path or DEFAULT_CACHE_PATH)
+    if sync_cache:
+        try:
+            synced = cache.sync(agent_types, page_size=fetch_size)
+            print(f"   Synced {sum(synced.values())} changed decisions into {cache.path}")
+        except Exception as e:
+            print(f"⚠️  Cache sync failed ({e}), using cached data from {cache.last_synced(agent_types[0]) or 'never'}")
+    return cache
+
+def export_training_data(agent_type: str, output_path: str, limit: int = 1000, min_reward: float = -2.0, require_feedback: bool = False, fetch_size: int = 1000, backend: str = "cursor", cache_path: Optional[str] = None, sync_cache: bool = False, whiten_stats: Optional[RewardStats] = None, tokenizer=None, shard_dir: Optional[str] = None, max_length: int = 512, workers: int = 1, compression: str = "none", shard_size: int = 0, context_min_chars: Optional[int] = None, prompt_cache_size: int = 4096, dedup_exact: bool = False, prompt_tokens: Optional[int] = None):
+    """Export training data to JSONL file
     
-    print(f"   Loaded {len(decisions)} decisions")
+    Decisions are streamed (from a server-side cursor, from COPY with
+    backend="copy", or from the local DecisionCache with backend="cache")
+    and written as they arrive, so memory use does not grow with the
+    number of examples. Reward statistics are accumulated on the way and
+    saved to ``<output>.reward_stats.json``. With ``whiten_stats`` (e.g.
+    the statistics of a previous export), each example also gets a
+    ``whitenedReward``. With ``tokenizer``, prompts are also tokenized into
+    memory-mapped shards in ``shard_dir`` (see token_shards.py). With
+    ``workers`` > 1, prompts are formatted and serialized in a process pool
+    (see iter_formatted_examples). With ``compression`` ("gzip" or "zstd")
+    or ``shard_size``, the examples go to compressed shards described by
+    ``<output>.manifest.json`` (see dataset_io.py) instead of one file.
+    With ``context_min_chars``, opus content blocks at least that long are
+    stored once in ``<output>.context.jsonl`` and referenced by hash.
+    Prompts are memoized per canonical state (``prompt_cache_size``
+    entries), and with ``dedup_exact`` identical prompt/completion pairs
+    are written once with their mean reward (see ExactDuplicateFilter).
+    With ``prompt_tokens``, prompts are fitted to that many tokens of
+    ``tokenizer`` instead of fixed character limits (see prompts.TokenBudget).
+    """
+    
+    print(f"📊 Streaming training decisions for {agent_type} ({backend})...")
+    decisions = _stream_decisions(agent_type, limit, min_reward, require_feedback, fetch_size, backend, cache_path, sync_cache)
+    
+    writer = ExportWriter(
+        agent_type, output_path, compression=compression, shard_size=shard_size,
+        tokenizer=tokenizer, shard_dir=shard_dir, max_length=max_length,
+        dedup_context=context_min_chars is not None
+    )
+    started = time.perf_counter()
     
-    if len(decisions) == 0:
+    # Write JSONL, accumulating every statistic in the same pass
+    print(f"💾 Writing examples to {output_path}" + (f" ({workers} workers)..." if workers > 1 else "..."))
+    cache_counts = {"hits": 0, "misses": 0}
+    formatted = _count_prompt_cache(iter_formatted_examples(
+        agent_type, decisions, workers=workers, whiten_stats=whiten_stats, keep_examples=tokenizer is not None,
+        context_min_chars=context_min_chars, prompt_cache_size=prompt_cache_size, exact_keys=dedup_exact,
+        tokenizer=tokenizer, prompt_tokens=prompt_tokens
+    ), cache_counts)
+    dedup = ExactDuplicateFilter(whiten_stats, spool_dir=os.path.dirname(output_path) or ".") if dedup_exact else None
+    if dedup is not None:
+        formatted = dedup.filter(formatted)
+    try:
+        for item in formatted:
+            writer.write(item.line, item.reward, item.user_feedback, item.example, item.contexts)
+    except BaseException:
+        writer.abort()
+        raise
+    elapsed = time.perf_counter() - started
+    
+    count = writer.count
+    if count == 0:
+        writer.abort()
         print("❌ No training data found!")
         sys.exit(1)
     
-    # Ensure output directory exists
-    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    summary = writer.close()
     
-    # Format training examples
-    training_examples = []
+    print(f"\n✅ Export complete!")
+    print(f"   Examples: {count} ({count / elapsed if elapsed > 0 else 0.0:.0f} examples/s)")
+    _print_dedup_summary(cache_counts, dedup)
+    writer.print_summary()
+    print_pool_stats()
     
-    for decision in decisions:
-        # Format prompt
-        prompt = format_prompt_for_agent(agent_type, decision.state)
-        
-        # Format completion from action
-        completion = json.dumps(decision.action)
-        
-        # Create training example
-        example = {
-            "prompt": prompt,
-            "completion": completion,
-            "reward": decision.reward or 0.0,
-            "confidence": decision.confidence,
-            "metadata": {
-                "decisionId": decision.id,
-                "itemId": decision.item_id,
-                "opusId": decision.opus_id,
-                "userFeedback": decision.user_feedback,
-                "rewardComponents": decision.reward_components,
-                "createdAt": decision.created_at
-            }
-        }
-        
-        training_examples.append(example)
+    return summary
+
+def get_agent_output_path(output_dir: str, agent_type: str) -> str:
+    """Per-agent dataset path used by --agent-type ALL"""
+    return os.path.join(output_dir, f"{agent_type.lower()}.jsonl")
+
+def export_training_data_for_agents(
+    agents: Dict[str, Dict],
+    output_dir: str,
+    require_feedback: bool = False,
+    fetch_size: int = 1000,
+    backend: str = "cursor",
+    cache_path: Optional[str] = None,
+    sync_cache: bool = False,
+    whiten_stats: Optional[Dict[str, RewardStats]] = None,
+    tokenizer=None,
+    max_length: int = 512,
+    workers: int = 1,
+    compression: str = "none",
+    shard_size: int = 0,
+    context_min_chars: Optional[int] = None,
+    prompt_cache_size: int = 4096,
+    dedup_exact: bool = False,
+    prompt_tokens: Optional[int] = None
+) -> Dict[str, Optional[Dict]]:
+    """Export several agent types with a single scan of the Decision table
+    
+    ``agents`` maps agent type -> {"min_reward": float, "max_samples":
+    Optional[int]}. Both filters are applied by the query itself (limits
+    with a per-agent row_number()), and every row is routed to its agent's
+    ExportWriter, writing ``<output_dir>/<agent>.jsonl`` exactly as
+    separate export_training_data runs would.
+    
+    Returns:
+        Agent type -> export summary (None for agents with no data)
+    """
+    agent_types = list(agents)
+    print(f"📊 Streaming training decisions for {', '.join(agent_types)} in one scan ({backend})...")
+    if backend == "cache":
+        cache = _open_cache(cache_path, agent_types, sync_cache, fetch_size)
+        decisions = cache.iter_training_decisions_for_agents(
+            agents, require_reward=True, require_feedback=require_feedback, columns=EXPORT_COLUMNS
+        )
+    elif backend == "copy":
+        decisions = copy_training_decisions_for_agents(
+            agents, require_reward=True, require_feedback=require_feedback, columns=EXPORT_COLUMNS
+        )
+    else:
+        decisions = iter_training_decisions_for_agents(
+            agents, require_reward=True, require_feedback=require_feedback, fetch_size=fetch_size, columns=EXPORT_COLUMNS
+        )
+    
+    writers = {
+        agent_type: ExportWriter(
+            agent_type, get_agent_output_path(output_dir, agent_type), compression=compression,
+            shard_size=shard_size, tokenizer=tokenizer, max_length=max_length,
+            dedup_context=context_min_chars is not None
+        )
+        for agent_type in agent_types
+    }
+    started = time.perf_counter()
     
-    # Write JSONL file
-    print(f"💾 Writing {len(training_examples)} examples to {output_path}...")
-    with open(output_path, 'w') as f:
-        for example in training_examples:
-            f.write(json.dumps(example) + '\n')
+    print(f"💾 Writing examples to {output_dir}" + (f" ({workers} workers)..." if workers > 1 else "..."))
+    cache_counts = {"hits": 0, "misses": 0}
+    formatted = _count_prompt_cache(iter_formatted_examples(
+        None, decisions, workers=workers, whiten_stats=whiten_stats, keep_examples=tokenizer is not None,
+        context_min_chars=context_min_chars, prompt_cache_size=prompt_cache_size, exact_keys=dedup_exact,
+        tokenizer=tokenizer, prompt_tokens=prompt_tokens
+    ), cache_counts)
+    dedup = ExactDuplicateFilter(whiten_stats, spool_dir=output_dir) if dedup_exact else None
+    if dedup is not None:
+        formatted = dedup.filter(formatted)
+    try:
+        for item in formatted:
+            writers[item.agent_type].write(item.line, item.reward, item.user_feedback, item.example, item.contexts)
+    except BaseException:
+        for writer in writers.values():
+            writer.abort()
+        raise
+    elapsed = time.perf_counter() - started
     
-    # Calculate statistics
-    rewards = [ex["reward"] for ex in training_examples if ex["reward"] is not None]
-    avg_reward = sum(rewards) / len(rewards) if rewards else 0.0
-    confirmed_count = sum(1 for ex in training_examples if ex["metadata"]["userFeedback"] == "CONFIRMED")
-    corrected_count = sum(1 for ex in training_examples if ex["metadata"]["userFeedback"] == "CORRECTED")
+    summaries: Dict[str, Optional[Dict]] = {}
+    for agent_type, writer in writers.items():
+        if writer.count == 0:
+            writer.abort()
+            summaries[agent_type] = None
+        else:
+            summaries[agent_type] = writer.close()
+    
+    total = sum(writer.count for writer in writers.values())
+    if total == 0:
+        print("❌ No training data found!")
+        sys.exit(1)
     
     print(f"\n✅ Export complete!")
-    print(f"   Examples: {len(training_examples)}")
-    print(f"   Average reward: {avg_reward:.3f}")
-    print(f"   Reward range: [{min(rewards):.3f}, {max(rewards):.3f}]" if rewards else "   Reward range: N/A")
-    print(f"   Confirmed: {confirmed_count}/{len(training_examples)} ({100 * confirmed_count / len(training_examples):.1f}%)")
-    print(f"   Corrected: {corrected_count}/{len(training_examples)} ({100 * corrected_count / len(training_examples):.1f}%)")
+    print(f"   Examples: {total} ({total / elapsed if elapsed > 0 else 0.0:.0f} examples/s)")
+    _print_dedup_summary(cache_counts, dedup)
+    for agent_type, writer in writers.items():
+        if summaries[agent_type] is None:
+            print(f"\n⚠️  {agent_type}: no training data, nothing written")
+            continue
+        print(f"\n📈 {agent_type}: {writer.count} examples -> {writer.output_path}")
+        writer.print_summary()
+    print_pool_stats()
     
-    return {
-        "count": len(training_examples),
-        "avg_reward": avg_reward,
-        "confirmed_count": confirmed_count,
-        "corrected_count": corrected_count
-    }
+    return summaries
+
+def get_watermark_path(output_path: str) -> str:
+    """Watermark file kept beside an incrementally exported dataset"""
+    return output_path + ".watermark.json"
+
+def load_watermarks(path: str) -> Dict[str, dict]:
+    """Load per-agent export watermarks"""
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r') as f:
+        return json.load(f)
+
+def save_watermarks(path: str, watermarks: Dict[str, dict]):
+    """Atomically write per-agent export watermarks"""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(watermarks, f, indent=2)
+    os.replace(tmp_path, path)
+
+def upsert_examples(output_path: str, changed: Dict[str, Optional[dict]], rebuild: bool = False, reward_stats: Optional[RewardStats] = None) -> Dict[str, int]:
+    """
+    Merge changed examples into an existing JSONL dataset
+    
+    Args:
+        output_path: Dataset to update in place (atomically replaced)
+        changed: decisionId -> new example, or None to remove the decision
+        rebuild: Ignore any existing file contents
+        reward_stats: Updated with the reward of every example written
+    
+    Returns:
+        Counts of added, updated, removed and total examples
+    """
+    counts = {"added": 0, "updated": 0, "removed": 0, "total": 0}
+    pending = dict(changed)
+    tmp_path = output_path + ".tmp"
+    
+    with open(tmp_path, 'w') as out:
+        if not rebuild and os.path.exists(output_path):
+            with open(output_path, 'r') as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    example = json.loads(line)
+                    decision_id = example["metadata"]["decisionId"]
+                    if decision_id in pending:
+                        example = pending.pop(decision_id)
+                        if example is None:
+                            counts["removed"] += 1
+                            continue
+                        line = json.dumps(example) + '\n'
+                        counts["updated"] += 1
+                    out.write(line)
+                    if reward_stats is not None:
+                        reward_stats.update(example["reward"])
+                    counts["total"] += 1
+        
+        # Whatever is left was not in the dataset yet
+        for example in pending.values():
+            if example is not None:
+                out.write(json.dumps(example) + '\n')
+                if reward_stats is not None:
+                    reward_stats.update(example["reward"])
+                counts["added"] += 1
+                counts["total"] += 1
+    
+    os.replace(tmp_path, output_path)
+    return counts
+
+def _watermark_key(updated_at: str, decision_id: str) -> Tuple[datetime, str]:
+    return datetime.fromisoformat(updated_at), decision_id
+
+def export_training_data_incremental(
+    agent_type: str,
+    output_path: str,
+    limit: Optional[int] = None,
+    min_reward: float = -2.0,
+    require_feedback: bool = False,
+    page_size: int = 1000,
+    lookback_seconds: float = 60.0,
+    tokenizer=None,
+    prompt_tokens: Optional[int] = None
+):
+    """Export only decisions changed since the last incremental export
+    
+    Keeps an (updatedAt, id) watermark per agent type beside the dataset,
+    fetches newer decisions with keyset pagination and upserts them into
+    the existing JSONL file. Decisions that no longer pass the filters are
+    removed. The scan restarts ``lookback_seconds`` before the watermark to
+    pick up rows whose transactions committed late; the upsert makes
+    re-reading them harmless, and those rows do not count against
+    ``limit``, so a busy lookback window cannot stall the watermark. A
+    rebuild with ``limit`` exports the newest ``limit`` matching decisions. With ``prompt_tokens``, prompts are fitted
+    to that many tokens of ``tokenizer``; changing it rebuilds the dataset.
+    """
+    watermark_path = get_watermark_path(output_path)
+    watermarks = load_watermarks(watermark_path)
+    filters = {"minReward": min_reward, "requireFeedback": require_feedback}
+    if prompt_tokens is not None:
+        filters["promptTokens"] = prompt_tokens
+    
+    watermark = watermarks.get(agent_type)
+    rebuild = watermark is None or not os.path.exists(output_path)
+    if watermark is not None and watermark.get("filters") != filters:
+        print(f"⚠️  Filters changed since last export, rebuilding {output_path}")
+        watermark = None
+        rebuild = True
+    
+    after_updated_at = None
+    if watermark is not None and not rebuild:
+        after_updated_at = (
+            datetime.fromisoformat(watermark["updatedAt"]) - timedelta(seconds=lookback_seconds)
+        ).isoformat()
+        print(f"📊 Fetching {agent_type} decisions changed since {watermark['updatedAt']}...")
+    else:
+        print(f"📊 Fetching all {agent_type} decisions (no watermark)...")
+    
+    changed: Dict[str, Optional[dict]] = {}
+    last_seen = None
+    watermark_key = _watermark_key(watermark["updatedAt"], watermark["id"]) if watermark is not None and not rebuild else None
+    fresh = 0
+    for decision, matches in iter_changed_decisions(
+        agent_type=agent_type,
+        after_updated_at=after_updated_at,
+        require_reward=True,
+        require_feedback=require_feedback,
+        min_reward=min_reward,
+        page_size=page_size,
+        descending=rebuild  # A capped rebuild keeps the newest decisions
+    ):
+        if rebuild and not matches:
+            continue  # Nothing to remove from a dataset being rebuilt
+        key = _watermark_key(decision.updated_at, decision.id)
+        # Rows re-read from the lookback window come first and are not counted
+        if watermark_key is None or key > watermark_key:
+            if limit is not None and fresh >= limit:
+                break
+            fresh += 1
+        changed[decision.id] = build_training_example(agent_type, decision, tokenizer=tokenizer, max_tokens=prompt_tokens) if matches else None
+        if last_seen is None or key > _watermark_key(last_seen.updated_at, last_seen.id):
+            last_seen = decision
+    
+    print(f"   Changed decisions: {len(changed)}")
+    
+    if not changed and not rebuild:
+        print("✅ Dataset already up to date!")
+        return {"added": 0, "updated": 0, "removed": 0, "total": None}
+    
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    reward_stats = RewardStats()
+    counts = upsert_examples(output_path, changed, rebuild=rebuild, reward_stats=reward_stats)
+    remove_sharded_output(output_path)
+    save_reward_stats(get_reward_stats_path(output_path), {agent_type: reward_stats})
+    
+    # Advance the watermark only once the dataset is safely written, and
+    # never move it backwards when a run only re-read the lookback
+    if last_seen is not None and (
+        rebuild or watermark is None
+        or _watermark_key(last_seen.updated_at, last_seen.id) > _watermark_key(watermark["updatedAt"], watermark["id"])
+    ):
+        watermarks[agent_type] = {
+            "updatedAt": last_seen.updated_at,
+            "id": last_seen.id,
+            "filters": filters,
+            "exportedAt": datetime.now().isoformat()
+        }
+        save_watermarks(watermark_path, watermarks)
+    
+    print(f"\n✅ Incremental export complete!")
+    print(f"   Added: {counts['added']}, Updated: {counts['updated']}, Removed: {counts['removed']}")
+    print(f"   Examples in dataset: {counts['total']}")
+    print_pool_stats()
+    
+    return counts
+
+def _parse_agent_overrides(values: List[str], cast, option: str) -> Dict[str, object]:
+    """Parse repeated AGENT=VALUE options"""
+    overrides = {}
+    for value in values:
+        agent_type, _, setting = value.partition("=")
+        if agent_type not in EXPORT_AGENT_TYPES or not setting:
+            print(f"❌ {option} expects AGENT=VALUE with AGENT one of {', '.join(EXPORT_AGENT_TYPES)}, got {value!r}")
+            sys.exit(1)
+        overrides[agent_type] = cast(setting)
+    return overrides
 
 def main():
     parser = argparse.ArgumentParser(description="Export training data for RL training")
-    parser.add_argument("--agent-type", required=True, choices=["FILER", "LIBRARIAN", "PRIORITIZER", "STORER", "RETRIEVER"], help="Agent type")
-    parser.add_argument("--output", required=True, help="Output JSONL file path")
-    parser.add_argument("--limit", type=int, default=1000, help="Maximum number of examples")
+    parser.add_argument("--agent-type", required=True, choices=["ALL"] + EXPORT_AGENT_TYPES, help="Agent type (ALL exports every agent in one scan)")
+    parser.add_argument("--output", required=True, help="Output JSONL file path (a directory with --agent-type ALL)")
+    parser.add_argument("--limit", type=int, default=1000, help="Maximum number of examples (per agent with ALL)")
     parser.add_argument("--min-reward", type=float, default=-2.0, help="Minimum reward threshold")
+    parser.add_argument("--agent-limit", action="append", default=[], metavar="AGENT=N", help="Per-agent --limit override with --agent-type ALL (repeatable)")
+    parser.add_argument("--agent-min-reward", action="append", default=[], metavar="AGENT=X", help="Per-agent --min-reward override with --agent-type ALL (repeatable)")
     parser.add_argument("--require-feedback", action="store_true", help="Require user feedback")
+    parser.add_argument("--fetch-size", type=int, default=1000, help="Rows fetched per server-side cursor round trip")
+    parser.add_argument("--backend", default="cursor", choices=["cursor", "copy", "cache"], help="Stream rows from a server-side cursor, from COPY ... TO STDOUT, or from the local decision cache")
+    parser.add_argument("--cache", default=DEFAULT_CACHE_PATH, help="Decision cache path for --backend cache")
+    parser.add_argument("--sync-cache", action="store_true", help="Sync the decision cache from Postgres before exporting (falls back to cached rows if unreachable)")
+    parser.add_argument("--incremental", action="store_true", help="Only fetch decisions changed since the last incremental export and upsert them")
+    parser.add_argument("--lookback-seconds", type=float, default=60.0, help="Re-read this much before the watermark in incremental mode")
+    parser.add_argument("--tokenizer", help="Also write pre-tokenized, memory-mapped shards for this tokenizer (the base model)")
+    parser.add_argument("--shard-dir", help="Token shard directory (default: <output>.shards)")
+    parser.add_argument("--max-length", type=int, default=512, help="Truncate tokenized prompts to this many tokens")
+    parser.add_argument("--prompt-tokens", type=int, help="Fit each prompt to this many --tokenizer tokens, sharing them between instructions, opus content and item lists (e.g. the trainer's max_length)")
+    parser.add_argument("--workers", type=int, default=1, help="Processes formatting and serializing examples (default: 1, no pool)")
+    parser.add_argument("--whiten-with", help="Reward stats JSON (e.g. from a previous export) used to add a whitenedReward to each example")
+    parser.add_argument("--compression", default="none", choices=["none", "gzip", "zstd"], help="Write compressed shards with a manifest instead of one JSONL file (zstd needs the zstandard package)")
+    parser.add_argument("--shard-size", type=int, default=0, help="Examples per output shard (default: 0, a single shard)")
+    parser.add_argument("--dedup-context", action="store_true", help="Store repeated opus content once in <output>.context.jsonl and reference it from examples")
+    parser.add_argument("--context-min-chars", type=int, default=256, help="Only deduplicate context blocks at least this long (default: 256)")
+    parser.add_argument("--prompt-cache-size", type=int, default=4096, help="Formatted prompts memoized per process, keyed by canonical state (0 disables)")
+    parser.add_argument("--dedup-exact", action="store_true", help="Write identical (prompt, completion) pairs once, with their mean reward")
     
     args = parser.parse_args()
     
+    all_agents = args.agent_type == "ALL"
+    agent_types = EXPORT_AGENT_TYPES if all_agents else [args.agent_type]
+    limits = _parse_agent_overrides(args.agent_limit, int, "--agent-limit")
+    min_rewards = _parse_agent_overrides(args.agent_min_reward, float, "--agent-min-reward")
+    if (limits or min_rewards) and not all_agents:
+        print("❌ --agent-limit/--agent-min-reward only apply to --agent-type ALL; use --limit/--min-reward")
+        sys.exit(1)
+    if all_agents and args.shard_dir:
+        print("❌ --shard-dir names one agent's token shards; with --agent-type ALL they go to <output>/<agent>.jsonl.shards")
+        sys.exit(1)
+    if args.prompt_tokens is not None and not args.tokenizer:
+        print("❌ --prompt-tokens counts tokens with --tokenizer; pass the base model's tokenizer")
+        sys.exit(1)
+    tokenizer = load_tokenizer(args.tokenizer) if args.tokenizer else None
+    
+    if args.incremental:
+        if args.compression != "none" or args.shard_size or args.dedup_context or args.dedup_exact:
+            print("❌ --incremental upserts single examples into one uncompressed JSONL file; drop --compression/--shard-size/--dedup-context/--dedup-exact")
+            sys.exit(1)
+        # Incremental runs read only each agent's keyset delta, so one scan per agent is cheap
+        for agent_type in agent_types:
+            output_path = get_agent_output_path(args.output, agent_type) if all_agents else args.output
+            export_training_data_incremental(
+                agent_type=agent_type,
+                output_path=output_path,
+                limit=limits.get(agent_type, args.limit),
+                min_reward=min_rewards.get(agent_type, args.min_reward),
+                require_feedback=args.require_feedback,
+                page_size=args.fetch_size,
+                lookback_seconds=args.lookback_seconds,
+                tokenizer=tokenizer,
+                prompt_tokens=args.prompt_tokens
+            )
+            if args.tokenizer:
+                # Upserts can touch any line, so the shards are rebuilt from the file
+                shard_dir = args.shard_dir or output_path + ".shards"
+                index = write_token_shards(
+                    read_examples(output_path),
+                    shard_dir,
+                    tokenizer,
+                    agent_type,
+                    max_length=args.max_length
+                )
+                print(f"   Token shards: {shard_dir} ({index['tokens']} tokens in {len(index['shards'])} shards)")
+        return
+    
+    whiten_stats = None
+    if args.whiten_with:
+        saved_stats = load_reward_stats(args.whiten_with)
+        missing = [agent_type for agent_type in agent_types if agent_type not in saved_stats]
+        if missing:
+            print(f"❌ No {', '.join(missing)} reward stats in {args.whiten_with}")
+            sys.exit(1)
+        whiten_stats = {agent_type: saved_stats[agent_type] for agent_type in agent_types}
+    
+    if all_agents:
+        export_training_data_for_agents(
+            agents={
+                agent_type: {
+                    "max_samples": limits.get(agent_type, args.limit),
+                    "min_reward": min_rewards.get(agent_type, args.min_reward)
+                }
+                for agent_type in agent_types
+            },
+            output_dir=args.output,
+            require_feedback=args.require_feedback,
+            fetch_size=args.fetch_size,
+            backend=args.backend,
+            cache_path=args.cache,
+            sync_cache=args.sync_cache,
+            whiten_stats=whiten_stats,
+            tokenizer=tokenizer,
+            max_length=args.max_length,
+            workers=args.workers,
+            compression=args.compression,
+            shard_size=args.shard_size,
+            context_min_chars=args.context_min_chars if args.dedup_context else None,
+            prompt_cache_size=args.prompt_cache_size,
+            dedup_exact=args.dedup_exact,
+            prompt_tokens=args.prompt_tokens
+        )
+        return
+    
     export_training_data(
         agent_type=args.agent_type,
         output_path=args.output,
         limit=args.limit,
         min_reward=args.min_reward,
-        require_feedback=args.require_feedback
+        require_feedback=args.require_feedback,
+        fetch_size=args.fetch_size,
+        backend=args.backend,
+        cache_path=args.cache,
+        sync_cache=args.sync_cache,
+        whiten_stats=whiten_stats[args.agent_type] if whiten_stats else None,
+        tokenizer=tokenizer,
+        shard_dir=args.shard_dir,
+        max_length=args.max_length,
+        workers=args.workers,
+        compression=args.compression,
+        shard_size=args.shard_size,
+        context_min_chars=args.context_min_chars if args.dedup_context else None,
+        prompt_cache_size=args.prompt_cache_size,
+        dedup_exact=args.dedup_exact,
+        prompt_tokens=args.prompt_tokens
     )
 
 if __name__ == "__main__":
@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+"""
+Near-duplicate removal for exported training data
+
+Builds MinHash signatures over word shingles of each prompt and indexes
+them with LSH, so only examples that share a band (and the same completion)
+are compared. Near-duplicates are clustered, and each cluster is written as
+one representative carrying the cluster's aggregated reward:
+
+    export_training_data.py -> near_dedup.py -> train_filer.py / train_prioritizer.py
+
+Usage:
+    python near_dedup.py --data training/data/filer.jsonl --output training/data/filer.dedup.jsonl
+    python near_dedup.py --data training/data/filer.jsonl --output training/data/filer.dedup.jsonl --threshold 0.9
+"""
+import os
+import sys
+import json
+import time
+import zlib
+import hashlib
+import argparse
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+
+from training.dataset_io import read_examples
+from training.reward_calculator import RewardStats, get_reward_stats_path, load_reward_stats, save_reward_stats
+
+DEFAULT_NUM_PERM = 128
+DEFAULT_BANDS = 16
+DEFAULT_SHINGLE_SIZE = 5
+DEFAULT_THRESHOLD = 0.8
+
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64((1 << 32) - 1)
+
+def shingle_hashes(text: str, size: int = DEFAULT_SHINGLE_SIZE) -> np.ndarray:
+    """32-bit hashes of the distinct word ``size``-grams of a text"""
+    words = text.split()
+    if len(words) <= size:
+        grams = [" ".join(words)]
+    else:
+        grams = {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+    return np.fromiter((zlib.crc32(gram.encode()) for gram in grams), dtype=np.uint64)
+
+class MinHasher:
+    """MinHash signatures from ``num_perm`` universal hash functions"""
+
+    def __init__(self, num_perm: int = DEFAULT_NUM_PERM, seed: int = 1):
+        rng = np.random.RandomState(seed)
+        self.num_perm = num_perm
+        self.a = rng.randint(1, 1 << 32, size=num_perm, dtype=np.uint64)
+        self.b = rng.randint(0, 1 << 32, size=num_perm, dtype=np.uint64)
+
+    def signature(self, hashes: np.ndarray) -> np.ndarray:
+        """Signature (uint32 per permutation) of a set of shingle hashes"""
+        permuted = (hashes[:, None] * self.a + self.b) % _MERSENNE_PRIME & _MAX_HASH
+        return permuted.min(axis=0).astype(np.uint32)
+
+def estimated_jaccard(a: np.ndarray, b: np.ndarray) -> float:
+    """Jaccard similarity estimated from two MinHash signatures"""
+    return float(np.count_nonzero(a == b)) / len(a)
+
+class _UnionFind:
+    def __init__(self):
+        self.parent: List[int] = []
+
+    def add(self) -> int:
+        self.parent.append(len(self.parent))
+        return len(self.parent) - 1
+
+    def find(self, index: int) -> int:
+        parent = self.parent
+        while parent[index] != index:
+            parent[index] = parent[parent[index]]
+            index = parent[index]
+        return index
+
+    def union(self, a: int, b: int):
+        a, b = self.find(a), self.find(b)
+        if a != b:
+            # The earlier example stays the root, and so the representative
+            self.parent[max(a, b)] = min(a, b)
+
+class NearDuplicateIndex:
+    """
+    LSH index over MinHash signatures that clusters near-duplicates
+
+    Signatures are cut into ``bands`` bands; examples sharing a band and
+    a ``group`` (e.g. the completion) are candidates, and candidates whose
+    estimated Jaccard similarity reaches ``threshold`` join one cluster.
+    Each bucket keeps one anchor per cluster, so a large group of
+    duplicates costs one comparison per new member, not one per pair.
+    """
+
+    def __init__(self, threshold: float = DEFAULT_THRESHOLD, num_perm: int = DEFAULT_NUM_PERM, bands: int = DEFAULT_BANDS, shingle_size: int = DEFAULT_SHINGLE_SIZE):
+        if num_perm % bands:
+            raise ValueError(f"num_perm ({num_perm}) must be a multiple of bands ({bands})")
+        self.threshold = threshold
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+        self.hasher = MinHasher(num_perm)
+        self.signatures: List[np.ndarray] = []
+        self.buckets: Dict[bytes, List[int]] = {}
+        self.clusters = _UnionFind()
+        self.comparisons = 0
+
+    def add(self, text: str, group: str = "") -> int:
+        """Index one text and return its position"""
+        signature = self.hasher.signature(shingle_hashes(text, self.shingle_size))
+        index = self.clusters.add()
+        self.signatures.append(signature)
+
+        prefix = hashlib.sha1(group.encode()).digest()
+        for band in range(self.bands):
+            key = prefix + band.to_bytes(2, "little") + signature[band * self.rows:(band + 1) * self.rows].tobytes()
+            anchors = self.buckets.setdefault(key, [])
+            root = self.clusters.find(index)
+            for anchor in anchors:
+                if self.clusters.find(anchor) == root:
+                    break
+                self.comparisons += 1
+                if estimated_jaccard(self.signatures[anchor], signature) >= self.threshold:
+                    self.clusters.union(anchor, index)
+                    break
+            else:
+                anchors.append(index)
+        return index
+
+    def labels(self) -> List[int]:
+        """Cluster of every indexed text, as the position of its representative"""
+        return [self.clusters.find(index) for index in range(len(self.signatures))]
+
+def _completion_group(example: dict) -> str:
+    return example.get("completion") or ""
+
+def _weight(example: dict) -> int:
+    # Examples already merged by --dedup-exact stand for several decisions
+    return example.get("metadata", {}).get("duplicateCount", 1)
+
+def _aggregate(representative: dict, members: List[Tuple[float, Optional[float], int, str]]) -> dict:
+    weights = np.array([weight for _, _, weight, _ in members], dtype=np.float64)
+    rewards = np.array([reward for reward, _, _, _ in members], dtype=np.float64)
+    mean = float(np.average(rewards, weights=weights))
+    representative["reward"] = mean
+    whitened = [value for _, value, _, _ in members]
+    if all(value is not None for value in whitened):
+        representative["whitenedReward"] = float(np.average(whitened, weights=weights))
+
+    metadata = representative.setdefault("metadata", {})
+    metadata["clusterSize"] = int(weights.sum())
+    metadata["clusterRewardStd"] = float(np.sqrt(np.average((rewards - mean) ** 2, weights=weights)))
+    metadata["clusterDecisionIds"] = [decision_id for _, _, _, decision_id in members[1:]]
+    return representative
+
+def near_dedup(
+    data_path: str,
+    output_path: str,
+    threshold: float = DEFAULT_THRESHOLD,
+    num_perm: int = DEFAULT_NUM_PERM,
+    bands: int = DEFAULT_BANDS,
+    shingle_size: int = DEFAULT_SHINGLE_SIZE,
+    agent_type: Optional[str] = None
+) -> Dict:
+    """
+    Write one representative per near-duplicate cluster of a dataset
+
+    The first pass keeps only signatures, rewards and ids; the second pass
+    streams the dataset again and writes the first example of each cluster
+    (the newest, in export order) with the weighted mean reward of the
+    cluster, its size, reward spread and the other decision ids.
+    Reward statistics of the output are saved beside it for whitening,
+    under ``agent_type`` (default: the agent of the input's reward stats).
+
+    Returns:
+        Counts of input and output examples, largest cluster and comparisons
+    """
+    started = time.perf_counter()
+    index = NearDuplicateIndex(threshold=threshold, num_perm=num_perm, bands=bands, shingle_size=shingle_size)
+    members_of: List[Tuple[float, Optional[float], int, str]] = []
+    for example in read_examples(data_path):
+        index.add(example["prompt"], _completion_group(example))
+        members_of.append((
+            example["reward"],
+            example.get("whitenedReward"),
+            _weight(example),
+            example.get("metadata", {}).get("decisionId")
+        ))
+
+    labels = index.labels()
+    clusters: Dict[int, List[Tuple[float, Optional[float], int, str]]] = {}
+    for position, label in enumerate(labels):
+        clusters.setdefault(label, []).append(members_of[position])
+
+    reward_stats = RewardStats()
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    tmp_path = output_path + ".tmp"
+    with open(tmp_path, 'w') as out:
+        for position, example in enumerate(read_examples(data_path)):
+            if labels[position] != position:
+                continue
+            members = clusters[position]
+            if len(members) > 1:
+                example = _aggregate(example, members)
+            out.write(json.dumps(example) + '\n')
+            reward_stats.update(example["reward"])
+    os.replace(tmp_path, output_path)
+
+    if agent_type is None:
+        input_agents = list(load_reward_stats(get_reward_stats_path(data_path)))
+        agent_type = input_agents[0] if len(input_agents) == 1 else None
+    if agent_type is not None:
+        save_reward_stats(get_reward_stats_path(output_path), {agent_type: reward_stats})
+
+    return {
+        "input": len(labels),
+        "output": len(clusters),
+        "clustered": sum(len(members) for members in clusters.values() if len(members) > 1),
+        "largest_cluster": max((len(members) for members in clusters.values()), default=0),
+        "comparisons": index.comparisons,
+        "reward_stats": get_reward_stats_path(output_path) if agent_type is not None else None,
+        "seconds": time.perf_counter() - started
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Cluster near-duplicate training examples and keep one per cluster")
+    parser.add_argument("--data", required=True, help="Exported training data (JSONL or sharded export)")
+    parser.add_argument("--output", required=True, help="Deduplicated JSONL file")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="Estimated Jaccard similarity of prompt shingles that makes a near-duplicate")
+    parser.add_argument("--num-perm", type=int, default=DEFAULT_NUM_PERM, help="MinHash permutations per signature")
+    parser.add_argument("--bands", type=int, default=DEFAULT_BANDS, help="LSH bands (more bands catch lower similarities, at more comparisons)")
+    parser.add_argument("--shingle-size", type=int, default=DEFAULT_SHINGLE_SIZE, help="Words per shingle")
+    parser.add_argument("--agent-type", choices=["FILER", "LIBRARIAN", "PRIORITIZER", "STORER", "RETRIEVER"], help="Agent the output reward stats are saved for (default: taken from <data>.reward_stats.json)")
+
+    args = parser.parse_args()
+
+    print(f"🔍 Clustering near-duplicates in {args.data} (threshold {args.threshold})...")
+    try:
+        report = near_dedup(
+            args.data,
+            args.output,
+            threshold=args.threshold,
+            num_perm=args.num_perm,
+            bands=args.bands,
+            shingle_size=args.shingle_size,
+            agent_type=args.agent_type
+        )
+    except (FileNotFoundError, ValueError) as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+
+    removed = report["input"] - report["output"]
+    print(f"\n✅ Deduplication complete!")
+    print(f"   Examples: {report['input']} -> {report['output']} ({100 * removed / max(report['input'], 1):.1f}% fewer)")
+    print(f"   Examples in multi-member clusters: {report['clustered']} (largest cluster: {report['largest_cluster']})")
+    print(f"   Comparisons: {report['comparisons']} in {report['seconds']:.1f}s")
+    print(f"   Output: {args.output}")
+    if report["reward_stats"]:
+        print(f"   Reward stats: {report['reward_stats']}")
+    else:
+        print("⚠️  No reward stats written (pass --agent-type)")
+
+if __name__ == "__main__":
+    main()
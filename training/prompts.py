@@ -2,8 +2,10 @@
 Prompt formatting for each agent type
 """
 import json
-from typing import Dict, Any
-from training.database import DecisionRecord
+import hashlib
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, Tuple
+from training.database import DecisionRecord, raw_json_payload
 
 # System prompts (should match src/lib/ai.ts)
 FILER_SYSTEM_PROMPT = """You are the "Filer" AI for a personal project management system (OCD - Opus Corpus Documenter). Your job is to act as a natural language parser.
@@ -74,70 +76,270 @@ Consider:
 
 You must return only the raw JSON object. Do not include Markdown, commentary, or additional text."""
 
-def format_filer_prompt(state: Dict[str, Any]) -> str:
-    """Format Filer prompt from state"""
+# Characters of opus content inlined into Filer / Librarian prompts
+FILER_OPUS_CONTENT_CHARS = 500
+LIBRARIAN_OPUS_CONTENT_CHARS = 1000
+# Characters of each corpus item's instructions in Librarian prompts
+LIBRARIAN_CORPUS_INSTRUCTION_CHARS = 100
+
+class _Text:
+    """Prompt section truncated to ``chars`` characters, or to its token share under a budget"""
+    
+    def __init__(self, text: Any, chars: Optional[int] = None, weight: float = 1.0):
+        self.text = str(text)
+        self.chars = chars
+        self.weight = weight
+        self._tokens: Optional[int] = None
+    
+    def default(self) -> str:
+        return self.text[:self.chars] if self.chars is not None else self.text
+    
+    def tokens(self, budget: "TokenBudget") -> int:
+        if self._tokens is None:
+            self._tokens = budget.count(self.text)
+        return self._tokens
+    
+    def render(self, budget: "TokenBudget", tokens: int) -> str:
+        return self.text if tokens >= self.tokens(budget) else budget.truncate(self.text, tokens)
+
+class _Items:
+    """List section limited to ``count`` entries, or to whole entries fitting its token share"""
+    
+    def __init__(self, lines: List[str], count: Optional[int] = None, weight: float = 1.0):
+        self.lines = lines
+        self.count = count
+        self.weight = weight
+        self._line_tokens: Optional[List[int]] = None
+    
+    def default(self) -> str:
+        return "".join(self.lines[:self.count] if self.count is not None else self.lines)
+    
+    def tokens(self, budget: "TokenBudget") -> int:
+        if self._line_tokens is None:
+            self._line_tokens = [budget.count(line) for line in self.lines]
+        return sum(self._line_tokens)
+    
+    def render(self, budget: "TokenBudget", tokens: int) -> str:
+        self.tokens(budget)
+        rendered, used = [], 0
+        for line, line_tokens in zip(self.lines, self._line_tokens):
+            if used + line_tokens > tokens:
+                break
+            rendered.append(line)
+            used += line_tokens
+        return "".join(rendered)
+
+class _Entries:
+    """
+    List section whose entries each hold a truncatable text
+    
+    Entries are (prefix, text, suffix). By default the first ``count``
+    entries are shown with their text cut to ``chars`` characters. Under a
+    budget, entries are kept in order while each still fits with at least
+    that default cut, and the texts of the kept entries then share the
+    section's tokens, so slack goes to longer texts instead of stubs.
+    """
+    
+    def __init__(self, entries: List[Tuple[str, Any, str]], chars: Optional[int] = None, count: Optional[int] = None, weight: float = 1.0):
+        self.entries = [(prefix, _Text(text, chars=chars), suffix) for prefix, text, suffix in entries]
+        self.count = count
+        self.weight = weight
+        self._costs: Optional[List[Tuple[int, int]]] = None
+    
+    def default(self) -> str:
+        entries = self.entries[:self.count] if self.count is not None else self.entries
+        return "".join(prefix + text.default() + suffix for prefix, text, suffix in entries)
+    
+    def _entry_costs(self, budget: "TokenBudget") -> List[Tuple[int, int]]:
+        """(fixed tokens, tokens of the entry with its default cut) of every entry"""
+        if self._costs is None:
+            self._costs = [
+                (budget.count(prefix + suffix), budget.count(prefix + text.default() + suffix))
+                for prefix, text, suffix in self.entries
+            ]
+        return self._costs
+    
+    def tokens(self, budget: "TokenBudget") -> int:
+        fixed = sum(fixed for fixed, _ in self._entry_costs(budget))
+        return fixed + sum(text.tokens(budget) for _, text, _ in self.entries)
+    
+    def render(self, budget: "TokenBudget", tokens: int) -> str:
+        kept, fixed_total, used = [], 0, 0
+        for entry, (fixed, default) in zip(self.entries, self._entry_costs(budget)):
+            if used + default > tokens:
+                break
+            kept.append(entry)
+            fixed_total += fixed
+            used += default
+        texts = [text for _, text, _ in kept]
+        allocation = budget._allocate(texts, tokens - fixed_total)
+        return "".join(
+            prefix + text.render(budget, text_tokens) + suffix
+            for (prefix, text, suffix), text_tokens in zip(kept, allocation)
+        )
+
+class TokenBudget:
+    """
+    Fit a prompt into ``max_tokens`` tokens of ``tokenizer``
+    
+    The sections a formatter marks as flexible (instructions, opus content,
+    item lists) share whatever the fixed text leaves, in proportion to
+    their weights; sections needing less than their share give the rest
+    to the others. The assembled prompt is re-counted and the largest
+    section trimmed until it fits, since token counts of concatenated text
+    are not exactly additive. Tokens the tokenizer adds itself (BOS etc.)
+    are reserved, so ``max_tokens`` can be the trainers' max_length.
+    """
+    
+    def __init__(self, tokenizer, max_tokens: int):
+        self.tokenizer = tokenizer
+        special = tokenizer.num_special_tokens_to_add() if hasattr(tokenizer, "num_special_tokens_to_add") else 0
+        self.max_tokens = max_tokens - special
+    
+    def count(self, text: str) -> int:
+        return len(self.tokenizer.encode(text, add_special_tokens=False))
+    
+    def truncate(self, text: str, tokens: int) -> str:
+        if tokens <= 0:
+            return ""
+        return self.tokenizer.decode(self.tokenizer.encode(text, add_special_tokens=False)[:tokens])
+    
+    def _allocate(self, flexible: List, available: int) -> List[int]:
+        needs = [section.tokens(self) for section in flexible]
+        allocation = [0] * len(flexible)
+        active = [i for i, need in enumerate(needs) if need > 0]
+        remaining = available
+        while active and remaining > 0:
+            total_weight = sum(flexible[i].weight for i in active)
+            shares = {i: remaining * flexible[i].weight / total_weight for i in active}
+            satisfied = [i for i in active if needs[i] <= shares[i]]
+            if not satisfied:
+                for i in active:
+                    allocation[i] = int(shares[i])
+                break
+            for i in satisfied:
+                allocation[i] = needs[i]
+                remaining -= needs[i]
+                active.remove(i)
+        return allocation
+    
+    def fit(self, sections: List) -> str:
+        """Render sections (strings are fixed, _Text/_Items flexible) within the budget"""
+        flexible = [section for section in sections if not isinstance(section, str)]
+        fixed = "".join(section for section in sections if isinstance(section, str))
+        allocation = self._allocate(flexible, max(self.max_tokens - self.count(fixed), 0))
+        
+        for _ in range(8):
+            shares = iter(allocation)
+            prompt = "".join(
+                section if isinstance(section, str) else section.render(self, next(shares))
+                for section in sections
+            ).strip()
+            overflow = self.count(prompt) - self.max_tokens
+            if overflow <= 0:
+                return prompt
+            largest = max(range(len(allocation)), key=allocation.__getitem__, default=None)
+            if largest is None or allocation[largest] == 0:
+                break
+            allocation[largest] = max(allocation[largest] - overflow, 0)
+        
+        # Only the fixed text is left and it is still too long
+        return self.truncate(prompt, self.max_tokens)
+
+def _render(sections: List, budget: Optional[TokenBudget]) -> str:
+    if budget is None:
+        return "".join(section if isinstance(section, str) else section.default() for section in sections).strip()
+    return budget.fit(sections)
+
+def _budget(tokenizer, max_tokens: Optional[int]) -> Optional[TokenBudget]:
+    if tokenizer is None or max_tokens is None:
+        return None
+    return TokenBudget(tokenizer, max_tokens)
+
+def format_filer_prompt(state: Dict[str, Any], tokenizer=None, max_tokens: Optional[int] = None) -> str:
+    """Format Filer prompt from state
+    
+    With ``tokenizer`` and ``max_tokens``, instructions, opus content and
+    the project list share a token budget instead of fixed character and
+    item limits (see TokenBudget).
+    """
+    budget = _budget(tokenizer, max_tokens)
     item = state.get("item", {})
     assigned_opus = state.get("assignedOpus")
     available_opuses = state.get("availableOpuses", [])
     
-    prompt = f"""Instructions: {item.get('rawInstructions', '')}
+    sections = [
+        "Instructions: ",
+        _Text(item.get('rawInstructions', ''), weight=2.0),
+        f"""
 Routing Notes: {item.get('routingNotes', 'None')}
 Item Title: {item.get('title', '')}
 
 """
+    ]
     
     if assigned_opus:
-        prompt += f"""Assigned Project:
+        sections += [
+            f"""Assigned Project:
 - Name: {assigned_opus.get('name', '')}
 - Type: {assigned_opus.get('opusType', '')}
-- Content: {assigned_opus.get('content', '')[:500]}...
-
-"""
+- Content: """,
+            _Text(assigned_opus.get('content', ''), chars=FILER_OPUS_CONTENT_CHARS),
+            "...\n\n"
+        ]
     
     if available_opuses:
-        prompt += "Available Projects:\n"
-        for opus in available_opuses[:10]:  # Limit to 10
-            prompt += f"- {opus.get('name', '')} ({opus.get('opusType', '')})\n"
+        sections += [
+            "Available Projects:\n",
+            _Items([f"- {opus.get('name', '')} ({opus.get('opusType', '')})\n" for opus in available_opuses], count=10)
+        ]
     
-    return prompt.strip()
+    return _render(sections, budget)
 
-def format_librarian_prompt(state: Dict[str, Any]) -> str:
-    """Format Librarian prompt from state"""
+def format_librarian_prompt(state: Dict[str, Any], tokenizer=None, max_tokens: Optional[int] = None) -> str:
+    """Format Librarian prompt from state (token budget as in format_filer_prompt)"""
+    budget = _budget(tokenizer, max_tokens)
     new_item = state.get("newItem", {})
     opus = state.get("opus", {})
     corpus = state.get("corpus", [])
     
-    prompt = f"""New Item:
+    sections = [
+        f"""New Item:
 - Title: {new_item.get('title', '')}
-- Instructions: {new_item.get('rawInstructions', '')}
+- Instructions: """,
+        _Text(new_item.get('rawInstructions', '')),
+        f"""
 - Routing Notes: {new_item.get('routingNotes', 'None')}
 
 Project Context:
 - Name: {opus.get('name', '')}
 - Strategic: {opus.get('isStrategic', False)}
-- Content: {opus.get('content', '')[:1000]}...
+- Content: """,
+        _Text(opus.get('content', ''), chars=LIBRARIAN_OPUS_CONTENT_CHARS, weight=2.0),
+        f"""...
 
 Existing Items in Project ({len(corpus)} items):
-"""
-    
-    for item in corpus[:20]:  # Limit to 20
-        prompt += f"- [{item.get('status', '')}] {item.get('title', '')}: {item.get('rawInstructions', '')[:100]}...\n"
+""",
+        _Entries(
+            [(f"- [{item.get('status', '')}] {item.get('title', '')}: ", item.get('rawInstructions', ''), "...\n") for item in corpus],
+            chars=LIBRARIAN_CORPUS_INSTRUCTION_CHARS,
+            count=20,
+            weight=2.0
+        )
+    ]
     
-    return prompt.strip()
+    return _render(sections, budget)
 
-def format_prioritizer_prompt(state: Dict[str, Any]) -> str:
-    """Format Prioritizer prompt from state"""
+def format_prioritizer_prompt(state: Dict[str, Any], tokenizer=None, max_tokens: Optional[int] = None) -> str:
+    """Format Prioritizer prompt from state (token budget as in format_filer_prompt)"""
+    budget = _budget(tokenizer, max_tokens)
     available_items = state.get("availableItems", [])
     user_context = state.get("userContext", {})
     strategic_state = state.get("strategicState", {})
     constraints = state.get("constraints", {})
     
-    prompt = f"""Available TODO Items ({len(available_items)} items):
-
-"""
-    
-    for item in available_items[:20]:  # Limit to 20
-        prompt += f"""- ID: {item.get('id', '')}
+    item_lines = [
+        f"""- ID: {item.get('id', '')}
   Title: {item.get('title', '')}
   Swimlane: {item.get('swimlane', '')}
   Priority: {item.get('priority', '')}
@@ -145,8 +347,15 @@ def format_prioritizer_prompt(state: Dict[str, Any]) -> str:
   Age: {item.get('statusChangedAt', 'Unknown')}
 
 """
+        for item in available_items
+    ]
     
-    prompt += f"""
+    sections = [
+        f"""Available TODO Items ({len(available_items)} items):
+
+""",
+        _Items(item_lines, count=20),
+        f"""
 User Context:
 - Current Time: {user_context.get('currentTime', 'Unknown')}
 - Day of Week: {user_context.get('dayOfWeek', 'Unknown')}
@@ -161,20 +370,37 @@ Constraints:
 - Blocked Count: {constraints.get('blockedCount', 0)}
 - Average Cycle Time: {constraints.get('averageCycleTime', 0):.1f} days
 """
+    ]
     
-    return prompt.strip()
+    return _render(sections, budget)
 
-def format_prompt_for_agent(agent_type: str, state: Dict[str, Any]) -> str:
-    """Format prompt based on agent type"""
+def format_prompt_for_agent(agent_type: str, state: Dict[str, Any], tokenizer=None, max_tokens: Optional[int] = None) -> str:
+    """Format prompt based on agent type, optionally within a token budget"""
     if agent_type == "FILER":
-        return format_filer_prompt(state)
+        return format_filer_prompt(state, tokenizer, max_tokens)
     elif agent_type == "LIBRARIAN":
-        return format_librarian_prompt(state)
+        return format_librarian_prompt(state, tokenizer, max_tokens)
     elif agent_type == "PRIORITIZER":
-        return format_prioritizer_prompt(state)
+        return format_prioritizer_prompt(state, tokenizer, max_tokens)
     else:
         # Generic format
-        return json.dumps(state, indent=2)
+        budget = _budget(tokenizer, max_tokens)
+        prompt = json.dumps(state, indent=2)
+        return budget.fit([_Text(prompt)]) if budget is not None else prompt
+
+def get_context_blocks(agent_type: str, state: Dict[str, Any]) -> List[str]:
+    """Shared context text that format_prompt_for_agent inlines verbatim
+    
+    These are the opus content excerpts repeated across many examples,
+    which exports can store once and reference (see dataset_io.compact_prompt).
+    """
+    if agent_type == "FILER":
+        assigned_opus = state.get("assignedOpus")
+        if assigned_opus:
+            return [assigned_opus.get('content', '')[:FILER_OPUS_CONTENT_CHARS]]
+    elif agent_type == "LIBRARIAN":
+        return [state.get("opus", {}).get('content', '')[:LIBRARIAN_OPUS_CONTENT_CHARS]]
+    return []
 
 def get_system_prompt(agent_type: str) -> str:
     """Get system prompt for agent type"""
@@ -184,3 +410,91 @@ def get_system_prompt(agent_type: str) -> str:
         "PRIORITIZER": PRIORITIZER_SYSTEM_PROMPT,
     }
     return prompts.get(agent_type, "")
+
+def canonical_state_hash(agent_type: str, state: Any) -> str:
+    """Hash of a state that ignores key order and whitespace"""
+    payload = json.dumps(state, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(f"{agent_type}\0{payload}".encode()).hexdigest()
+
+class PromptCache:
+    """
+    LRU cache of formatted prompts keyed by agent type and canonical state
+
+    Each entry also keeps a digest of the prompt, so callers can compare
+    prompts (e.g. to drop exact duplicates) without rehashing them.
+
+        cache = PromptCache(max_size=4096)
+        prompt = cache.format("FILER", state)
+        print(f"{cache.hit_rate:.1%}")
+
+    With ``tokenizer`` and ``max_tokens``, prompts are fitted to that
+    token budget (see TokenBudget).
+    """
+
+    def __init__(self, max_size: int = 4096, tokenizer=None, max_tokens: Optional[int] = None):
+        self.max_size = max_size
+        self.tokenizer = tokenizer
+        self.max_tokens = max_tokens
+        self.entries: "OrderedDict[str, Tuple[str, str]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _lookup(self, key: str, agent_type: str, get_state) -> Tuple[str, str, bool]:
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[0], entry[1], True
+
+        self.misses += 1
+        prompt = format_prompt_for_agent(agent_type, get_state(), self.tokenizer, self.max_tokens)
+        entry = (prompt, hashlib.sha256(prompt.encode()).hexdigest())
+        self.entries[key] = entry
+        if len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+        return entry[0], entry[1], False
+
+    def lookup(self, agent_type: str, state: Dict[str, Any]) -> Tuple[str, str, bool]:
+        """Formatted prompt, its sha256 and whether it came from the cache"""
+        return self._lookup(canonical_state_hash(agent_type, state), agent_type, lambda: state)
+
+    def lookup_decision(self, agent_type: str, decision: DecisionRecord) -> Tuple[str, str, bool]:
+        """
+        Like lookup, for a decision's state
+
+        While the state is still undecoded jsonb text, that text is hashed
+        directly: Postgres renders jsonb with sorted keys and fixed spacing,
+        so it is already canonical, and a hit skips decoding the state.
+        """
+        raw = raw_json_payload(decision, "state")
+        if raw is None:
+            return self.lookup(agent_type, decision.state)
+        if isinstance(raw, str):
+            raw = raw.encode()
+        key = "raw:" + hashlib.sha256(agent_type.encode() + b"\0" + bytes(raw)).hexdigest()
+        return self._lookup(key, agent_type, lambda: decision.state)
+
+    def format(self, agent_type: str, state: Dict[str, Any]) -> str:
+        """Cached format_prompt_for_agent"""
+        return self.lookup(agent_type, state)[0]
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def stats(self) -> Dict:
+        return {
+            "size": len(self.entries),
+            "maxSize": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hitRate": self.hit_rate
+        }
+
+    def clear(self):
+        self.entries.clear()
+        self.hits = self.misses = self.evictions = 0
@@ -2,16 +2,98 @@
 Reward calculation for training data
 This matches the reward calculation logic from src/lib/reward-calculator.ts
 """
-from typing import Dict, Any, Optional
+import os
+import json
+from typing import Dict, Any, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
 from training.database import DecisionRecord
 
-def calculate_reward_from_record(record: DecisionRecord) -> float:
+# Reward weights (should match REWARD_WEIGHTS in reward-calculator.ts)
+REWARD_WEIGHTS: Dict[str, Dict[str, Any]] = {
+    "FILER": {
+        "immediate": {"userFeedback": 1.0, "confidenceCalibration": 0.1},
+        "delayed": {
+            "completionSuccess": 0.5,
+            "blockageAvoidance": 0.3,
+            "reworkPenalty": 0.2,
+            "timeEfficiency": 0.3
+        },
+        "strategic": {"goalAlignment": 0.4, "opportunityCost": 0.2}
+    },
+    "LIBRARIAN": {
+        "immediate": {"userFeedback": 1.0},
+        "delayed": {
+            "conflictPrevention": 2.0,
+            "falsePositivePenalty": 0.5,
+            "missedIssuePenalty": 2.0,
+            "dependencyAccuracy": 0.5
+        }
+    },
+    "PRIORITIZER": {
+        "immediate": {"userAcceptance": 1.0},
+        "delayed": {
+            "completionSuccess": 1.0,
+            "timeEfficiency": 0.5,
+            "strategicProgress": 0.8,
+            "opportunityCost": 0.3
+        },
+        "contextual": {"energyAlignment": 0.2, "flowMaintenance": 0.2}
+    },
+    "STORER": {
+        "immediate": {"userAcceptance": 1.0, "editDistance": 0.5},
+        "delayed": {
+            "corpusCoherence": 0.7,
+            "findability": 0.6,
+            "duplicationPenalty": 0.4
+        }
+    },
+    "RETRIEVER": {
+        "immediate": {"userAcceptance": 1.0, "editDistance": 0.5},
+        "accuracy": {
+            "citationCorrectness": 0.8,
+            "hallucinationPenalty": 2.0,
+            "completeness": 0.6
+        },
+        "quality": {"coherence": 0.4, "styleAlignment": 0.3}
+    }
+}
+
+
+def _flatten_weights(weights: Dict[str, Any], prefix: str = "") -> Dict[str, float]:
+    """Flatten a nested weight table to {dotted.path: weight}"""
+    flat = {}
+    for key, value in weights.items():
+        path = f"{prefix}.{key}" if prefix else key
+        if isinstance(value, dict):
+            flat.update(_flatten_weights(value, path))
+        elif isinstance(value, (int, float)):
+            flat[path] = float(value)
+    return flat
+
+# Flattened once at import; a dotted path resolves exactly like get_nested_weight
+FLAT_REWARD_WEIGHTS: Dict[str, Dict[str, float]] = {
+    agent_type: _flatten_weights(agent_weights)
+    for agent_type, agent_weights in REWARD_WEIGHTS.items()
+}
+
+# Fallback reward by user feedback when a decision has no components
+FEEDBACK_REWARDS: Dict[str, float] = {
+    "CONFIRMED": 1.0,
+    "CORRECTED": -0.5,
+    "OVERRIDDEN": -0.8,
+    "IGNORED": 0.0
+}
+
+def calculate_reward_from_record(record: DecisionRecord, recompute: bool = False) -> float:
     """
     Calculate reward from a DecisionRecord
     
-    Uses the stored reward if available, otherwise calculates from components
+    Uses the stored reward if available (unless ``recompute`` is set),
+    otherwise calculates from components
     """
-    if record.reward is not None:
+    if record.reward is not None and not recompute:
         return record.reward
     
     # If we have reward components, calculate from them
@@ -22,16 +104,7 @@ def calculate_reward_from_record(record: DecisionRecord) -> float:
         )
     
     # Fallback: simple reward based on user feedback
-    if record.user_feedback == "CONFIRMED":
-        return 1.0
-    elif record.user_feedback == "CORRECTED":
-        return -0.5
-    elif record.user_feedback == "OVERRIDDEN":
-        return -0.8
-    elif record.user_feedback == "IGNORED":
-        return 0.0
-    
-    return 0.0
+    return FEEDBACK_REWARDS.get(record.user_feedback, 0.0)
 
 def calculate_reward_from_components(
     agent_type: str,
@@ -42,76 +115,154 @@ def calculate_reward_from_components(
     
     This matches the logic in src/lib/reward-calculator.ts
     """
-    # Reward weights (should match REWARD_WEIGHTS in reward-calculator.ts)
-    weights = {
-        "FILER": {
-            "immediate": {"userFeedback": 1.0, "confidenceCalibration": 0.1},
-            "delayed": {
-                "completionSuccess": 0.5,
-                "blockageAvoidance": 0.3,
-                "reworkPenalty": 0.2,
-                "timeEfficiency": 0.3
-            },
-            "strategic": {"goalAlignment": 0.4, "opportunityCost": 0.2}
-        },
-        "LIBRARIAN": {
-            "immediate": {"userFeedback": 1.0},
-            "delayed": {
-                "conflictPrevention": 2.0,
-                "falsePositivePenalty": 0.5,
-                "missedIssuePenalty": 2.0,
-                "dependencyAccuracy": 0.5
-            }
-        },
-        "PRIORITIZER": {
-            "immediate": {"userAcceptance": 1.0},
-            "delayed": {
-                "completionSuccess": 1.0,
-                "timeEfficiency": 0.5,
-                "strategicProgress": 0.8,
-                "opportunityCost": 0.3
-            },
-            "contextual": {"energyAlignment": 0.2, "flowMaintenance": 0.2}
-        },
-        "STORER": {
-            "immediate": {"userAcceptance": 1.0, "editDistance": 0.5},
-            "delayed": {
-                "corpusCoherence": 0.7,
-                "findability": 0.6,
-                "duplicationPenalty": 0.4
-            }
-        },
-        "RETRIEVER": {
-            "immediate": {"userAcceptance": 1.0, "editDistance": 0.5},
-            "accuracy": {
-                "citationCorrectness": 0.8,
-                "hallucinationPenalty": 2.0,
-                "completeness": 0.6
-            },
-            "quality": {"coherence": 0.4, "styleAlignment": 0.3}
-        }
-    }
-    
-    agent_weights = weights.get(agent_type, {})
+    agent_weights = FLAT_REWARD_WEIGHTS.get(agent_type, {})
     total_reward = 0.0
     
-    def traverse(obj: Dict[str, Any], prefix: str = "") -> None:
-        nonlocal total_reward
-        for key, value in obj.items():
-            path = f"{prefix}.{key}" if prefix else key
-            
-            if isinstance(value, (int, float)):
-                # Get weight for this component
-                weight = get_nested_weight(agent_weights, path)
-                total_reward += weight * value
-            elif isinstance(value, dict):
-                traverse(value, path)
-    
-    traverse(components)
+    for path, value in _iter_leaves(components):
+        total_reward += agent_weights.get(path, 0.0) * value
     
     # Clamp to reasonable range
     return max(-5.0, min(5.0, total_reward))
 
+def _iter_leaves(obj: Dict[str, Any], prefix: str = "") -> Iterator[Tuple[str, float]]:
+    """Yield (dotted.path, value) for numeric leaves in traversal order"""
+    for key, value in obj.items():
+        path = f"{prefix}.{key}" if prefix else key
+        
+        if isinstance(value, (int, float)):
+            yield path, value
+        elif isinstance(value, dict):
+            yield from _iter_leaves(value, path)
+
+class RewardEngine:
+    """
+    Batch reward calculator for one agent type
+    
+    The agent's weight table is compiled once into a path -> index map and
+    a weight array (index 0 holds 0.0 for unknown paths). A batch of
+    reward_components is laid out as index/value matrices, one column per
+    leaf in each record's traversal order, and summed column by column.
+    That reproduces the scalar function's left-to-right float additions
+    exactly, so results are identical to calculate_reward_from_components.
+    """
+    
+    def __init__(self, agent_type: str):
+        self.agent_type = agent_type
+        flat = FLAT_REWARD_WEIGHTS.get(agent_type, {})
+        self.path_index = {path: index + 1 for index, path in enumerate(flat)}
+        self.weights = np.array([0.0] + list(flat.values()), dtype=np.float64)
+    
+    def calculate_batch(self, components_list: Sequence[Dict[str, Any]]) -> np.ndarray:
+        """Clamped rewards for a batch of reward_components dicts"""
+        path_index = self.path_index
+        rows = [
+            [(path_index.get(path, 0), value) for path, value in _iter_leaves(components)]
+            for components in components_list
+        ]
+        
+        width = max((len(row) for row in rows), default=0)
+        indices = np.zeros((len(rows), width), dtype=np.intp)
+        values = np.zeros((len(rows), width), dtype=np.float64)
+        for row_index, row in enumerate(rows):
+            if row:
+                row_indices, row_values = zip(*row)
+                indices[row_index, :len(row)] = row_indices
+                values[row_index, :len(row)] = row_values
+        
+        # inf * 0.0 for unknown paths is nan, as in the scalar path
+        with np.errstate(invalid="ignore", over="ignore"):
+            products = self.weights[indices] * values
+            totals = np.zeros(len(rows), dtype=np.float64)
+            for column in range(width):
+                totals += products[:, column]
+        
+        # max(-5, min(5, nan)) is 5.0 in Python; keep that behavior
+        return np.where(np.isnan(totals), 5.0, np.clip(totals, -5.0, 5.0))
+
+_ENGINES: Dict[str, RewardEngine] = {}
+
+def get_reward_engine(agent_type: str) -> RewardEngine:
+    """Compiled RewardEngine for an agent type (cached)"""
+    engine = _ENGINES.get(agent_type)
+    if engine is None:
+        engine = _ENGINES[agent_type] = RewardEngine(agent_type)
+    return engine
+
+def calculate_rewards_batch(agent_type: str, components_list: Sequence[Dict[str, Any]]) -> np.ndarray:
+    """Vectorized calculate_reward_from_components over many decisions"""
+    return get_reward_engine(agent_type).calculate_batch(components_list)
+
+def calculate_rewards_for_records(records: Sequence[DecisionRecord], recompute: bool = False) -> List[float]:
+    """
+    calculate_reward_from_record for many records at once
+    
+    Records with reward_components are computed in one vectorized pass per
+    agent type; stored rewards and feedback fallbacks are applied as usual.
+    """
+    rewards: List[Optional[float]] = [None] * len(records)
+    pending: Dict[str, List[int]] = {}
+    
+    for index, record in enumerate(records):
+        if (record.reward is None or recompute) and record.reward_components:
+            pending.setdefault(record.agent_type, []).append(index)
+        else:
+            rewards[index] = calculate_reward_from_record(record, recompute=recompute)
+    
+    for agent_type, indices in pending.items():
+        batch = calculate_rewards_batch(agent_type, [records[index].reward_components for index in indices])
+        for index, reward in zip(indices, batch.tolist()):
+            rewards[index] = reward
+    
+    return rewards
+
+def _sql_literal(value: str) -> str:
+    return "'" + value.replace("'", "''") + "'"
+
+def reward_sql_expression(
+    agent_type: str,
+    components: str = 'd."rewardComponents"',
+    user_feedback: str = 'd."userFeedback"'
+) -> str:
+    """
+    SQL equivalent of calculate_reward_from_record for a decision without
+    a stored reward, generated from REWARD_WEIGHTS
+    
+    Each weighted path is read with ``#>``; numbers and booleans count like
+    Python ints/floats/bools, anything else (or a missing path) as 0. The
+    sum is clamped to [-5, 5]. Null, non-object or empty components fall
+    back to FEEDBACK_REWARDS. The terms are added in weight-table order
+    rather than component order, so results can differ from Python in the
+    last few bits.
+    
+    Args:
+        agent_type: Agent whose weights are used
+        components: SQL expression for the jsonb reward components
+        user_feedback: SQL expression for the feedback enum
+    """
+    terms = []
+    for path, weight in FLAT_REWARD_WEIGHTS.get(agent_type, {}).items():
+        keys = _sql_literal("{" + ",".join(f'"{key}"' for key in path.split(".")) + "}")
+        leaf = f"{components} #> {keys}"
+        terms.append(
+            f"{weight!r} * (CASE jsonb_typeof({leaf}) "
+            f"WHEN 'number' THEN CAST({components} #>> {keys} AS double precision) "
+            f"WHEN 'boolean' THEN CAST(CAST({components} #>> {keys} AS boolean) AS integer) "
+            f"ELSE 0 END)"
+        )
+    weighted_sum = "\n            + ".join(terms) or "0"
+    
+    fallback = " ".join(
+        f"WHEN {_sql_literal(feedback)} THEN {reward!r}" for feedback, reward in FEEDBACK_REWARDS.items()
+    )
+    
+    return f"""CASE
+        WHEN jsonb_typeof({components}) = 'object' AND {components} <> CAST('{{}}' AS jsonb) THEN
+            GREATEST(-5.0, LEAST(5.0,
+            {weighted_sum}
+            ))
+        ELSE CASE CAST({user_feedback} AS text) {fallback} ELSE 0.0 END
+    END"""
+
 def get_nested_weight(weights: Dict[str, Any], path: str) -> float:
     """Get nested weight value from path"""
     parts = path.split(".")
@@ -125,6 +276,178 @@ def get_nested_weight(weights: Dict[str, Any], path: str) -> float:
     
     return float(current) if isinstance(current, (int, float)) else 0.0
 
-def normalize_reward(reward: float, min_reward: float = -2.0, max_reward: float = 2.0) -> float:
-    """Normalize reward to [0, 1] range for training"""
+# Histogram layout for RewardStats quantiles; rewards are clamped to this range
+REWARD_STATS_RANGE = (-5.0, 5.0)
+REWARD_STATS_BINS = 400
+
+def normalize_reward(
+    reward: float,
+    min_reward: float = REWARD_STATS_RANGE[0],
+    max_reward: float = REWARD_STATS_RANGE[1]
+) -> float:
+    """Normalize reward to [0, 1] range for training
+    
+    The default bounds are the [-5, 5] clamp of calculate_reward_from_components,
+    so every reward it can produce maps into [0, 1].
+    """
     return (reward - min_reward) / (max_reward - min_reward)
+
+def _histogram_bin(reward: float) -> int:
+    """Histogram bin of one reward (scalar counterpart of _histogram_bins)"""
+    low, high = REWARD_STATS_RANGE
+    scaled = (reward - low) / (high - low) * REWARD_STATS_BINS
+    if scaled < 0:
+        return 0
+    if scaled >= REWARD_STATS_BINS:
+        return REWARD_STATS_BINS - 1
+    return int(scaled)
+
+def _histogram_bins(values: np.ndarray) -> np.ndarray:
+    """Histogram bin of each reward (out-of-range values go to the end bins)"""
+    low, high = REWARD_STATS_RANGE
+    scaled = (values - low) / (high - low) * REWARD_STATS_BINS
+    return np.clip(np.floor(scaled), 0, REWARD_STATS_BINS - 1).astype(np.intp)
+
+class RewardStats:
+    """
+    Streaming reward statistics for one agent type
+    
+    Mean and variance are kept with Welford's online update, and two
+    instances combine with Chan's parallel formula, so statistics from
+    partitions or separate runs merge exactly without revisiting the data.
+    Quantiles come from a fixed-bin histogram over REWARD_STATS_RANGE,
+    which merges by addition and is accurate to one bin width (0.025).
+    """
+    
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min: Optional[float] = None
+        self.max: Optional[float] = None
+        self.histogram = np.zeros(REWARD_STATS_BINS, dtype=np.int64)
+    
+    def update(self, reward: float):
+        """Add one reward"""
+        self.count += 1
+        delta = reward - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (reward - self.mean)
+        self.min = reward if self.min is None else min(self.min, reward)
+        self.max = reward if self.max is None else max(self.max, reward)
+        self.histogram[_histogram_bin(reward)] += 1
+    
+    def update_many(self, rewards: Iterable[float]):
+        """Add a batch of rewards (vectorized, then merged)"""
+        values = np.fromiter(rewards, dtype=np.float64)
+        if values.size == 0:
+            return
+        
+        batch = RewardStats()
+        batch.count = int(values.size)
+        batch.mean = float(values.mean())
+        batch.m2 = float(np.square(values - batch.mean).sum())
+        batch.min = float(values.min())
+        batch.max = float(values.max())
+        batch.histogram = np.bincount(_histogram_bins(values), minlength=REWARD_STATS_BINS).astype(np.int64)
+        self.merge(batch)
+    
+    def merge(self, other: "RewardStats") -> "RewardStats":
+        """Fold another RewardStats into this one and return self"""
+        if other.count == 0:
+            return self
+        
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta * delta * self.count * other.count / count
+        self.count = count
+        self.min = other.min if self.min is None else min(self.min, other.min)
+        self.max = other.max if self.max is None else max(self.max, other.max)
+        self.histogram = self.histogram + other.histogram
+        return self
+    
+    @property
+    def variance(self) -> float:
+        """Population variance (0.0 until there are two rewards)"""
+        return self.m2 / self.count if self.count > 1 else 0.0
+    
+    @property
+    def std(self) -> float:
+        return float(np.sqrt(self.variance))
+    
+    def quantile(self, q: float) -> Optional[float]:
+        """Approximate q-quantile (0 <= q <= 1), interpolated within a bin"""
+        if self.count == 0:
+            return None
+        
+        cumulative = np.cumsum(self.histogram)
+        target = q * self.count
+        index = min(int(np.searchsorted(cumulative, target, side="left")), REWARD_STATS_BINS - 1)
+        before = cumulative[index - 1] if index else 0
+        in_bin = self.histogram[index]
+        fraction = (target - before) / in_bin if in_bin else 0.0
+        
+        low, high = REWARD_STATS_RANGE
+        value = low + (index + fraction) * (high - low) / REWARD_STATS_BINS
+        return float(min(max(value, self.min), self.max))
+    
+    def whiten(self, reward: float, clip: Optional[float] = None) -> float:
+        """Standardize a reward to zero mean and unit variance"""
+        std = self.std
+        z = (reward - self.mean) / std if std > 0 else reward - self.mean
+        if clip is not None:
+            z = max(-clip, min(clip, z))
+        return z
+    
+    def to_dict(self) -> Dict:
+        return {
+            "count": self.count,
+            "mean": self.mean,
+            "m2": self.m2,
+            "std": self.std,
+            "min": self.min,
+            "max": self.max,
+            "quantiles": {f"p{round(q * 100):02d}": self.quantile(q) for q in (0.05, 0.25, 0.5, 0.75, 0.95)},
+            "histogram": {
+                "range": list(REWARD_STATS_RANGE),
+                "bins": REWARD_STATS_BINS,
+                "counts": self.histogram.tolist()
+            }
+        }
+    
+    @classmethod
+    def from_dict(cls, data: Dict) -> "RewardStats":
+        histogram = data["histogram"]
+        if tuple(histogram["range"]) != REWARD_STATS_RANGE or histogram["bins"] != REWARD_STATS_BINS:
+            raise ValueError(
+                f"Reward stats histogram {histogram['range']} x {histogram['bins']} does not match "
+                f"{list(REWARD_STATS_RANGE)} x {REWARD_STATS_BINS}"
+            )
+        
+        stats = cls()
+        stats.count = data["count"]
+        stats.mean = data["mean"]
+        stats.m2 = data["m2"]
+        stats.min = data["min"]
+        stats.max = data["max"]
+        stats.histogram = np.array(histogram["counts"], dtype=np.int64)
+        return stats
+
+def get_reward_stats_path(dataset_path: str) -> str:
+    """Reward statistics file kept beside an exported dataset"""
+    return dataset_path + ".reward_stats.json"
+
+def load_reward_stats(path: str) -> Dict[str, RewardStats]:
+    """Load per-agent RewardStats (empty if the file does not exist)"""
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r') as f:
+        return {agent_type: RewardStats.from_dict(data) for agent_type, data in json.load(f).items()}
+
+def save_reward_stats(path: str, stats: Dict[str, RewardStats]):
+    """Atomically write per-agent RewardStats"""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump({agent_type: agent_stats.to_dict() for agent_type, agent_stats in stats.items()}, f, indent=2)
+    os.replace(tmp_path, path)
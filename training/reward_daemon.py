@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+"""
+Event-driven reward worker
+
+Listens on the decision_reward_pending channel (see the
+add_decision_reward_notify migration) and recomputes rewards for decisions
+whose feedback or outcomes changed, in micro-batches bounded by size and
+latency. Falls back to polling for stale rewards when LISTEN is not
+available, e.g. behind a transaction-mode connection pooler.
+
+Usage:
+    python reward_daemon.py --agent-type ALL
+    python reward_daemon.py --agent-type FILER --max-latency 1 --max-batch-size 200
+    python reward_daemon.py --poll --poll-interval 30
+"""
+import time
+import select
+import signal
+import argparse
+from typing import Dict, Sequence
+import psycopg2
+from dotenv import load_dotenv
+from sqlalchemy.exc import SQLAlchemyError
+
+from training.calculate_rewards import REWARD_COLUMNS
+from training.database import (
+    AGENT_TYPES,
+    connect_psycopg2,
+    iter_stale_reward_decisions,
+    load_decisions_by_ids,
+    write_rewards,
+)
+from training.reward_calculator import calculate_rewards_for_records
+
+load_dotenv()
+
+# Channel the Decision trigger notifies with "<agentType>:<id>"
+REWARD_CHANNEL = "decision_reward_pending"
+
+class RewardDaemon:
+    """
+    Long-running reward worker
+
+    Pending decision ids are coalesced (a decision changed twice before a
+    flush is scored once) and flushed when ``max_batch_size`` ids are
+    waiting or the oldest has waited ``max_latency`` seconds. A sweep for
+    stale rewards runs at start-up and then every ``poll_interval`` seconds
+    while polling, or every ``sweep_interval`` seconds while listening to
+    catch notifications missed during reconnects or failed batches.
+    """
+
+    def __init__(
+        self,
+        agent_types: Sequence[str],
+        max_batch_size: int = 500,
+        max_latency: float = 2.0,
+        listen: bool = True,
+        poll_interval: float = 30.0,
+        sweep_interval: float = 600.0,
+        stats_interval: float = 60.0
+    ):
+        self.agent_types = list(agent_types)
+        self.max_batch_size = max_batch_size
+        self.max_latency = max_latency
+        self.listen = listen
+        self.poll_interval = poll_interval
+        self.sweep_interval = sweep_interval
+        self.stats_interval = stats_interval
+
+        self.conn = None
+        self.running = False
+        self.pending: Dict[str, float] = {}  # decision id -> monotonic time first seen
+        self.started_at = time.monotonic()
+        self.counters = {
+            "notifications": 0,
+            "swept": 0,
+            "batches": 0,
+            "scored": 0,
+            "rewards_written": 0,
+            "errors": 0,
+            "latency_total": 0.0,
+            "latency_max": 0.0
+        }
+
+    def stop(self, *_):
+        self.running = False
+
+    def enqueue(self, decision_id: str):
+        self.pending.setdefault(decision_id, time.monotonic())
+
+    def _start_listening(self) -> bool:
+        """Open the LISTEN connection; False if the server does not allow it"""
+        try:
+            conn = connect_psycopg2()
+            conn.autocommit = True
+            with conn.cursor() as cur:
+                cur.execute(f"LISTEN {REWARD_CHANNEL}")
+        except psycopg2.Error as error:
+            print(f"⚠️  LISTEN unavailable ({str(error).strip()}); polling every {self.poll_interval:.0f}s")
+            return False
+
+        self.conn = conn
+        print(f"👂 Listening on {REWARD_CHANNEL}")
+        return True
+
+    def _stop_listening(self):
+        if self.conn is not None:
+            try:
+                self.conn.close()
+            except psycopg2.Error:
+                pass
+            self.conn = None
+
+    def _receive(self, timeout: float):
+        """Wait up to ``timeout`` seconds for notifications and queue their ids"""
+        ready, _, _ = select.select([self.conn], [], [], timeout)
+        if not ready:
+            return
+
+        self.conn.poll()
+        while self.conn.notifies:
+            notify = self.conn.notifies.pop(0)
+            agent_type, _, decision_id = notify.payload.partition(":")
+            if agent_type in self.agent_types and decision_id:
+                self.counters["notifications"] += 1
+                self.enqueue(decision_id)
+
+    def sweep(self):
+        """Queue every decision with a missing or stale reward"""
+        for agent_type in self.agent_types:
+            stale = iter_stale_reward_decisions(
+                agent_type, columns=[], page_size=self.max_batch_size, is_training_data=True
+            )
+            for decision in stale:
+                self.counters["swept"] += 1
+                self.enqueue(decision.id)
+                if len(self.pending) >= self.max_batch_size:
+                    self.flush()
+
+    def _due(self) -> bool:
+        if not self.pending:
+            return False
+        if len(self.pending) >= self.max_batch_size:
+            return True
+        oldest = next(iter(self.pending.values()))
+        return time.monotonic() - oldest >= self.max_latency
+
+    def flush(self):
+        """Score and write every pending decision in one batch"""
+        batch, self.pending = self.pending, {}
+
+        try:
+            records = load_decisions_by_ids(list(batch), columns=REWARD_COLUMNS)
+            rewards = calculate_rewards_for_records(records, recompute=True)
+            result = write_rewards(zip((record.id for record in records), rewards), batch_size=max(len(records), 1))
+        except (SQLAlchemyError, psycopg2.Error) as error:
+            # Dropped ids keep a stale reward, so the next sweep retries them
+            self.counters["errors"] += 1
+            print(f"❌ Reward batch of {len(batch)} failed: {error}")
+            return
+
+        now = time.monotonic()
+        for first_seen in batch.values():
+            latency = now - first_seen
+            self.counters["latency_total"] += latency
+            self.counters["latency_max"] = max(self.counters["latency_max"], latency)
+        self.counters["batches"] += 1
+        self.counters["scored"] += len(batch)
+        self.counters["rewards_written"] += result["updated"]
+
+    def print_stats(self):
+        counters = self.counters
+        uptime = time.monotonic() - self.started_at
+        avg_latency = counters["latency_total"] / counters["scored"] if counters["scored"] else 0.0
+        print(
+            f"📈 {counters['notifications']} notifications, {counters['swept']} swept, "
+            f"{counters['batches']} batches, {counters['rewards_written']} rewards "
+            f"({counters['rewards_written'] / uptime if uptime > 0 else 0.0:.1f}/s), "
+            f"latency avg {avg_latency:.2f}s max {counters['latency_max']:.2f}s, "
+            f"{counters['errors']} errors"
+        )
+
+    def run(self):
+        """Process events until stopped (SIGINT/SIGTERM), then flush and exit"""
+        self.running = True
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+
+        listening = self.listen and self._start_listening()
+        self.sweep()  # Catch up on anything that changed while we were down
+        last_sweep = last_stats = time.monotonic()
+
+        while self.running:
+            now = time.monotonic()
+            sweep_every = self.sweep_interval if listening else self.poll_interval
+            deadlines = [last_sweep + sweep_every, last_stats + self.stats_interval, now + 1.0]
+            if self.pending:
+                deadlines.append(next(iter(self.pending.values())) + self.max_latency)
+            timeout = max(0.0, min(deadlines) - now)
+
+            if listening:
+                try:
+                    self._receive(timeout)
+                except (psycopg2.Error, OSError) as error:
+                    print(f"⚠️  Lost LISTEN connection ({error}); polling until it is back")
+                    self._stop_listening()
+                    listening = False
+            else:
+                time.sleep(timeout)
+
+            if self._due():
+                self.flush()
+
+            now = time.monotonic()
+            if now - last_sweep >= sweep_every:
+                if self.listen and not listening:
+                    listening = self._start_listening()
+                self.sweep()
+                last_sweep = now
+
+            if now - last_stats >= self.stats_interval:
+                self.print_stats()
+                last_stats = now
+
+        if self.pending:
+            self.flush()
+        self._stop_listening()
+        self.print_stats()
+
+def main():
+    parser = argparse.ArgumentParser(description="Recompute rewards as feedback and outcomes arrive")
+    parser.add_argument("--agent-type", default="ALL", choices=["ALL"] + AGENT_TYPES, help="Agent type")
+    parser.add_argument("--max-batch-size", type=int, default=500, help="Flush once this many decisions are pending")
+    parser.add_argument("--max-latency", type=float, default=2.0, help="Flush once the oldest pending decision has waited this many seconds")
+    parser.add_argument("--poll", action="store_true", help="Poll for stale rewards instead of using LISTEN/NOTIFY")
+    parser.add_argument("--poll-interval", type=float, default=30.0, help="Seconds between polls when not listening")
+    parser.add_argument("--sweep-interval", type=float, default=600.0, help="Seconds between safety sweeps while listening")
+    parser.add_argument("--stats-interval", type=float, default=60.0, help="Seconds between throughput reports")
+
+    args = parser.parse_args()
+    agent_types = AGENT_TYPES if args.agent_type == "ALL" else [args.agent_type]
+
+    print(f"🔢 Reward daemon for {', '.join(agent_types)} "
+          f"(batch ≤ {args.max_batch_size}, latency ≤ {args.max_latency}s)")
+    RewardDaemon(
+        agent_types,
+        max_batch_size=args.max_batch_size,
+        max_latency=args.max_latency,
+        listen=not args.poll,
+        poll_interval=args.poll_interval,
+        sweep_interval=args.sweep_interval,
+        stats_interval=args.stats_interval
+    ).run()
+    print("✅ Reward daemon stopped")
+
+if __name__ == "__main__":
+    main()
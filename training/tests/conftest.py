@@ -0,0 +1,105 @@
+"""
+Shared fixtures for the training pipeline tests
+
+Tests that need Postgres use ``decision_db``, which is skipped unless
+TEST_DATABASE_URL points at a database the tests may create schemas in:
+
+    TEST_DATABASE_URL=postgresql://localhost/os_test python -m pytest training/tests
+"""
+import os
+import json
+import uuid
+from datetime import datetime, timedelta
+from urllib.parse import quote
+
+import pytest
+from sqlalchemy import create_engine, text
+
+from training.database import dispose_engines
+
+# Columns of the Prisma Decision model the Python pipeline reads or writes
+DECISION_DDL = """
+    CREATE TABLE "Decision" (
+        id text PRIMARY KEY,
+        "agentType" text NOT NULL,
+        state jsonb NOT NULL,
+        action jsonb NOT NULL,
+        reward double precision,
+        "rewardComponents" jsonb,
+        confidence double precision,
+        reasoning text,
+        "userFeedback" text,
+        "userCorrection" jsonb,
+        "outcomeMetrics" jsonb,
+        "itemId" text,
+        "opusId" text,
+        "modelVersion" text NOT NULL DEFAULT 'test',
+        "createdAt" timestamp(3) NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        "updatedAt" timestamp(3) NOT NULL,
+        "rewardComputedAt" timestamp(3),
+        "feedbackAt" timestamp(3),
+        "outcomeObservedAt" timestamp(3),
+        "isTrainingData" boolean NOT NULL DEFAULT true,
+        "isValidationData" boolean NOT NULL DEFAULT false
+    )
+"""
+
+class DecisionDB:
+    """Engine on a scratch schema holding an empty Decision table"""
+
+    def __init__(self, engine):
+        self.engine = engine
+
+    def insert(self, decision_id: str, agent_type: str = "FILER", updated_at: datetime = None, **values):
+        """Insert one decision; JSON columns take Python values"""
+        row = {
+            "id": decision_id,
+            "agentType": agent_type,
+            "state": {"item": {"title": decision_id, "rawInstructions": "file this"}},
+            "action": {"swimlane": "Project"},
+            "updatedAt": updated_at or datetime.now() - timedelta(days=1),
+            **values
+        }
+        columns = ", ".join(f'"{name}"' for name in row)
+        placeholders = ", ".join(
+            f"CAST(:{name} AS jsonb)" if isinstance(value, (dict, list)) else f":{name}"
+            for name, value in row.items()
+        )
+        params = {name: _json(value) for name, value in row.items()}
+        with self.engine.begin() as conn:
+            conn.execute(text(f'INSERT INTO "Decision" ({columns}) VALUES ({placeholders})'), params)
+
+    def fetch(self, decision_id: str):
+        with self.engine.connect() as conn:
+            return conn.execute(text('SELECT * FROM "Decision" WHERE id = :id'), {"id": decision_id}).one()
+
+def _json(value):
+    return json.dumps(value) if isinstance(value, (dict, list)) else value
+
+@pytest.fixture
+def decision_db(monkeypatch):
+    base_url = os.getenv("TEST_DATABASE_URL")
+    if not base_url:
+        pytest.skip("TEST_DATABASE_URL not set")
+
+    schema = f"training_test_{uuid.uuid4().hex[:12]}"
+    admin = create_engine(base_url)
+    with admin.begin() as conn:
+        conn.execute(text(f'CREATE SCHEMA "{schema}"'))
+
+    # Every connection the pipeline opens (pooled, COPY) lands in the scratch schema
+    separator = "&" if "?" in base_url else "?"
+    url = f"{base_url}{separator}options={quote(f'-csearch_path={schema}')}"
+    monkeypatch.setenv("DATABASE_URL", url)
+    engine = create_engine(url)
+    with engine.begin() as conn:
+        conn.execute(text(DECISION_DDL))
+
+    try:
+        yield DecisionDB(engine)
+    finally:
+        engine.dispose()
+        dispose_engines()
+        with admin.begin() as conn:
+            conn.execute(text(f'DROP SCHEMA "{schema}" CASCADE'))
+        admin.dispose()
@@ -0,0 +1,60 @@
+"""Sharded datasets and the context side table"""
+import json
+import os
+
+from training.dataset_io import (
+    ContextTableWriter,
+    ShardedJsonlWriter,
+    compact_prompt,
+    context_report,
+    get_context_path,
+    read_examples,
+    verify_manifest,
+)
+
+def _write(output, ids, shard_size=2):
+    writer = ShardedJsonlWriter(output, compression="gzip", shard_size=shard_size)
+    for decision_id in ids:
+        writer.write(json.dumps({"id": decision_id}) + "\n")
+    return writer
+
+def _ids(output):
+    return [example["id"] for example in read_examples(output)]
+
+def test_aborted_export_keeps_previous_shards(tmp_path):
+    output = str(tmp_path / "filer.jsonl")
+    _write(output, ["a", "b", "c", "d", "e"]).close()
+    before = sorted(os.listdir(tmp_path))
+
+    writer = _write(output, ["x", "y", "z"])
+    assert _ids(output) == ["a", "b", "c", "d", "e"]  # New shards are not in place yet
+    writer.abort()
+
+    assert sorted(os.listdir(tmp_path)) == before
+    assert _ids(output) == ["a", "b", "c", "d", "e"]
+    assert verify_manifest(output) == []
+
+def test_close_replaces_shards_and_drops_leftovers(tmp_path):
+    output = str(tmp_path / "filer.jsonl")
+    _write(output, ["a", "b", "c", "d", "e"]).close()
+
+    _write(output, ["x", "y"]).close()
+
+    assert _ids(output) == ["x", "y"]
+    assert verify_manifest(output) == []
+    assert sorted(os.listdir(tmp_path)) == ["filer-00000.jsonl.gz", "filer.jsonl.manifest.json"]
+
+def test_context_report_counts_utf8_bytes(tmp_path):
+    output = str(tmp_path / "filer.jsonl")
+    block = "Café roadmap — ünïcode " * 20
+    prompt = f"Instructions: x\nContent: {block}..."
+    parts, contexts = compact_prompt(prompt, [block])
+    writer = ContextTableWriter(get_context_path(output))
+    writer.add(contexts)
+    report = writer.close()
+    with open(output, "w") as f:
+        f.write(json.dumps({"promptParts": parts}) + "\n")
+
+    assert report["storedBytes"] == os.path.getsize(get_context_path(output))
+    assert report["referencedBytes"] == len(json.dumps(block).encode("utf-8")) - 2
+    assert context_report(output) == report
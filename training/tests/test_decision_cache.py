@@ -0,0 +1,64 @@
+"""DecisionCache delta syncs against Postgres (needs TEST_DATABASE_URL, see conftest.py)"""
+from datetime import datetime, timedelta
+from itertools import islice
+
+import pytest
+from sqlalchemy import text
+
+from training import decision_cache
+from training.database import iter_decision_rows_since, write_rewards
+from training.decision_cache import DecisionCache
+
+def _rewards(cache):
+    return {record.id: record.reward for record in cache.iter_training_decisions("FILER", require_reward=False)}
+
+def test_sync_rereads_lookback_window(decision_db, tmp_path):
+    now = datetime.now()
+    decision_db.insert("d1", reward=0.5, updated_at=now - timedelta(seconds=10))
+    cache = DecisionCache(str(tmp_path / "decisions.sqlite"))
+    assert cache.sync(["FILER"]) == {"FILER": 1}
+
+    # Committed after d1 was synced, but stamped before it
+    decision_db.insert("d0", reward=0.5, updated_at=now - timedelta(seconds=20))
+    cache.sync(["FILER"])
+    assert _rewards(cache) == {"d0": 0.5, "d1": 0.5}
+
+    # Re-reading the window leaves the watermark on the newest row
+    watermark = cache.conn.execute("SELECT id FROM sync_state WHERE agent_type = 'FILER'").fetchone()
+    assert watermark == ("d1",)
+    cache.close()
+
+def test_sync_picks_up_rewards_written_from_python(decision_db, tmp_path):
+    now = datetime.now()
+    decision_db.insert("d0", reward=0.5, updated_at=now - timedelta(days=2))
+    decision_db.insert("d1", reward=0.5, updated_at=now - timedelta(days=1))
+    cache = DecisionCache(str(tmp_path / "decisions.sqlite"))
+    cache.sync(["FILER"])
+
+    write_rewards([("d0", 1.5)])
+    cache.sync(["FILER"])
+    assert _rewards(cache) == {"d0": 1.5, "d1": 0.5}
+    cache.close()
+
+def test_full_sync_drops_deleted_rows_only_once_it_succeeds(decision_db, tmp_path, monkeypatch):
+    now = datetime.now()
+    for index in range(3):
+        decision_db.insert(f"d{index}", reward=0.5, updated_at=now - timedelta(days=3 - index))
+    cache = DecisionCache(str(tmp_path / "decisions.sqlite"))
+    cache.sync(["FILER"])
+    with decision_db.engine.begin() as conn:
+        conn.execute(text("DELETE FROM \"Decision\" WHERE id = 'd1'"))
+
+    def failing_rows(*args, **kwargs):
+        yield from islice(iter_decision_rows_since(*args, **kwargs), 1)
+        raise ConnectionError("server closed the connection")
+
+    monkeypatch.setattr(decision_cache, "iter_decision_rows_since", failing_rows)
+    with pytest.raises(ConnectionError):
+        cache.sync(["FILER"], full=True, page_size=1)
+    assert _rewards(cache) == {"d0": 0.5, "d1": 0.5, "d2": 0.5}
+
+    monkeypatch.setattr(decision_cache, "iter_decision_rows_since", iter_decision_rows_since)
+    assert cache.sync(["FILER"], full=True) == {"FILER": 2}
+    assert _rewards(cache) == {"d0": 0.5, "d2": 0.5}
+    cache.close()
@@ -0,0 +1,35 @@
+"""DecisionRecord's lazily decoded JSON columns"""
+import dataclasses
+
+from training.database import DecisionBatch, raw_json_payload, row_to_decision
+
+def _record(outcome_metrics):
+    row = ("d1", "FILER", '{"item": {"title": "t"}}', '{"swimlane": "Project"}', None, None, None,
+           None, None, None, outcome_metrics)
+    return row_to_decision(row, [
+        "id", "agent_type", "state", "action", "reward", "reward_components", "confidence",
+        "reasoning", "user_feedback", "user_correction", "outcome_metrics",
+    ])
+
+def test_row_values_are_decoded_once():
+    record = _record('"\\"quoted\\""')
+    assert raw_json_payload(record, "state") == '{"item": {"title": "t"}}'
+    assert record.state == {"item": {"title": "t"}}
+    assert record.outcome_metrics == '"quoted"'
+    assert record.outcome_metrics == '"quoted"'
+
+def test_replace_keeps_decoded_json_string():
+    record = _record('"done"')
+    assert record.outcome_metrics == "done"
+    copy = dataclasses.replace(record)
+    assert copy.outcome_metrics == "done"
+    copy.outcome_metrics = "{not json"
+    assert copy.outcome_metrics == "{not json"
+
+def test_batch_round_trips_decoded_json_string():
+    record = _record('"done"')
+    assert record.outcome_metrics == "done"
+    batch = DecisionBatch.from_records([record, _record(None)])
+    assert batch[0].outcome_metrics == "done"
+    assert batch[0].state == {"item": {"title": "t"}}
+    assert batch[1].outcome_metrics is None
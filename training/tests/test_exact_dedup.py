@@ -0,0 +1,47 @@
+"""ExactDuplicateFilter grouping and reward merging"""
+import hashlib
+import json
+
+from training.export_training_data import ExactDuplicateFilter, FormattedExample
+from training.reward_calculator import RewardStats
+
+def _item(decision_id, completion, reward):
+    example = {"prompt": "p", "completion": completion, "reward": reward, "metadata": {"decisionId": decision_id}}
+    return FormattedExample(
+        agent_type="FILER",
+        line=json.dumps(example) + "\n",
+        reward=reward,
+        user_feedback=None,
+        decision_id=decision_id,
+        example=example,
+        key=hashlib.sha256(completion.encode()).hexdigest()
+    )
+
+def test_groups_are_merged_in_order_of_first_appearance(tmp_path):
+    items = [_item("d0", "a", 1.0), _item("d1", "b", 0.5), _item("d2", "a", 0.0), _item("d3", "a", 0.5)]
+    dedup = ExactDuplicateFilter(spool_dir=str(tmp_path))
+
+    merged = list(dedup.filter(items))
+
+    assert [item.decision_id for item in merged] == ["d0", "d1"]
+    assert merged[0].reward == 0.5
+    stored = json.loads(merged[0].line)
+    assert stored["reward"] == 0.5
+    assert stored["metadata"] == {"decisionId": "d0", "duplicateCount": 3, "duplicateDecisionIds": ["d2", "d3"]}
+    assert merged[0].example == stored
+    assert merged[1] == items[1]
+    assert (dedup.seen, dedup.duplicates) == (4, 2)
+    assert list(tmp_path.iterdir()) == []  # The spool is gone once the stream ends
+
+def test_groups_hold_only_aggregates():
+    dedup = ExactDuplicateFilter()
+    for item in (_item("d0", "a", 1.0), _item("d1", "a", 2.0)):
+        dedup.add(item)
+    assert list(dedup.groups.values()) == [[2, 3.0, ["d1"]]]
+
+def test_merged_reward_is_rewhitened():
+    stats = RewardStats()
+    for reward in (0.0, 2.0):
+        stats.update(reward)
+    merged = list(ExactDuplicateFilter(stats).filter([_item("d0", "a", 0.0), _item("d1", "a", 2.0)]))
+    assert json.loads(merged[0].line)["whitenedReward"] == stats.whiten(1.0)
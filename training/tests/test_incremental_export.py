@@ -0,0 +1,62 @@
+"""Incremental export against Postgres (needs TEST_DATABASE_URL, see conftest.py)"""
+import json
+from datetime import datetime, timedelta
+
+from training.database import write_rewards
+from training.export_training_data import export_training_data_incremental, get_watermark_path
+
+def _rewards(path):
+    with open(path) as f:
+        return {example["metadata"]["decisionId"]: example["reward"] for example in map(json.loads, f)}
+
+def test_reward_rewrite_moves_row_past_watermark(decision_db, tmp_path):
+    now = datetime.now()
+    for index in range(3):
+        decision_db.insert(f"d{index}", reward=0.5, updated_at=now - timedelta(days=3 - index))
+    output = str(tmp_path / "filer.jsonl")
+
+    export_training_data_incremental("FILER", output)
+    assert _rewards(output) == {"d0": 0.5, "d1": 0.5, "d2": 0.5}
+    with open(get_watermark_path(output)) as f:
+        watermark = json.load(f)["FILER"]
+
+    # d1 is a day older than the watermark, far outside the lookback, so
+    # only a bumped updatedAt brings it back into the next run
+    write_rewards([("d1", 1.5)])
+    assert decision_db.fetch("d1").updatedAt.isoformat() > watermark["updatedAt"]
+
+    export_training_data_incremental("FILER", output)
+    assert _rewards(output) == {"d0": 0.5, "d1": 1.5, "d2": 0.5}
+
+def _watermark_id(output):
+    with open(get_watermark_path(output)) as f:
+        return json.load(f)["FILER"]["id"]
+
+def test_limit_does_not_stall_on_busy_lookback(decision_db, tmp_path):
+    start = datetime.now() - timedelta(hours=1)
+    for index in range(6):
+        decision_db.insert(f"d{index}", reward=0.5, updated_at=start + timedelta(seconds=index))
+    output = str(tmp_path / "filer.jsonl")
+    export_training_data_incremental("FILER", output)
+    assert _watermark_id(output) == "d5"
+
+    # All six rows stay inside the lookback window, which alone exceeds
+    # --limit 2, yet every run has to make progress
+    for index in range(6, 11):
+        decision_db.insert(f"d{index}", reward=0.5, updated_at=start + timedelta(seconds=index))
+    progress = []
+    for _ in range(3):
+        export_training_data_incremental("FILER", output, limit=2)
+        progress.append(_watermark_id(output))
+    assert progress == ["d7", "d9", "d10"]
+    assert set(_rewards(output)) == {f"d{index}" for index in range(11)}
+
+def test_rebuild_with_limit_keeps_newest(decision_db, tmp_path):
+    now = datetime.now()
+    for index in range(5):
+        decision_db.insert(f"d{index}", reward=0.5, updated_at=now - timedelta(days=5 - index))
+    decision_db.insert("unrewarded", updated_at=now)
+    output = str(tmp_path / "filer.jsonl")
+
+    export_training_data_incremental("FILER", output, limit=2)
+    assert set(_rewards(output)) == {"d3", "d4"}
@@ -0,0 +1,41 @@
+"""Librarian corpus lines with and without a token budget"""
+import re
+
+from training.prompts import format_librarian_prompt
+
+class WordTokenizer:
+    """Whitespace runs and words are one token each"""
+
+    def encode(self, text, add_special_tokens=True):
+        return re.findall(r"\s+|\S+", text)
+
+    def decode(self, tokens):
+        return "".join(tokens)
+
+LONG = " ".join(f"step{index}" for index in range(60))
+STATE = {
+    "newItem": {"title": "New", "rawInstructions": "do it"},
+    "opus": {"name": "Opus", "content": "goals"},
+    "corpus": [{"status": "TODO", "title": f"Item {index}", "rawInstructions": LONG} for index in range(3)],
+}
+
+def _corpus_lines(prompt):
+    return [line for line in prompt.splitlines() if line.startswith("- [TODO]")]
+
+def test_default_cuts_instructions_at_100_characters():
+    lines = _corpus_lines(format_librarian_prompt(STATE))
+    assert lines == [f"- [TODO] Item {index}: {LONG[:100]}..." for index in range(3)]
+
+def test_budget_spends_slack_on_corpus_instructions():
+    tokenizer = WordTokenizer()
+    prompt = format_librarian_prompt(STATE, tokenizer, 2000)
+    assert len(tokenizer.encode(prompt)) <= 2000
+    assert _corpus_lines(prompt) == [f"- [TODO] Item {index}: {LONG}..." for index in range(3)]
+
+def test_tight_budget_trims_instructions_by_tokens():
+    tokenizer = WordTokenizer()
+    prompt = format_librarian_prompt(STATE, tokenizer, 260)
+    lines = _corpus_lines(prompt)
+    assert len(tokenizer.encode(prompt)) <= 260
+    assert len(lines) == 3
+    assert all(LONG[:100] in line and LONG not in line for line in lines)
@@ -0,0 +1,96 @@
+"""calculate_rewards_via_api against a local stub of /api/training/decisions"""
+import json
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from training.calculate_rewards import calculate_rewards_via_api, load_checkpoint
+
+class StubAPI:
+    """Answers each chunk with its scripted statuses first, then 200"""
+
+    def __init__(self):
+        self.failures = {}  # first id of a chunk -> statuses to answer before succeeding
+        self.requests = []  # decisionIds of every request received
+        self.lock = threading.Lock()
+
+    def respond(self, decision_ids):
+        with self.lock:
+            self.requests.append(decision_ids)
+            statuses = self.failures.get(decision_ids[0])
+            if statuses:
+                return statuses.pop(0), {"error": "scripted failure"}
+        return 200, {"updated": len(decision_ids)}
+
+    def attempts(self, first_id):
+        return sum(1 for decision_ids in self.requests if decision_ids[0] == first_id)
+
+@pytest.fixture
+def stub_api():
+    stub = StubAPI()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            status, payload = stub.respond(body["decisionIds"])
+            data = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    stub.url = f"http://127.0.0.1:{server.server_port}"
+    try:
+        yield stub
+    finally:
+        server.shutdown()
+        server.server_close()
+
+IDS = [f"d{index}" for index in range(10)]
+
+def _run(stub, checkpoint, **kwargs):
+    return calculate_rewards_via_api(
+        IDS, stub.url, chunk_size=2, concurrency=3, backoff=0.01, timeout=5.0,
+        checkpoint_path=checkpoint, **kwargs
+    )
+
+def test_transient_failures_are_retried(stub_api, tmp_path):
+    stub_api.failures = {"d2": [503, 502], "d6": [429]}
+    checkpoint = str(tmp_path / "rewards.checkpoint")
+
+    summary = _run(stub_api, checkpoint)
+
+    assert summary == {"updated": 10, "chunks": 5, "failed_chunks": 0, "skipped": 0}
+    assert sorted(ids for ids in stub_api.requests if ids[0] not in ("d2", "d6")) == [
+        ["d0", "d1"], ["d4", "d5"], ["d8", "d9"]
+    ]
+    assert stub_api.attempts("d2") == 3
+    assert stub_api.attempts("d6") == 2
+    assert not os.path.exists(checkpoint)
+
+def test_rerun_resumes_from_checkpoint(stub_api, tmp_path):
+    stub_api.failures = {"d2": [500] * 3, "d8": [400]}
+    checkpoint = str(tmp_path / "rewards.checkpoint")
+
+    summary = _run(stub_api, checkpoint, max_retries=2)
+
+    assert summary == {"updated": 6, "chunks": 5, "failed_chunks": 2, "skipped": 0}
+    assert stub_api.attempts("d2") == 3  # 500 retried until max_retries ran out
+    assert stub_api.attempts("d8") == 1  # 400 is not retried
+    assert load_checkpoint(checkpoint) == {"d0", "d1", "d4", "d5", "d6", "d7"}
+
+    stub_api.requests.clear()
+    summary = _run(stub_api, checkpoint, max_retries=2)
+
+    assert summary == {"updated": 4, "chunks": 2, "failed_chunks": 0, "skipped": 6}
+    assert sorted(stub_api.requests) == [["d2", "d3"], ["d8", "d9"]]
+    assert not os.path.exists(checkpoint)
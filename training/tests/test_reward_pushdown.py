@@ -0,0 +1,50 @@
+"""SQL reward pushdown against Postgres (needs TEST_DATABASE_URL, see conftest.py)"""
+from datetime import datetime, timedelta
+
+from training.calculate_rewards import calculate_rewards_in_database, check_reward_parity
+from training.database import row_to_decision
+from training.reward_calculator import calculate_rewards_for_records
+
+# reward_components/userFeedback pairs covering every branch of reward_sql_expression
+FIXTURES = {
+    "numbers": ({"immediate": {"userFeedback": 1, "confidenceCalibration": 0.75}, "delayed": {"timeEfficiency": -0.4}}, None),
+    "booleans": ({"delayed": {"completionSuccess": True, "blockageAvoidance": False}}, None),
+    "unknown paths": ({"immediate": {"userFeedback": {"nested": 3}}, "extra": 7, "strategic": {"goalAlignment": 0.5}}, None),
+    "strings and nulls": ({"immediate": {"userFeedback": "1.0"}, "delayed": {"reworkPenalty": None}}, "CONFIRMED"),
+    "clamped high": ({"immediate": {"userFeedback": 40}}, None),
+    "clamped low": ({"strategic": {"opportunityCost": -100}}, None),
+    "empty components": ({}, "CORRECTED"),
+    "no components": (None, "OVERRIDDEN"),
+    "no feedback": (None, None),
+}
+
+def _insert_fixtures(decision_db):
+    for index, (components, feedback) in enumerate(FIXTURES.values()):
+        decision_db.insert(f"d{index}", rewardComponents=components, userFeedback=feedback)
+
+def _python_rewards():
+    records = [
+        row_to_decision((f"d{index}", "FILER", components, feedback),
+                        ["id", "agent_type", "reward_components", "user_feedback"])
+        for index, (components, feedback) in enumerate(FIXTURES.values())
+    ]
+    return {record.id: reward for record, reward in zip(records, calculate_rewards_for_records(records))}
+
+def test_sql_expression_matches_python(decision_db):
+    _insert_fixtures(decision_db)
+    result = check_reward_parity("FILER")
+    assert result["checked"] == len(FIXTURES)
+    assert result["mismatches"] == 0, result["examples"]
+
+def test_pushdown_writes_python_rewards_to_training_data(decision_db):
+    _insert_fixtures(decision_db)
+    decision_db.insert("validation", rewardComponents={"immediate": {"userFeedback": 1}}, isTrainingData=False)
+    before = datetime.now() - timedelta(minutes=1)
+
+    assert calculate_rewards_in_database("FILER") == len(FIXTURES)
+
+    for decision_id, reward in _python_rewards().items():
+        row = decision_db.fetch(decision_id)
+        assert abs(row.reward - reward) <= 1e-9, decision_id
+        assert row.updatedAt > before
+    assert decision_db.fetch("validation").reward is None
@@ -0,0 +1,22 @@
+"""RewardStats and reward scaling"""
+import random
+
+import numpy as np
+
+from training.reward_calculator import RewardStats, normalize_reward
+
+def test_update_matches_update_many():
+    rng = random.Random(0)
+    rewards = [rng.uniform(-7.0, 7.0) for _ in range(2000)] + [-5.0, 5.0, 0.0, -4.975, 6.5, -5.5]
+    single = RewardStats()
+    for reward in rewards:
+        single.update(reward)
+    batch = RewardStats()
+    batch.update_many(rewards)
+    assert np.array_equal(single.histogram, batch.histogram)
+
+def test_normalize_reward_covers_the_clamp():
+    assert normalize_reward(-5.0) == 0.0
+    assert normalize_reward(0.0) == 0.5
+    assert normalize_reward(5.0) == 1.0
+    assert normalize_reward(1.0, min_reward=-2.0, max_reward=2.0) == 0.75
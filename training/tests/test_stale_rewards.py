@@ -0,0 +1,10 @@
+"""Stale reward paging against Postgres (needs TEST_DATABASE_URL, see conftest.py)"""
+from training.database import iter_stale_reward_decisions
+
+def test_only_training_data_is_stale(decision_db):
+    decision_db.insert("d0")
+    decision_db.insert("d1", isTrainingData=False)
+    decision_db.insert("d2", reward=0.5)
+
+    assert [record.id for record in iter_stale_reward_decisions("FILER", columns=[])] == ["d0"]
+    assert [record.id for record in iter_stale_reward_decisions("FILER", columns=[], is_training_data=False)] == ["d1"]
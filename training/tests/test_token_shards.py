@@ -0,0 +1,23 @@
+"""TokenShards compatibility checks"""
+import json
+
+import pytest
+
+from training.token_shards import INDEX_FILE, SHARD_FORMAT_VERSION, TokenShards
+
+@pytest.fixture
+def shards(tmp_path):
+    index = {"version": SHARD_FORMAT_VERSION, "agentType": "FILER", "maxLength": 512, "shards": []}
+    (tmp_path / INDEX_FILE).write_text(json.dumps(index))
+    return TokenShards(str(tmp_path))
+
+def test_matching_layout_passes(shards):
+    shards.check_layout("FILER", 512)
+
+def test_other_agent_is_rejected(shards):
+    with pytest.raises(ValueError, match="holds FILER examples, not PRIORITIZER"):
+        shards.check_layout("PRIORITIZER", 512)
+
+def test_other_max_length_is_rejected(shards):
+    with pytest.raises(ValueError, match="--max-length 512"):
+        shards.check_layout("FILER", 1024)
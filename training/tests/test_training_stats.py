@@ -0,0 +1,18 @@
+"""get_training_stats_by_agent against Postgres (needs TEST_DATABASE_URL, see conftest.py)"""
+from training.database import clear_training_stats_cache, get_training_stats_by_agent
+
+def test_cached_stats_are_not_shared(decision_db):
+    decision_db.insert("d0", reward=0.5)
+    clear_training_stats_cache()
+
+    stats = get_training_stats_by_agent()
+    assert stats["FILER"]["total_decisions"] == 1
+    stats["FILER"]["total_decisions"] = 99
+    stats.pop("LIBRARIAN")
+
+    cached = get_training_stats_by_agent()
+    assert cached["FILER"]["total_decisions"] == 1
+    assert "LIBRARIAN" in cached
+    cached["FILER"].clear()
+    assert get_training_stats_by_agent()["FILER"]["total_decisions"] == 1
+    clear_training_stats_cache()
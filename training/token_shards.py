@@ -0,0 +1,317 @@
+#!/usr/bin/env python3
+"""
+Pre-tokenized, memory-mapped training data shards
+
+Prompts are tokenized once, at export time, into a directory of .npy
+arrays that trainers and evaluate.py open with mmap_mode="r", so nothing is
+tokenized (or even read) until an example is used:
+
+    <dir>/index.json                  Layout, tokenizer fingerprint, shard list
+    <dir>/shard-00000.input_ids.npy   Token ids of every prompt, concatenated
+    <dir>/shard-00000.lengths.npy     Tokens per prompt (attention length)
+    <dir>/shard-00000.rewards.npy     Reward per prompt (float32)
+    <dir>/shard-00000.meta.jsonl      decisionId and completion per prompt
+    <dir>/reward_stats.json           RewardStats of the rewards
+
+Usage:
+    python token_shards.py --data training/data/filer.jsonl --agent-type FILER \
+        --tokenizer meta-llama/Llama-3.1-8B-Instruct --output training/data/filer.shards
+"""
+import os
+import sys
+import json
+import hashlib
+import argparse
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+import numpy as np
+
+from training.dataset_io import get_manifest_path, read_examples
+from training.reward_calculator import RewardStats, load_reward_stats, save_reward_stats
+
+INDEX_FILE = "index.json"
+REWARD_STATS_FILE = "reward_stats.json"
+SHARD_FORMAT_VERSION = 1
+
+def tokenizer_fingerprint(tokenizer) -> str:
+    """Hash of a tokenizer's vocabulary, independent of where it was loaded from"""
+    vocab = sorted(tokenizer.get_vocab().items())
+    return hashlib.sha256(json.dumps(vocab).encode()).hexdigest()
+
+def _token_dtype(vocab_size: int) -> np.dtype:
+    return np.dtype(np.uint16) if vocab_size <= np.iinfo(np.uint16).max + 1 else np.dtype(np.int32)
+
+class TokenShardWriter:
+    """
+    Tokenize examples into shards as they stream past
+
+    Prompts are tokenized in batches of ``batch_size`` with the same
+    truncation the trainers use. index.json is written last, so readers
+    never see a partially written directory.
+    """
+
+    def __init__(
+        self,
+        output_dir: str,
+        tokenizer,
+        agent_type: str,
+        max_length: int = 512,
+        shard_size: int = 10000,
+        batch_size: int = 256
+    ):
+        self.output_dir = output_dir
+        self.tokenizer = tokenizer
+        self.agent_type = agent_type
+        self.max_length = max_length
+        self.shard_size = shard_size
+        self.batch_size = batch_size
+        self.dtype = _token_dtype(len(tokenizer))
+
+        self.index: Optional[Dict] = None
+        self.shards: List[Dict] = []
+        self.reward_stats = RewardStats()
+        self._pending: List[dict] = []
+        self._ids: List[np.ndarray] = []
+        self._rewards: List[float] = []
+        self._meta: List[str] = []
+
+        os.makedirs(output_dir, exist_ok=True)
+        # Drop a stale index first so a crashed rewrite is not mistaken for complete
+        index_path = os.path.join(output_dir, INDEX_FILE)
+        if os.path.exists(index_path):
+            os.remove(index_path)
+
+    def __enter__(self) -> "TokenShardWriter":
+        return self
+
+    def __exit__(self, exc_type, *exc_info):
+        if exc_type is None:
+            self.close()
+
+    def add(self, example: dict):
+        """Queue one training example (needs prompt and reward)"""
+        self._pending.append(example)
+        if len(self._pending) >= self.batch_size:
+            self._tokenize_pending()
+
+    def _tokenize_pending(self):
+        if not self._pending:
+            return
+
+        encoded = self.tokenizer(
+            [example["prompt"] for example in self._pending],
+            truncation=True,
+            max_length=self.max_length
+        )["input_ids"]
+
+        for example, input_ids in zip(self._pending, encoded):
+            self._ids.append(np.asarray(input_ids, dtype=self.dtype))
+            self._rewards.append(example["reward"])
+            self._meta.append(json.dumps({
+                "decisionId": example.get("metadata", {}).get("decisionId"),
+                "completion": example.get("completion")
+            }))
+            if len(self._ids) >= self.shard_size:
+                self._write_shard()
+        self._pending = []
+
+    def _write_shard(self):
+        if not self._ids:
+            return
+
+        name = f"shard-{len(self.shards):05d}"
+        base = os.path.join(self.output_dir, name)
+        lengths = np.array([len(ids) for ids in self._ids], dtype=np.int32)
+        rewards = np.array(self._rewards, dtype=np.float32)
+
+        np.save(base + ".input_ids.npy", np.concatenate(self._ids))
+        np.save(base + ".lengths.npy", lengths)
+        np.save(base + ".rewards.npy", rewards)
+        with open(base + ".meta.jsonl", 'w') as f:
+            f.write("\n".join(self._meta) + "\n")
+
+        self.reward_stats.update_many(self._rewards)
+        self.shards.append({"name": name, "count": len(self._ids), "tokens": int(lengths.sum())})
+        self._ids, self._rewards, self._meta = [], [], []
+
+    def close(self) -> Dict:
+        """Flush the last shard and write index.json (once)"""
+        if self.index is not None:
+            return self.index
+
+        self._tokenize_pending()
+        self._write_shard()
+
+        save_reward_stats(os.path.join(self.output_dir, REWARD_STATS_FILE), {self.agent_type: self.reward_stats})
+
+        index = {
+            "version": SHARD_FORMAT_VERSION,
+            "agentType": self.agent_type,
+            "tokenizer": getattr(self.tokenizer, "name_or_path", None),
+            "tokenizerFingerprint": tokenizer_fingerprint(self.tokenizer),
+            "vocabSize": len(self.tokenizer),
+            "maxLength": self.max_length,
+            "dtype": self.dtype.name,
+            "count": sum(shard["count"] for shard in self.shards),
+            "tokens": sum(shard["tokens"] for shard in self.shards),
+            "shards": self.shards,
+            "createdAt": datetime.now().isoformat()
+        }
+        tmp_path = os.path.join(self.output_dir, INDEX_FILE + ".tmp")
+        with open(tmp_path, 'w') as f:
+            json.dump(index, f, indent=2)
+        os.replace(tmp_path, os.path.join(self.output_dir, INDEX_FILE))
+        self.index = index
+        return index
+
+class TokenShards:
+    """
+    Read-only view over a token shard directory
+
+    Arrays are memory-mapped, and ``shards[i]["input_ids"]`` is a view into
+    the mapped file. Indexing returns a dict with input_ids, length, reward,
+    decisionId and completion; slicing returns a list of such dicts, so
+    the trainers' ``training_data[i:i + batch_size]`` loop works unchanged.
+    """
+
+    def __init__(self, shard_dir: str, tokenizer=None):
+        index_path = os.path.join(shard_dir, INDEX_FILE)
+        if not os.path.exists(index_path):
+            raise FileNotFoundError(f"Token shard index not found: {index_path}")
+        with open(index_path, 'r') as f:
+            self.index = json.load(f)
+
+        if self.index.get("version") != SHARD_FORMAT_VERSION:
+            raise ValueError(f"Unsupported token shard version: {self.index.get('version')}")
+
+        self.shard_dir = shard_dir
+        if tokenizer is not None:
+            self.check_tokenizer(tokenizer)
+        self.agent_type = self.index["agentType"]
+        self.max_length = self.index["maxLength"]
+        self._input_ids = []
+        self._lengths = []
+        self._offsets = []
+        self._rewards = []
+        self._meta: List[Optional[List[str]]] = []
+        for shard in self.index["shards"]:
+            base = os.path.join(shard_dir, shard["name"])
+            lengths = np.load(base + ".lengths.npy", mmap_mode="r")
+            self._input_ids.append(np.load(base + ".input_ids.npy", mmap_mode="r"))
+            self._lengths.append(lengths)
+            self._offsets.append(np.concatenate(([0], np.cumsum(lengths, dtype=np.int64))))
+            self._rewards.append(np.load(base + ".rewards.npy", mmap_mode="r"))
+            self._meta.append(None)
+
+        self._starts = np.cumsum([0] + [shard["count"] for shard in self.index["shards"]])
+
+    def check_tokenizer(self, tokenizer):
+        """Raise ValueError unless the shards were written with this tokenizer's vocabulary"""
+        if tokenizer_fingerprint(tokenizer) != self.index["tokenizerFingerprint"]:
+            raise ValueError(
+                f"{self.shard_dir} was tokenized with {self.index['tokenizer']}, "
+                f"which does not match {getattr(tokenizer, 'name_or_path', 'the given tokenizer')}"
+            )
+
+    def check_layout(self, agent_type: str, max_length: int):
+        """Raise ValueError unless the shards hold this agent's prompts, truncated at max_length"""
+        if self.agent_type != agent_type:
+            raise ValueError(f"{self.shard_dir} holds {self.agent_type} examples, not {agent_type}")
+        if self.max_length != max_length:
+            raise ValueError(
+                f"{self.shard_dir} was tokenized with --max-length {self.max_length}, "
+                f"but prompts are truncated at {max_length} tokens here"
+            )
+
+    @property
+    def reward_stats_path(self) -> str:
+        return os.path.join(self.shard_dir, REWARD_STATS_FILE)
+
+    def reward_stats(self) -> Optional[RewardStats]:
+        """RewardStats saved with the shards (None if missing)"""
+        return load_reward_stats(self.reward_stats_path).get(self.agent_type)
+
+    def __len__(self) -> int:
+        return int(self._starts[-1])
+
+    def _locate(self, index: int):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        shard = int(np.searchsorted(self._starts, index, side="right")) - 1
+        return shard, index - int(self._starts[shard])
+
+    def _meta_for(self, shard: int, local: int) -> Dict:
+        if self._meta[shard] is None:
+            path = os.path.join(self.shard_dir, self.index["shards"][shard]["name"] + ".meta.jsonl")
+            with open(path, 'r') as f:
+                self._meta[shard] = f.read().splitlines()
+        return json.loads(self._meta[shard][local])
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+
+        shard, local = self._locate(index)
+        start, end = self._offsets[shard][local], self._offsets[shard][local + 1]
+        return {
+            "input_ids": self._input_ids[shard][start:end],
+            "length": int(self._lengths[shard][local]),
+            "reward": float(self._rewards[shard][local]),
+            **self._meta_for(shard, local)
+        }
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+def write_token_shards(
+    examples: Iterable[dict],
+    output_dir: str,
+    tokenizer,
+    agent_type: str,
+    max_length: int = 512,
+    shard_size: int = 10000
+) -> Dict:
+    """Tokenize training examples into a shard directory and return its index"""
+    writer = TokenShardWriter(output_dir, tokenizer, agent_type, max_length=max_length, shard_size=shard_size)
+    for example in examples:
+        writer.add(example)
+    return writer.close()
+
+def load_tokenizer(name: str):
+    """Load a tokenizer the way the trainers do"""
+    from transformers import AutoTokenizer
+
+    return AutoTokenizer.from_pretrained(name)
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-tokenize a training JSONL file into memory-mapped shards")
+    parser.add_argument("--data", required=True, help="Training data JSONL file (or sharded export)")
+    parser.add_argument("--agent-type", required=True, choices=["FILER", "LIBRARIAN", "PRIORITIZER", "STORER", "RETRIEVER"], help="Agent type")
+    parser.add_argument("--tokenizer", required=True, help="Tokenizer name or path (the base model)")
+    parser.add_argument("--output", help="Shard directory (default: <data>.shards)")
+    parser.add_argument("--max-length", type=int, default=512, help="Truncate prompts to this many tokens")
+    parser.add_argument("--shard-size", type=int, default=10000, help="Examples per shard")
+
+    args = parser.parse_args()
+    output_dir = args.output or args.data + ".shards"
+
+    if not os.path.exists(args.data) and not os.path.exists(get_manifest_path(args.data)):
+        print(f"❌ Training data file not found: {args.data}")
+        sys.exit(1)
+
+    print(f"🔢 Tokenizing {args.data} with {args.tokenizer}...")
+    index = write_token_shards(
+        read_examples(args.data),
+        output_dir,
+        load_tokenizer(args.tokenizer),
+        args.agent_type,
+        max_length=args.max_length,
+        shard_size=args.shard_size
+    )
+    print(f"✅ Wrote {index['count']} examples ({index['tokens']} tokens) in {len(index['shards'])} shards to {output_dir}")
+
+if __name__ == "__main__":
+    main()
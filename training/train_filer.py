@@ -8,26 +8,30 @@ Usage:
 import os
 import sys
 import argparse
-import json
+from typing import Optional
+import numpy as np
 import torch
 from transformers import AutoModelForCausalLM, AutoTokenizer, BitsAndBytesConfig
 from trl import PPOTrainer, PPOConfig, AutoModelForCausalLMWithValueHead
 from peft import LoraConfig, get_peft_model
 from dotenv import load_dotenv
 
+from training.reward_calculator import RewardStats, get_reward_stats_path, load_reward_stats
+from training.dataset_io import get_manifest_path, read_examples
+from training.token_shards import TokenShards
+
 load_dotenv()
 
+# Prompts are truncated to this many tokens (token shards must match)
+MAX_PROMPT_LENGTH = 512
+
 def load_training_data(filepath: str):
-    """Load training data from JSONL file"""
-    if not os.path.exists(filepath):
+    """Load training data from a JSONL file or sharded export"""
+    if not os.path.exists(filepath) and not os.path.exists(get_manifest_path(filepath)):
         raise FileNotFoundError(f"Training data file not found: {filepath}")
     
-    training_examples = []
-    with open(filepath, 'r') as f:
-        for line in f:
-            line = line.strip()
-            if line:
-                training_examples.append(json.loads(line))
+    # Plain JSONL, .gz/.zst, or the shards listed in <filepath>.manifest.json
+    training_examples = list(read_examples(filepath))
     
     print(f"✅ Loaded {len(training_examples)} training examples from {filepath}")
     return training_examples
@@ -95,9 +99,10 @@ def train_ppo(
     output_dir: str,
     epochs: int = 3,
     batch_size: int = 4,
-    learning_rate: float = 1.41e-5
+    learning_rate: float = 1.41e-5,
+    reward_stats: Optional[RewardStats] = None
 ):
-    """Train model using PPO"""
+    """Train model using PPO (rewards are whitened with reward_stats if given)"""
     print(f"\n🚀 Starting PPO training...")
     print(f"   Training examples: {len(training_data)}")
     print(f"   Epochs: {epochs}")
@@ -133,18 +138,22 @@ def train_ppo(
         for i in range(0, len(training_data), batch_size):
             batch = training_data[i:i + batch_size]
             
-            # Extract prompts and rewards
-            queries = [ex["prompt"] for ex in batch]
+            # Extract rewards
             rewards = [ex["reward"] for ex in batch]
+            if reward_stats is not None:
+                rewards = [reward_stats.whiten(reward) for reward in rewards]
             
-            # Tokenize queries
+            # Tokenize queries (examples from token shards already carry input_ids)
             query_tensors = []
-            for query in queries:
+            for ex in batch:
+                if "input_ids" in ex:
+                    query_tensors.append(torch.from_numpy(ex["input_ids"].astype(np.int64)))
+                    continue
                 tokens = tokenizer(
-                    query,
+                    ex["prompt"],
                     return_tensors="pt",
                     truncation=True,
-                    max_length=512
+                    max_length=MAX_PROMPT_LENGTH
                 )
                 query_tensors.append(tokens.input_ids.squeeze())
             
@@ -198,13 +207,16 @@ def train_ppo(
 
 def main():
     parser = argparse.ArgumentParser(description="Train AI Filer agent with PPO on M1")
-    parser.add_argument("--data", required=True, help="Path to training data JSONL file")
+    data_source = parser.add_mutually_exclusive_group(required=True)
+    data_source.add_argument("--data", help="Path to training data JSONL file")
+    data_source.add_argument("--token-shards", help="Pre-tokenized shard directory from export_training_data.py --tokenizer")
     parser.add_argument("--output", default="./models/ocd-filer-v1", help="Output directory for model")
     parser.add_argument("--model", default="meta-llama/Llama-3.1-8B-Instruct", help="Base model name")
     parser.add_argument("--epochs", type=int, default=3, help="Number of training epochs")
     parser.add_argument("--batch-size", type=int, default=4, help="Batch size")
     parser.add_argument("--learning-rate", type=float, default=1.41e-5, help="Learning rate")
     parser.add_argument("--no-quantization", action="store_true", help="Disable 4-bit quantization")
+    parser.add_argument("--whiten-rewards", action="store_true", help="Whiten rewards with the stats saved beside --data by export_training_data.py")
     
     args = parser.parse_args()
     
@@ -216,23 +228,42 @@ def main():
     
     # Load training data
     print(f"\n📥 Loading training data...")
-    training_data = load_training_data(args.data)
+    if args.token_shards:
+        training_data = TokenShards(args.token_shards)
+        training_data.check_layout("FILER", MAX_PROMPT_LENGTH)
+        print(f"✅ Opened {len(training_data)} pre-tokenized examples from {args.token_shards}")
+    else:
+        training_data = load_training_data(args.data)
     
     if len(training_data) == 0:
         print("❌ No training data found!")
         sys.exit(1)
     
     # Check data format
-    if "prompt" not in training_data[0] or "reward" not in training_data[0]:
+    if args.data and ("prompt" not in training_data[0] or "reward" not in training_data[0]):
         print("❌ Invalid training data format. Expected 'prompt' and 'reward' fields.")
         sys.exit(1)
     
+    reward_stats = None
+    if args.whiten_rewards:
+        if args.token_shards:
+            reward_stats = training_data.reward_stats()
+        else:
+            reward_stats = load_reward_stats(get_reward_stats_path(args.data)).get("FILER")
+        if reward_stats is None:
+            print("⚠️  No reward stats beside the training data, computing them from the loaded examples")
+            reward_stats = RewardStats()
+            reward_stats.update_many(ex["reward"] for ex in training_data)
+        print(f"   Whitening rewards (mean {reward_stats.mean:.3f}, std {reward_stats.std:.3f})")
+    
     # Setup model
     print(f"\n🤖 Setting up model...")
     model, tokenizer = setup_model_and_tokenizer(
         args.model,
         use_quantization=not args.no_quantization
     )
+    if args.token_shards:
+        training_data.check_tokenizer(tokenizer)
     
     # Train
     train_ppo(
@@ -242,7 +273,8 @@ def main():
         args.output,
         epochs=args.epochs,
         batch_size=args.batch_size,
-        learning_rate=args.learning_rate
+        learning_rate=args.learning_rate,
+        reward_stats=reward_stats
     )
 
 if __name__ == "__main__":